@@ -0,0 +1,246 @@
+"""
+Imports a Dexcom Stelo export workbook into glucose_app.db.
+
+Sheet layout (same as debug/debug.py reads it), data from row 3:
+    A date (only on the first row of each day)   B time
+    C carb intake (g)                             E glucose (mg/dL)
+    F fasting / pre-meal glucose                  I food / trend notes
+
+The workbook is opened read_only and walked once with
+iter_rows(values_only=True), so memory stays flat (bar one id per row) however many months of
+CGM history it holds. Rows are flushed to food_log / glucose_readings in
+batched transactions. Ids are derived from the reading time, and rows are
+written with INSERT OR IGNORE, so importing the same file twice leaves
+the tables unchanged.
+
+Times only go forward inside a dated block. A backward jump is either a
+midnight wrap (late-night readings before the next dated row), an
+AM/PM slip (12:08 PM typed as 00:08) when adding 12h restores the order,
+or else an anomaly: that row is logged and skipped. Two rows that still
+land on the same second collide on their id; the first is kept and the
+rest are counted, never silently overwritten.
+"""
+from __future__ import annotations
+from datetime import datetime as dt, time as time_type, timedelta, timezone, tzinfo
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import openpyxl
+
+from ai.data.ingest import (
+    DEFAULT_BATCH_SIZE,
+    FOOD_LOG_INSERT_NEW,
+    GLUCOSE_READING_INSERT_NEW,
+    _bulk_insert,
+    _food_log_row,
+    _glucose_reading_row,
+    open_ingest_connection,
+)
+
+FIRST_DATA_ROW = 3
+COL_DATE, COL_TIME, COL_CARBS, COL_GLUCOSE, COL_FASTING, COL_NOTES = 0, 1, 2, 4, 5, 8
+LAST_COL = COL_NOTES + 1
+
+DEXCOM_RECIPE_NAME = "Dexcom import"
+
+# the sheet only writes a date on the first row of a day, and late-night
+# readings often run past midnight before the next dated row - a reading
+# that jumps back by more than this is treated as the next calendar day
+MIDNIGHT_WRAP_HOURS = 12
+# a reading is an AM/PM slip if moving it 12h lands it within this after the previous one
+AMPM_MAX_GAP_HOURS  = 2
+# meal rows are typed in at the meal's start time, after the readings that
+# followed it; they may sit this far from the reading stream (after any AM/PM fix)
+MEAL_MAX_OFFSET_HOURS = 3
+
+
+def _meal_type(hour: int) -> str:
+    if hour < 11:
+        return "breakfast"
+    if hour < 16:
+        return "lunch"
+    if hour < 22:
+        return "dinner"
+    return "snack"
+
+
+def _is_number(v) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _hours(t: time_type) -> float:
+    return t.hour + t.minute / 60.0
+
+
+def _resolve_reading(anchor: Optional[float], t: float) -> Tuple[Optional[float], Optional[str]]:
+    # readings only move forward: a midnight wrap or an AM/PM slip (either way), anything else is an anomaly
+    if anchor is None:
+        return t, None
+    base = (anchor // 24) * 24 + t
+    if t >= 12 and 0 <= base - 12 - anchor <= AMPM_MAX_GAP_HOURS:
+        return base - 12, None
+    if base >= anchor:
+        return base, None
+    if anchor - base > MIDNIGHT_WRAP_HOURS:
+        return base + 24, None
+    if t < 12 and 0 <= base + 12 - anchor <= AMPM_MAX_GAP_HOURS:
+        return base + 12, None
+    return None, "reading goes back in time"
+
+
+def _resolve_meal(anchor: Optional[float], t: float) -> Tuple[Optional[float], Optional[str]]:
+    # meal rows may be out of order; take the reading of the time (as typed, +-12h, next day) nearest the stream
+    if anchor is None:
+        return t, None
+    base = (anchor // 24) * 24 + t
+    offset = min((c for c in (base, base - 12, base + 12, base + 24) if c >= 0), key=lambda c: abs(c - anchor))
+    if abs(offset - anchor) > MEAL_MAX_OFFSET_HOURS:
+        return None, "meal time is nowhere near the surrounding readings"
+    return offset, None
+
+
+def _parse_row(
+    row:          Tuple,
+    current_date: Optional[dt],
+    anchor:       Optional[float],
+    tz:           tzinfo,
+) -> Tuple[Optional[dt], Optional[float], Optional[Dict], Optional[Dict], Optional[str]]:
+    """
+    Returns (current_date, anchor, meal, reading, anomaly). `anchor` is the
+    last reading's time in hours since current_date's midnight (past 24
+    once the block has wrapped); meal rows never move it. An anomalous row
+    yields no meal or reading.
+    """
+    row = tuple(row) + (None,) * (LAST_COL - len(row))
+    date_cell, time_cell = row[COL_DATE], row[COL_TIME]
+
+    if isinstance(date_cell, dt):
+        current_date, anchor = date_cell, None
+    if current_date is None or not isinstance(time_cell, time_type):
+        return current_date, anchor, None, None, None
+    carbs, glucose, fasting = row[COL_CARBS], row[COL_GLUCOSE], row[COL_FASTING]
+    is_meal = _is_number(carbs) and carbs > 0
+    if not is_meal and not (_is_number(glucose) or _is_number(fasting)):
+        return current_date, anchor, None, None, None
+
+    t = _hours(time_cell)
+    offset, anomaly = (_resolve_meal if is_meal else _resolve_reading)(anchor, t)
+    if anomaly:
+        return current_date, anchor, None, None, f"{anomaly} ({time_cell:%H:%M} in the {current_date:%Y-%m-%d} block)"
+    if not is_meal:
+        anchor = offset
+    days, hour = divmod(time_cell.hour + int(round(offset - t)), 24)
+    time_cell  = time_cell.replace(hour=hour)
+
+    ts   = dt.combine((current_date + timedelta(days=days)).date(), time_cell).replace(tzinfo=tz).astimezone(timezone.utc)
+    unix = int(ts.timestamp())
+    iso  = ts.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    meal = None
+    if is_meal:
+        notes = row[COL_NOTES]
+        meal = {
+            "id":          f"dexcom-meal-{unix}",
+            "recipe_name": str(notes).strip() if isinstance(notes, str) and notes.strip() else DEXCOM_RECIPE_NAME,
+            "timestamp":   iso,
+            "meal_type":   _meal_type(time_cell.hour),
+            "carbs":       float(carbs),
+        }
+
+    reading = None
+    if _is_number(glucose) or _is_number(fasting):
+        reading = {
+            "id":            f"dexcom-bg-{unix}",
+            "timestamp":     iso,
+            "unix":          unix,
+            "glucose_mg_dl": float(glucose if _is_number(glucose) else fasting),
+            "context":       "pre_meal" if _is_number(fasting) else "other",
+            "meal_id":       meal["id"] if meal else None,
+        }
+    return current_date, anchor, meal, reading, None
+
+
+def import_dexcom_workbook(
+    excel_path: str,
+    db_path:    str,
+    sheet_name: Optional[str] = None,
+    tz:         tzinfo        = timezone.utc,
+    batch_size: int           = DEFAULT_BATCH_SIZE,
+) -> Dict[str, int]:
+    """
+    Streams the export into `db_path` (created with the app schema if
+    missing). `tz` is the zone the sheet's wall-clock times were logged in.
+    Returns counts: "rows" read, "food_log" / "glucose_readings" rows
+    actually inserted, "existing" rows already in the database (re-import),
+    "collisions" rows dropped for sharing a time with an earlier row of
+    this file, and "skipped" anomalous rows.
+    """
+    if not Path(excel_path).exists():
+        raise FileNotFoundError(f"[dexcom_import] workbook not found at '{excel_path}'")
+
+    print(f"\n[dexcom_import] {excel_path} -> {db_path}")
+    wb   = openpyxl.load_workbook(excel_path, read_only=True, data_only=True)
+    conn = open_ingest_connection(db_path)
+    counts = {"rows": 0, "food_log": 0, "glucose_readings": 0, "existing": 0, "collisions": 0, "skipped": 0}
+    meals:    List[Tuple] = []
+    readings: List[Tuple] = []
+    seen_meals:    Set[str] = set()
+    seen_readings: Set[str] = set()
+
+    def flush() -> None:
+        if meals:
+            inserted = _bulk_insert(conn, FOOD_LOG_INSERT_NEW, meals, batch_size)
+            counts["food_log"] += inserted
+            counts["existing"] += len(meals) - inserted
+            meals.clear()
+        if readings:
+            inserted = _bulk_insert(conn, GLUCOSE_READING_INSERT_NEW, readings, batch_size)
+            counts["glucose_readings"] += inserted
+            counts["existing"] += len(readings) - inserted
+            readings.clear()
+
+    def keep_first(record: Dict, seen: Set[str], line: int) -> bool:
+        if record["id"] in seen:
+            counts["collisions"] += 1
+            print(f"    [dexcom_import] row {line}: {record['id']} already read from this file - kept the first")
+            return False
+        seen.add(record["id"])
+        return True
+
+    try:
+        ws = wb[sheet_name] if sheet_name else wb.active
+        current_date: Optional[dt]        = None
+        anchor:       Optional[float]     = None
+        for line, row in enumerate(ws.iter_rows(min_row=FIRST_DATA_ROW, max_col=LAST_COL, values_only=True),
+                                   start=FIRST_DATA_ROW):
+            counts["rows"] += 1
+            current_date, anchor, meal, reading, anomaly = _parse_row(row, current_date, anchor, tz)
+            if anomaly:
+                counts["skipped"] += 1
+                print(f"    [dexcom_import] row {line}: skipped - {anomaly}")
+                continue
+            if meal and keep_first(meal, seen_meals, line):
+                meals.append(_food_log_row(meal))
+            if reading and keep_first(reading, seen_readings, line):
+                readings.append(_glucose_reading_row(reading))
+            if len(meals) >= batch_size or len(readings) >= batch_size:
+                flush()
+        flush()
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+    finally:
+        conn.close()
+        wb.close()
+
+    print(f"    [dexcom_import] {counts['rows']} rows read - "
+          f"{counts['food_log']} meals, {counts['glucose_readings']} glucose readings inserted, "
+          f"{counts['existing']} already present, {counts['collisions']} collisions, "
+          f"{counts['skipped']} anomalous rows skipped")
+    return counts
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 2:
+        print("Usage: python -m ai.data.dexcom_import <export.xlsx> [glucose_app.db]")
+        sys.exit(1)
+    import_dexcom_workbook(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else "./glucose_app.db")
@@ -0,0 +1,179 @@
+"""
+Nightly preprocessing for many users at once.
+
+Each job runs the normal load_training_data pipeline (sensor windows,
+meals, fingersticks, medications) in its own worker process, so one bad
+database or Supabase hiccup only fails that user. Every user's split is
+written as one JSON file (the same column-per-field dicts the trainer
+reads), via a temp file + os.replace so readers never see a half-written
+dataset.
+"""
+from __future__ import annotations
+import json
+import os
+import re
+import tempfile
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from ai.data.preprocessing import DEFAULT_DB_PATH, load_training_data
+
+DATASET_SUFFIX = ".json"
+SUMMARY_FILE   = "fleet_summary.json"
+HEADER_BYTES   = 4096
+
+# user_id is the first key _preprocess_user writes
+_USER_ID_HEADER = re.compile(r'\s*\{\s*"user_id"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+
+def write_json_atomic(path: Path, payload: Any) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(payload, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)   # mkstemp creates 0600
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def dataset_path(out_dir: Union[str, Path], user_id: str) -> Path:
+    return Path(out_dir) / f"{user_id}{DATASET_SUFFIX}"
+
+
+def load_dataset(path: Union[str, Path]) -> Dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def peek_user_id(path: Union[str, Path]) -> Optional[str]:
+    # the dataset's user_id without parsing the whole file; None if the header is not ours
+    with open(path) as f:
+        match = _USER_ID_HEADER.match(f.read(HEADER_BYTES))
+    return json.loads(match.group(1)) if match else None
+
+
+def _normalise_job(job: Union[str, Dict]) -> Dict:
+    if isinstance(job, str):
+        job = {"user_id": job}
+    job = dict(job)
+    if not job.get("user_id"):
+        raise ValueError(f"[fleet] job has no user_id: {job}")
+    job.setdefault("db_path", DEFAULT_DB_PATH)
+    return job
+
+
+def _preprocess_user(job: Dict, out_dir: str) -> Dict:
+    # runs in the worker process - never raises, failures come back as a status row
+    t0 = time.perf_counter()
+    user_id = job["user_id"]
+    try:
+        kwargs = {k: v for k, v in job.items() if k != "user_id"}
+        train, val, test, meds = load_training_data(user_id=user_id, **kwargs)
+        path = dataset_path(out_dir, user_id)
+        write_json_atomic(path, {
+            "user_id":     user_id,
+            "db_path":     job["db_path"],
+            "created_at":  time.time(),
+            "train":       train,
+            "val":         val,
+            "test":        test,
+            "medications": meds,
+        })
+        return {
+            "user_id":   user_id,
+            "status":    "ok",
+            "path":      str(path),
+            "n_train":   len(train["meal_features"]),
+            "n_val":     len(val["meal_features"]),
+            "n_test":    len(test["meal_features"]),
+            "seconds":   round(time.perf_counter() - t0, 3),
+        }
+    except Exception as e:
+        return {
+            "user_id": user_id,
+            "status":  "error",
+            "error":   f"{type(e).__name__}: {e}",
+            "trace":   traceback.format_exc(),
+            "seconds": round(time.perf_counter() - t0, 3),
+        }
+
+
+def preprocess_fleet(
+    jobs:        List[Union[str, Dict]],
+    out_dir:     str,
+    max_workers: Optional[int] = None,
+    max_pending: Optional[int] = None,
+) -> List[Dict]:
+    """
+    jobs: user ids, or dicts of load_training_data kwargs with a "user_id"
+          (e.g. {"user_id": "u1", "db_path": "/data/u1/glucose_app.db"}).
+    At most `max_workers` users run at once (default: every core) and at
+    most `max_pending` are queued on the pool, so huge fleets do not
+    pickle every job up front.
+    """
+    jobs        = [_normalise_job(j) for j in jobs]
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * max_workers
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+
+    print(f"\n[fleet] Preprocessing {len(jobs)} users with {max_workers} workers -> {out_dir}")
+    t0 = time.perf_counter()
+    results: List[Dict] = []
+    queue = list(reversed(jobs))
+    pending: Dict[Future, Dict] = {}
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        while queue or pending:
+            while queue and len(pending) < max_pending:
+                job = queue.pop()
+                pending[pool.submit(_preprocess_user, job, out_dir)] = job
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                job = pending.pop(fut)
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    # worker died outright (OOM kill, segfault) - record and move on
+                    result = {"user_id": job["user_id"], "status": "error",
+                              "error": f"{type(e).__name__}: {e}"}
+                results.append(result)
+                if result["status"] == "ok":
+                    print(f"  [fleet] {result['user_id']}: ok "
+                          f"({result['n_train']}/{result['n_val']}/{result['n_test']}, {result['seconds']}s)")
+                else:
+                    print(f"  [fleet] {result['user_id']}: FAILED - {result['error']}")
+
+    n_ok = sum(1 for r in results if r["status"] == "ok")
+    summary = {
+        "n_users":  len(jobs),
+        "n_ok":     n_ok,
+        "n_failed": len(jobs) - n_ok,
+        "seconds":  round(time.perf_counter() - t0, 3),
+        "results":  [{k: v for k, v in r.items() if k != "trace"} for r in results],
+    }
+    write_json_atomic(Path(out_dir) / SUMMARY_FILE, summary)
+    print(f"[fleet] Done - {n_ok}/{len(jobs)} users ok in {summary['seconds']}s")
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 3:
+        print("Usage: python -m ai.data.fleet <jobs.json> <out_dir> [max_workers]")
+        sys.exit(1)
+    with open(sys.argv[1]) as f:
+        fleet_jobs = json.load(f)
+    preprocess_fleet(
+        jobs        = fleet_jobs,
+        out_dir     = sys.argv[2],
+        max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else None,
+    )
@@ -0,0 +1,244 @@
+"""
+Bulk loading into glucose_app.db from Python (device backfills, test
+fixtures at realistic volume).
+
+Writes go through executemany inside explicit BEGIN/COMMIT blocks on a
+WAL-mode connection with relaxed fsync, so a laptop can push hundreds of
+thousands of sensor packets per second. The schema mirrors lib/migration.ts
+so a fresh file created here is readable by preprocessing and the app.
+"""
+from __future__ import annotations
+import sqlite3
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from ai.data.sensor_packet import SensorPacket, process_packet_stream
+from ai.data.packet_buffer import PacketBuffer, SQLITE_COLUMNS, packets_to_buffer
+
+DEFAULT_BATCH_SIZE = 50_000
+
+INGEST_PRAGMAS: Tuple[str, ...] = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",     # WAL + NORMAL: durable on checkpoint, no fsync per commit
+    "PRAGMA cache_size = -65536",      # 64 MiB page cache
+    "PRAGMA mmap_size = 268435456",    # 256 MiB
+    "PRAGMA temp_store = MEMORY",
+)
+
+# keep in step with lib/migration.ts
+SCHEMA: Tuple[str, ...] = (
+    """CREATE TABLE IF NOT EXISTS food_log (
+         id          TEXT    PRIMARY KEY,
+         recipe_id   TEXT,
+         recipe_name TEXT    NOT NULL,
+         timestamp   TEXT    NOT NULL,
+         meal_type   TEXT    NOT NULL,
+         protein     REAL    NOT NULL DEFAULT 0,
+         carbs       REAL    NOT NULL DEFAULT 0,
+         fat         REAL    NOT NULL DEFAULT 0,
+         fiber       REAL    NOT NULL DEFAULT 0,
+         calories    REAL             DEFAULT 0,
+         is_liquid   INTEGER NOT NULL DEFAULT 0,
+         image_url   TEXT
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_food_log_timestamp ON food_log (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_food_log_timestamp_carbs "
+    "ON food_log (timestamp, carbs, fat, protein, fiber, is_liquid, id)",
+    """CREATE TABLE IF NOT EXISTS sensor_packets (
+         seq          INTEGER PRIMARY KEY,
+         unix         INTEGER NOT NULL,
+         timestamp    TEXT    NOT NULL,
+         steps        INTEGER DEFAULT 0,
+         vm           REAL    DEFAULT 0,
+         peak_vm      REAL    DEFAULT 0,
+         hr           REAL    DEFAULT 0,
+         hrv          REAL    DEFAULT 0,
+         hrv_drop     REAL    DEFAULT 0,
+         hr_drop      REAL    DEFAULT 0,
+         hr_stability REAL    DEFAULT 0,
+         sleep_score  REAL    DEFAULT 0,
+         interpolated INTEGER DEFAULT 0
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_sensor_packets_unix ON sensor_packets (unix)",
+    """CREATE TABLE IF NOT EXISTS glucose_readings (
+         id            TEXT    PRIMARY KEY,
+         timestamp     TEXT    NOT NULL,
+         unix          INTEGER NOT NULL,
+         glucose_mg_dl REAL    NOT NULL,
+         context       TEXT    NOT NULL DEFAULT 'other',
+         meal_id       TEXT
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_glucose_readings_unix ON glucose_readings (unix)",
+    "CREATE INDEX IF NOT EXISTS idx_glucose_readings_timestamp ON glucose_readings (timestamp)",
+)
+
+SENSOR_PACKET_INSERT = (
+    f"INSERT OR IGNORE INTO sensor_packets ({', '.join(SQLITE_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in SQLITE_COLUMNS)})"
+)
+
+FOOD_LOG_COLUMNS: Tuple[str, ...] = (
+    "id", "recipe_id", "recipe_name", "timestamp", "meal_type",
+    "protein", "carbs", "fat", "fiber", "calories", "is_liquid", "image_url",
+)
+FOOD_LOG_INSERT = (
+    f"INSERT OR REPLACE INTO food_log ({', '.join(FOOD_LOG_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in FOOD_LOG_COLUMNS)})"
+)
+
+# keep-first variants for imports that must count collisions rather than overwrite
+FOOD_LOG_INSERT_NEW = FOOD_LOG_INSERT.replace("INSERT OR REPLACE", "INSERT OR IGNORE", 1)
+
+GLUCOSE_READING_COLUMNS: Tuple[str, ...] = (
+    "id", "timestamp", "unix", "glucose_mg_dl", "context", "meal_id",
+)
+GLUCOSE_READING_INSERT = (
+    f"INSERT OR REPLACE INTO glucose_readings ({', '.join(GLUCOSE_READING_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in GLUCOSE_READING_COLUMNS)})"
+)
+GLUCOSE_READING_INSERT_NEW = GLUCOSE_READING_INSERT.replace("INSERT OR REPLACE", "INSERT OR IGNORE", 1)
+
+
+def open_ingest_connection(db_path: str, create_schema: bool = True) -> sqlite3.Connection:
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    # isolation_level=None: we issue BEGIN/COMMIT ourselves around each batch
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    for pragma in INGEST_PRAGMAS:
+        conn.execute(pragma)
+    if create_schema:
+        ensure_schema(conn)
+    return conn
+
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    conn.execute("BEGIN")
+    try:
+        for ddl in SCHEMA:
+            conn.execute(ddl)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _bulk_insert(
+    conn:       sqlite3.Connection,
+    sql:        str,
+    rows:       Iterable[Sequence],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    # one transaction per batch - bounded WAL growth, and a failure only loses the open batch
+    rows = iter(rows)
+    before = conn.total_changes
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(sql, batch)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return conn.total_changes - before
+
+
+def ingest_sensor_packets(
+    conn:       sqlite3.Connection,
+    packets:    Union[PacketBuffer, List[SensorPacket]],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    """
+    Inserts process_packet_stream output (list or PacketBuffer). Existing seq
+    numbers are left alone (INSERT OR IGNORE, same as lib/db.ts), so
+    re-running a backfill is safe. Returns the number of new rows.
+    """
+    if not isinstance(packets, PacketBuffer):
+        packets = packets_to_buffer(packets)
+    if not len(packets):
+        return 0
+    inserted = _bulk_insert(conn, SENSOR_PACKET_INSERT, packets.to_rows(), batch_size)
+    print(f"    [ingest] sensor_packets: {inserted} new of {len(packets)} packets")
+    return inserted
+
+
+def ingest_raw_packets(
+    conn:        sqlite3.Connection,
+    raw_packets: List[Dict],
+    batch_size:  int = DEFAULT_BATCH_SIZE,
+) -> int:
+    # raw PCB json -> gap-filled stream -> table
+    return ingest_sensor_packets(conn, process_packet_stream(raw_packets), batch_size)
+
+
+def _food_log_row(entry: Dict) -> Tuple:
+    return (
+        str(entry["id"]),
+        entry.get("recipe_id"),
+        entry.get("recipe_name") or "",
+        str(entry["timestamp"]),
+        entry.get("meal_type") or "snack",
+        float(entry.get("protein") or 0),
+        float(entry.get("carbs")   or 0),
+        float(entry.get("fat")     or 0),
+        float(entry.get("fiber")   or 0),
+        float(entry.get("calories") or 0),
+        1 if entry.get("is_liquid") else 0,
+        entry.get("image_url"),
+    )
+
+
+def ingest_food_log(
+    conn:       sqlite3.Connection,
+    entries:    Iterable[Dict],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    # same upsert semantics as insertFoodLog in lib/db.ts
+    written = _bulk_insert(conn, FOOD_LOG_INSERT, (_food_log_row(e) for e in entries), batch_size)
+    print(f"    [ingest] food_log: {written} rows written")
+    return written
+
+
+def _glucose_reading_row(reading: Dict) -> Tuple:
+    return (
+        str(reading["id"]),
+        str(reading["timestamp"]),
+        int(reading["unix"]),
+        float(reading["glucose_mg_dl"]),
+        reading.get("context") or "other",
+        reading.get("meal_id"),
+    )
+
+
+def ingest_glucose_readings(
+    conn:       sqlite3.Connection,
+    readings:   Iterable[Dict],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    written = _bulk_insert(
+        conn, GLUCOSE_READING_INSERT, (_glucose_reading_row(r) for r in readings), batch_size
+    )
+    print(f"    [ingest] glucose_readings: {written} rows written")
+    return written
+
+
+def ingest_database(
+    db_path:          str,
+    raw_packets:      Optional[List[Dict]] = None,
+    food_log:         Optional[List[Dict]] = None,
+    glucose_readings: Optional[List[Dict]] = None,
+    batch_size:       int                  = DEFAULT_BATCH_SIZE,
+) -> Dict[str, int]:
+    conn = open_ingest_connection(db_path)
+    try:
+        counts = {
+            "sensor_packets":   ingest_raw_packets(conn, raw_packets, batch_size) if raw_packets else 0,
+            "food_log":         ingest_food_log(conn, food_log, batch_size) if food_log else 0,
+            "glucose_readings": ingest_glucose_readings(conn, glucose_readings, batch_size) if glucose_readings else 0,
+        }
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        return counts
+    finally:
+        conn.close()
@@ -0,0 +1,194 @@
+"""
+Columnar (struct-of-arrays) store for sensor packets.
+
+A day of 1 Hz packets is ~86k rows - holding them as SensorPacket
+dataclasses costs a __dict__ per packet. PacketBuffer keeps one typed
+numpy column per field instead, grows by doubling, and answers time
+windows with a binary search on `unix` (packets are kept sorted by unix).
+
+`timestamp` is not stored - it is the ISO rendering of `unix` and is
+rebuilt on the way out (to_dicts / to_rows / packet). Float columns are
+float64 so values round-trip to the REAL columns in SQLite unchanged.
+"""
+from __future__ import annotations
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+
+from ai.data.sensor_packet import SensorPacket, _unix_to_iso
+
+PACKET_COLUMNS: Dict[str, np.dtype] = {
+    "seq":          np.dtype(np.int64),
+    "unix":         np.dtype(np.int64),
+    "steps":        np.dtype(np.int32),
+    "vm":           np.dtype(np.float64),
+    "peak_vm":      np.dtype(np.float64),
+    "hr":           np.dtype(np.float64),
+    "hrv":          np.dtype(np.float64),
+    "hrv_drop":     np.dtype(np.float64),
+    "hr_drop":      np.dtype(np.float64),
+    "hr_stability": np.dtype(np.float64),
+    "sleep_score":  np.dtype(np.float64),
+    "interpolated": np.dtype(np.bool_),
+}
+
+# column order of the sensor_packets table (lib/db.ts / lib/migration.ts)
+SQLITE_COLUMNS: Tuple[str, ...] = (
+    "seq", "unix", "timestamp", "steps", "vm", "peak_vm", "hr", "hrv",
+    "hrv_drop", "hr_drop", "hr_stability", "sleep_score", "interpolated",
+)
+
+MIN_CAPACITY = 1024
+
+
+class PacketBuffer:
+    def __init__(self, capacity: int = MIN_CAPACITY):
+        capacity = max(int(capacity), 1)
+        self._cols: Dict[str, np.ndarray] = {
+            name: np.empty(capacity, dtype=dtype) for name, dtype in PACKET_COLUMNS.items()
+        }
+        self._n = 0
+
+    # construction
+    @classmethod
+    def from_columns(cls, **columns: np.ndarray) -> "PacketBuffer":
+        """Wraps existing column arrays (no copy when the dtypes already match)."""
+        missing = set(PACKET_COLUMNS) - set(columns)
+        if missing:
+            raise ValueError(f"[packet_buffer] missing columns: {sorted(missing)}")
+        n = len(columns["unix"])
+        buf = cls.__new__(cls)
+        buf._cols = {
+            name: np.asarray(columns[name], dtype=dtype) for name, dtype in PACKET_COLUMNS.items()
+        }
+        if any(len(c) != n for c in buf._cols.values()):
+            raise ValueError("[packet_buffer] columns have different lengths")
+        if n > 1 and np.any(np.diff(buf._cols["unix"]) < 0):
+            raise ValueError("[packet_buffer] columns must be sorted by unix")
+        buf._n = n
+        return buf
+
+    # size / growth
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def capacity(self) -> int:
+        return len(self._cols["unix"])
+
+    def _reserve(self, needed: int) -> None:
+        if needed <= self.capacity:
+            return
+        new_cap = max(needed, self.capacity * 2, MIN_CAPACITY)
+        for name, col in self._cols.items():
+            grown = np.empty(new_cap, dtype=col.dtype)
+            grown[:self._n] = col[:self._n]
+            self._cols[name] = grown
+
+    def _check_order(self, unix: int) -> None:
+        if self._n and unix < self._cols["unix"][self._n - 1]:
+            raise ValueError(
+                f"[packet_buffer] packet at unix={unix} is older than the last "
+                f"buffered packet - buffer must stay sorted by unix"
+            )
+
+    def append(self, packet: SensorPacket) -> None:
+        self._check_order(packet.unix)
+        self._reserve(self._n + 1)
+        i = self._n
+        for name in PACKET_COLUMNS:
+            self._cols[name][i] = getattr(packet, name)
+        self._n += 1
+
+    def extend(self, packets: Iterable[SensorPacket]) -> None:
+        packets = list(packets)
+        if not packets:
+            return
+        unix = np.fromiter((p.unix for p in packets), dtype=np.int64, count=len(packets))
+        if np.any(np.diff(unix) < 0):
+            raise ValueError("[packet_buffer] packets must be sorted by unix")
+        self._check_order(int(unix[0]))
+        start, end = self._n, self._n + len(packets)
+        self._reserve(end)
+        self._cols["unix"][start:end] = unix
+        for name, dtype in PACKET_COLUMNS.items():
+            if name == "unix":
+                continue
+            self._cols[name][start:end] = np.fromiter(
+                (getattr(p, name) for p in packets), dtype=dtype, count=len(packets)
+            )
+        self._n = end
+
+    # access
+    def column(self, name: str) -> np.ndarray:
+        """Zero-copy view of one column, trimmed to the live rows."""
+        return self._cols[name][:self._n]
+
+    def packet(self, i: int) -> SensorPacket:
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        row = {name: self._cols[name][i].item() for name in PACKET_COLUMNS}
+        return SensorPacket(timestamp=_unix_to_iso(row["unix"]), **row)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._n)
+            if step != 1:
+                raise ValueError("[packet_buffer] strided slices are not supported")
+            return self._view(start, max(start, stop))
+        return self.packet(key)
+
+    def __iter__(self) -> Iterator[SensorPacket]:
+        for i in range(self._n):
+            yield self.packet(i)
+
+    def _view(self, start: int, stop: int) -> "PacketBuffer":
+        # slices share memory with the parent; capacity == length so a later
+        # append on the view reallocates instead of writing into the parent
+        view = PacketBuffer.__new__(PacketBuffer)
+        view._cols = {name: col[start:stop] for name, col in self._cols.items()}
+        view._n = stop - start
+        return view
+
+    def window_bounds(self, start_unix: int, end_unix: int) -> Tuple[int, int]:
+        unix = self.column("unix")
+        lo = int(np.searchsorted(unix, start_unix, side="left"))
+        hi = int(np.searchsorted(unix, end_unix, side="right"))
+        return lo, max(lo, hi)
+
+    def get_window(self, start_unix: int, end_unix: int) -> "PacketBuffer":
+        # same inclusive bounds as sensor_packet.get_window, O(log n) + view
+        lo, hi = self.window_bounds(start_unix, end_unix)
+        return self._view(lo, hi)
+
+    # bulk export
+    def timestamps(self) -> List[str]:
+        # vectorised _unix_to_iso
+        iso = np.datetime_as_string(self.column("unix").astype("datetime64[s]"), unit="s")
+        return [t + "Z" for t in iso.tolist()]
+
+    def to_columns(self) -> Dict[str, list]:
+        cols = {name: self.column(name).tolist() for name in PACKET_COLUMNS}
+        cols["timestamp"] = self.timestamps()
+        return cols
+
+    def to_dicts(self) -> List[Dict]:
+        # same shape as packets_to_dicts, built column-wise instead of asdict per packet
+        cols = self.to_columns()
+        names = list(cols)
+        return [dict(zip(names, values)) for values in zip(*(cols[n] for n in names))]
+
+    def to_rows(self, columns: Tuple[str, ...] = SQLITE_COLUMNS) -> Iterator[Tuple]:
+        """Row tuples in sensor_packets column order, ready for executemany."""
+        cols = self.to_columns()
+        if "interpolated" in cols:
+            cols["interpolated"] = [int(v) for v in cols["interpolated"]]
+        return zip(*(cols[name] for name in columns))
+
+
+def packets_to_buffer(packets: List[SensorPacket], capacity: Optional[int] = None) -> PacketBuffer:
+    # process_packet_stream output is seq-ordered; interpolated midpoints keep unix monotonic
+    buf = PacketBuffer(capacity=capacity or max(len(packets), MIN_CAPACITY))
+    buf.extend(packets)
+    return buf
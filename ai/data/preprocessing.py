@@ -1,4 +1,5 @@
 from __future__ import annotations
+import hashlib
 import json
 import re
 import sqlite3
@@ -6,10 +7,13 @@ import numpy as np
 from dataclasses import dataclass, field
 from datetime import datetime as dt
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 import os
 
-from supabase import create_client, Client
+from supabase import Client
+
+from ai.storage.sqlite_pool import connection as pooled_connection
+from ai.storage.supabase_client import get_supabase
 
 DEFAULT_DB_PATH = "./glucose_app.db"
 
@@ -38,9 +42,16 @@ class MealFeatures:
     fiber_ratio:          float
     fatprotein:           float
     is_liquid:            bool
-    medication_period:    str                   = "unknown"
-    insulin_medications:  List[MedicationEntry] = field(default_factory=list)
-    other_medications:    List[MedicationEntry] = field(default_factory=list)
+    medication_period:      str           = "unknown"
+    medication_schedule_id: Optional[str] = None
+
+
+@dataclass
+class MedicationSchedule:
+    # one per user (per schedule version) - meals point at it by id instead of carrying copies
+    schedule_id:         str
+    insulin_medications: List[MedicationEntry] = field(default_factory=list)
+    other_medications:   List[MedicationEntry] = field(default_factory=list)
 
 
 @dataclass
@@ -74,18 +85,6 @@ class TrainingSequence:
     training_phase: int
 
 
-def _connect(db_path: str) -> sqlite3.Connection:
-    path = Path(db_path)
-    if not path.exists():
-        raise FileNotFoundError(
-            f"[preprocessing] SQLite database not found at '{db_path}'.\n"
-            f"If running locally, export glucose_app.db from the device first."
-        )
-    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-
 def _parse_iso(ts: str) -> dt:
     return dt.fromisoformat(ts.replace("Z", "+00:00"))
 
@@ -98,7 +97,7 @@ def _get_supabase(url: Optional[str] = None, key: Optional[str] = None) -> Clien
             "[preprocessing] Supabase credentials not found. Set "
             "EXPO_PUBLIC_SUPABASE_URL and EXPO_PUBLIC_SUPABASE_KEY."
         )
-    return create_client(url, key)
+    return get_supabase(url, key)
 # MEDICARITON
 def fetch_medication(
     user_id:      str,
@@ -204,50 +203,114 @@ def _medication_period_at(meal_ts: dt, medications: List[MedicationEntry]) -> st
         return "unknown"
     return best.med_class
 
+
+def build_medication_schedule(medications: List[MedicationEntry]) -> Optional[MedicationSchedule]:
+    if not medications:
+        return None
+    # content hash as the id - an edited schedule gets a new version, an unchanged one keeps its id
+    key = json.dumps(
+        sorted((m.med_id, m.dose, m.t_k, m.med_class, m.insulin_type or "") for m in medications)
+    )
+    return MedicationSchedule(
+        schedule_id         = "sched-" + hashlib.sha1(key.encode()).hexdigest()[:12],
+        insulin_medications = [m for m in medications if "insulin" in m.med_class],
+        other_medications   = [m for m in medications if "insulin" not in m.med_class],
+    )
+
 # MEALS 
-def fetch_meals(
+# filtering, projection and the macro ratios run inside SQLite; the
+# idx_food_log_timestamp_carbs index (lib/migration.ts v3) covers this query
+MEAL_QUERY = """
+    SELECT
+        id,
+        timestamp,
+        carbs,
+        ROUND(COALESCE(fiber, 0) / carbs, 4) AS fiber_ratio,
+        CASE
+            WHEN carbs + COALESCE(fat, 0) + COALESCE(protein, 0) > 0
+            THEN ROUND((COALESCE(fat, 0) + COALESCE(protein, 0))
+                       / (carbs + COALESCE(fat, 0) + COALESCE(protein, 0)), 4)
+            ELSE 0.2
+        END AS fatprotein,
+        is_liquid
+    FROM food_log
+    WHERE carbs > 0
+"""
+
+
+@dataclass
+class MealColumns:
+    meal_id:     List[str]
+    timestamp:   List[str]
+    carbs:       np.ndarray
+    fiber_ratio: np.ndarray
+    fatprotein:  np.ndarray
+    is_liquid:   np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.meal_id)
+
+
+def fetch_meal_columns(
     conn:       sqlite3.Connection,
     start_date: Optional[str] = None,
     end_date:   Optional[str] = None,
-) -> List[MealFeatures]:
-    query  = "SELECT * FROM food_log"
+) -> MealColumns:
+    query  = MEAL_QUERY
     params: List[str] = []
 
     if start_date and end_date:
-        query += " WHERE timestamp >= ? AND timestamp <= ?"
+        query += " AND timestamp >= ? AND timestamp <= ?"
         params = [start_date, end_date + "T23:59:59Z"]
     elif start_date:
-        query += " WHERE timestamp >= ?"
+        query += " AND timestamp >= ?"
         params = [start_date]
 
     query += " ORDER BY timestamp ASC"
-    rows   = conn.execute(query, params).fetchall()
+    # plain tuples - skips sqlite3.Row construction for every meal
+    cur = conn.cursor()
+    cur.row_factory = None
+    rows = cur.execute(query, params).fetchall()
+    cols = list(zip(*rows)) if rows else [()] * 6
+
+    return MealColumns(
+        meal_id     = [str(v) for v in cols[0]],
+        timestamp   = list(cols[1]),
+        carbs       = np.asarray(cols[2], dtype=np.float64),
+        fiber_ratio = np.asarray(cols[3], dtype=np.float64),
+        fatprotein  = np.asarray(cols[4], dtype=np.float64),
+        is_liquid   = np.asarray([bool(v) for v in cols[5]], dtype=np.bool_),
+    )
+
+
+def fetch_meals(
+    conn:       sqlite3.Connection,
+    start_date: Optional[str] = None,
+    end_date:   Optional[str] = None,
+) -> List[MealFeatures]:
+    cols  = fetch_meal_columns(conn, start_date, end_date)
     meals: List[MealFeatures] = []
 
-    for row in rows:
+    carbs       = cols.carbs.tolist()
+    fiber_ratio = cols.fiber_ratio.tolist()
+    fatprotein  = cols.fatprotein.tolist()
+    is_liquid   = cols.is_liquid.tolist()
+
+    for i, meal_id in enumerate(cols.meal_id):
         try:
-            carbs = float(row["carbs"] or 0)
-            if carbs <= 0:
-                continue
-
-            ts        = _parse_iso(row["timestamp"])
-            fat       = float(row["fat"]     or 0)
-            protein   = float(row["protein"] or 0)
-            fiber     = float(row["fiber"]   or 0)
-            total_mac = carbs + fat + protein
-
-            meals.append(MealFeatures(
-                meal_id     = str(row["id"]),
-                timestamp   = ts,
-                hour        = ts.hour + ts.minute / 60.0,
-                carbs       = carbs,
-                fiber_ratio = round(fiber / carbs        if carbs > 0      else 0.15, 4),
-                fatprotein  = round((fat + protein) / total_mac if total_mac > 0 else 0.2, 4),
-                is_liquid   = bool(row["is_liquid"]),
-               
-            ))
+            ts = _parse_iso(cols.timestamp[i])
         except Exception as e:
-            print(f"    [preprocessing] Skipping food_log row {row['id']}: {e}")
+            print(f"    [preprocessing] Skipping food_log row {meal_id}: {e}")
+            continue
+        meals.append(MealFeatures(
+            meal_id     = meal_id,
+            timestamp   = ts,
+            hour        = ts.hour + ts.minute / 60.0,
+            carbs       = carbs[i],
+            fiber_ratio = fiber_ratio[i],
+            fatprotein  = fatprotein[i],
+            is_liquid   = is_liquid[i],
+        ))
 
     print(f"    [preprocessing] Loaded {len(meals)} meals with carbs > 0")
     return meals
@@ -432,14 +495,16 @@ def build_sequences(
     meals:        List[MealFeatures],
     fingersticks: List[FingerstickAnchor],
     medications:  List[MedicationEntry],
+    schedule:     Optional[MedicationSchedule] = None,
 ) -> List[TrainingSequence]:
     print(f"    [preprocessing] Building sequences for {len(meals)} meals...")
     sequences: List[TrainingSequence] = []
     skipped = 0
     t0 = meals[0].timestamp if meals else None
 
-    insulin_meds = [m for m in medications if "insulin" in m.med_class]
-    other_meds   = [m for m in medications if "insulin" not in m.med_class]
+    if schedule is None:
+        schedule = build_medication_schedule(medications)
+    schedule_id = schedule.schedule_id if schedule else None
 
     for meal in meals:
         meal_unix = int(meal.timestamp.timestamp())
@@ -458,9 +523,8 @@ def build_sequences(
             skipped += 1
             continue
 
-        meal.insulin_medications = insulin_meds
-        meal.other_medications   = other_meds          
-        meal.medication_period   = _medication_period_at(meal.timestamp, medications)
+        meal.medication_schedule_id = schedule_id
+        meal.medication_period      = _medication_period_at(meal.timestamp, medications)
 
         sequences.append(TrainingSequence(
             meal           = meal,
@@ -506,8 +570,24 @@ def _med_entry_to_dict(m: MedicationEntry) -> Dict:
     }
 
 
-def sequences_to_dict(seqs: List[TrainingSequence]) -> Dict:
+def _schedule_to_dict(schedule: MedicationSchedule) -> Dict:
+    return {
+        "insulin_medications": [_med_entry_to_dict(m) for m in schedule.insulin_medications],
+        "other_medications":   [_med_entry_to_dict(m) for m in schedule.other_medications],
+    }
+
+
+def sequences_to_dict(
+    seqs:      List[TrainingSequence],
+    schedules: Optional[Dict[str, MedicationSchedule]] = None,
+) -> Dict:
+    used = {s.meal.medication_schedule_id for s in seqs} - {None}
     return {
+        # each schedule serialised once; meals carry medication_schedule_id
+        "medication_schedules": {
+            sid: _schedule_to_dict(sched)
+            for sid, sched in (schedules or {}).items() if sid in used
+        },
         "meal_features": [
             {
                 "meal_id":             s.meal.meal_id,
@@ -518,10 +598,7 @@ def sequences_to_dict(seqs: List[TrainingSequence]) -> Dict:
                 "fatprotein":          s.meal.fatprotein,
                 "is_liquid":           s.meal.is_liquid,
                 "medication_period":   s.meal.medication_period,
-                # BUG 5 FIX: was `other_edications` (typo) + MedicationEntry objects
-                #            are not JSON-serialisable — convert to dicts
-                "insulin_medications": [_med_entry_to_dict(m) for m in s.meal.insulin_medications],
-                "other_medications":   [_med_entry_to_dict(m) for m in s.meal.other_medications],
+                "medication_schedule_id": s.meal.medication_schedule_id,
             }
             for s in seqs
         ],
@@ -554,6 +631,24 @@ def sequences_to_dict(seqs: List[TrainingSequence]) -> Dict:
         "training_phases": [s.training_phase for s in seqs],
     }
 
+PER_MEAL_KEYS = ("meal_features", "sensor_windows", "fingersticks", "training_phases")
+
+
+def subset_sequences(seqs: Dict, indices: Sequence[int]) -> Dict:
+    # same dict shape as sequences_to_dict, keeping only the given meals (in that order)
+    indices = [int(i) for i in indices]
+    out = {k: v for k, v in seqs.items() if k not in PER_MEAL_KEYS}
+    for key in PER_MEAL_KEYS:
+        if key in seqs:
+            out[key] = [seqs[key][i] for i in indices]
+    used = {m.get("medication_schedule_id") for m in out.get("meal_features", [])} - {None}
+    if "medication_schedules" in seqs:
+        out["medication_schedules"] = {
+            sid: sched for sid, sched in seqs["medication_schedules"].items() if sid in used
+        }
+    return out
+
+
 # public entry point
 def load_training_data(
     db_path:          str                   = DEFAULT_DB_PATH,
@@ -582,15 +677,17 @@ def load_training_data(
             print(f"  [preprocessing] WARNING: Could not fetch medications: {e}")
             print(f"  [preprocessing] Continuing without medication data.")
 
-    conn = _connect(db_path)
-    try:
+    # pooled read-only handle - warm page cache across calls, released on exit
+    with pooled_connection(db_path) as conn:
         meals        = fetch_meals(conn, start_date, end_date)
         fingersticks = fetch_fingersticks(fingerstick_json, entries_list)
 
         if len(meals) < 5:
             raise ValueError(f"[preprocessing] Only {len(meals)} meals — need at least 5.")
 
-        sequences = build_sequences(conn, meals, fingersticks, medications)
+        schedule  = build_medication_schedule(medications)
+        schedules = {schedule.schedule_id: schedule} if schedule else {}
+        sequences = build_sequences(conn, meals, fingersticks, medications, schedule)
 
         if len(sequences) < 5:
             raise ValueError(f"[preprocessing] Only {len(sequences)} sequences — need at least 5.")
@@ -612,10 +709,8 @@ def load_training_data(
               f"{len(medications)} medication entries\n")
 
         return (
-            sequences_to_dict(train_seqs),
-            sequences_to_dict(val_seqs),
-            sequences_to_dict(test_seqs),
+            sequences_to_dict(train_seqs, schedules),
+            sequences_to_dict(val_seqs,   schedules),
+            sequences_to_dict(test_seqs,  schedules),
             meds_dicts,
-        )
-    finally:
-        conn.close()
\ No newline at end of file
+        )
\ No newline at end of file
@@ -95,12 +95,16 @@ def process_packet_stream(raw_packets: List[Dict]) -> List[SensorPacket]:
     return result
 def packets_to_dicts(packets: List[SensorPacket]) -> List[Dict]:
     # do this before serializing to JSON ro insert to supabase
+    if hasattr(packets, "to_dicts"):   # PacketBuffer - bulk column-wise conversion
+        return packets.to_dicts()
     return [asdict(p) for p in packets]
 def get_window(
         packets: List[SensorPacket],
         start_unix: int, 
         end_unix: int, 
 ) -> List[SensorPacket]:
+    if hasattr(packets, "get_window"):  # PacketBuffer - binary search, returns a view
+        return packets.get_window(start_unix, end_unix)
     return [p for p in packets if start_unix <= p.unix <= end_unix]
 
 
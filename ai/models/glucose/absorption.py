@@ -1,7 +1,7 @@
 import torch
 from typing import List, Dict, Any
 from ai.models.user.parameters import UserParams
-from ai.models.glucose.absorptions_util import getK_abs_i, getK_abs_i_batch
+from ai.models.glucose.absorptions_util import cached_k_abs_i, getK_abs_i_batch
 
 
 def carbs_absorption(
@@ -14,16 +14,7 @@ def carbs_absorption(
     params: UserParams
 ) -> torch.Tensor:
     
-    k_abs_i = getK_abs_i(
-        params.k_base,
-        params.su,
-        params.alpha,
-        fiber_ratio,
-        params.eta_liq_u,
-        is_liquid,
-        params.eta_fp_u,
-        fatprotein_i
-    )
+    k_abs_i = cached_k_abs_i(params, fiber_ratio, is_liquid, fatprotein_i)
 
     dt = max(0.0, t - t_meal)
     
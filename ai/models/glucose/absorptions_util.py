@@ -1,3 +1,6 @@
+import threading
+import weakref
+
 import torch 
 def getK_abs_i(
     k_base: float,        # baseline glucose absorption rate
@@ -34,6 +37,56 @@ def getK_abs_i(
     k_abs_i = k_base * su * fiber_multiplier * liquid_multiplier * fatprotein_multiplier
     return k_abs_i
 
+# params -> {grad enabled: (k_abs_version, {meal key: k_abs_i})}; held weakly and
+# off the module, so entries die with their params and never reach deepcopy or state_dict
+_K_ABS_CACHE: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_K_ABS_LOCK = threading.Lock()
+
+
+def cached_k_abs_i(
+    params,               # UserParams
+    fiber_ratio: float,
+    is_liquid: bool,
+    fatprotein_i: float
+):
+    """
+    getK_abs_i for one meal, memoised per params until params.k_abs_version
+    changes and keyed by the meal features k_abs depends on, so
+    carbs_absorption and calculate_endo_insulin share entries across every
+    time step. Grad-enabled results (one forward pass, graph attached) and
+    no_grad results (validation, the API) are kept apart; training bumps
+    the version after every optimizer step, and a backward through an
+    entry drops it, so a freed graph is never reused.
+    """
+    version = params.k_abs_version
+    grad = torch.is_grad_enabled()
+    with _K_ABS_LOCK:
+        by_mode = _K_ABS_CACHE.setdefault(params, {})
+        entry = by_mode.get(grad)
+        if entry is None or entry[0] != version:
+            entry = by_mode[grad] = (version, {})
+    meal_key = (float(fiber_ratio), bool(is_liquid), float(fatprotein_i))
+    k_abs_i = entry[1].get(meal_key)
+    if k_abs_i is None:
+        k_abs_i = entry[1][meal_key] = _k_abs_i(params, fiber_ratio, is_liquid, fatprotein_i)
+        if k_abs_i.requires_grad:
+            # backward frees this graph - drop the entry so a second pass without a step rebuilds it
+            k_abs_i.register_hook(lambda _grad, memo=entry[1], key=meal_key: memo.pop(key, None))
+    return k_abs_i
+
+
+def _k_abs_i(params, fiber_ratio, is_liquid, fatprotein_i):
+    return getK_abs_i(
+        params.k_base,
+        params.su,
+        params.alpha,
+        fiber_ratio,
+        params.eta_liq_u,
+        is_liquid,
+        params.eta_fp_u,
+        fatprotein_i
+    )
+
 def getK_abs_i_batch(
     k_base: float,
     su: float,
@@ -4,6 +4,15 @@ from ai.models.glucose.medication import calculate_insulin_effect
 from ai.models.user.parameters import UserParams
 from components.ai_medication.convert_medication_period import convert_medication_period
 from ai.models.glucose.activity import activity_Effect
+
+MEDICATION_EFFECTS = {
+    'baseline': {'carb_mult': 1.0, 'insulin_mult': 1.0},
+    'pioglitazone_45': {'carb_mult': 0.95, 'insulin_mult': 1.1},
+    'metformin_500': {'carb_mult': 0.90, 'insulin_mult': 1.15},
+    'metformin_500_er': {'carb_mult': 0.88, 'insulin_mult': 1.2},
+    'unknown': {'carb_mult': 1.0, 'insulin_mult': 1.0}
+}
+
 def step_glucose(
     G_tilde: float,
     t: float,
@@ -19,14 +28,6 @@ def step_glucose(
     training: bool = False 
 ) -> torch.Tensor:
 
-    MEDICATION_EFFECTS = {
-        'baseline': {'carb_mult': 1.0, 'insulin_mult': 1.0},
-        'pioglitazone_45': {'carb_mult': 0.95, 'insulin_mult': 1.1},
-        'metformin_500': {'carb_mult': 0.90, 'insulin_mult': 1.15},
-        'metformin_500_er': {'carb_mult': 0.88, 'insulin_mult': 1.2},
-        'unknown': {'carb_mult': 1.0, 'insulin_mult': 1.0}
-    }
-
     med_effect = MEDICATION_EFFECTS.get(medication_period, MEDICATION_EFFECTS['unknown'])
     carb_mult = torch.tensor(med_effect['carb_mult'], dtype=torch.float32)
     insulin_mult = torch.tensor(med_effect['insulin_mult'], dtype=torch.float32)
@@ -96,4 +97,6 @@ def step_glucose(
         + epsilon_t
     )
 
-    return torch.tensor(G_tilde, dtype=torch.float32) + delta_G
\ No newline at end of file
+    if not isinstance(G_tilde, torch.Tensor):
+        G_tilde = torch.tensor(G_tilde, dtype=torch.float32)
+    return G_tilde + delta_G
\ No newline at end of file
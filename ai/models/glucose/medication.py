@@ -1,7 +1,7 @@
 import torch
 from typing import Any, List, Dict
 from ai.models.user.parameters import UserParams
-from ai.models.glucose.absorptions_util import getK_abs_i
+from ai.models.glucose.absorptions_util import cached_k_abs_i
 from components.ai_medication.med_durationmodel import med_durationModel
 
 
@@ -45,16 +45,7 @@ def calculate_endo_insulin(
         is_liquid = meal.get("is_liquid", False)
         fatprotein = meal.get("fatprotein", 0.1)
         
-        k_abs_i = getK_abs_i(
-            params.k_base,
-            params.su,
-            params.alpha,
-            fiber_ratio,
-            params.eta_liq_u,
-            is_liquid,
-            params.eta_fp_u,
-            fatprotein,
-        )
+        k_abs_i = cached_k_abs_i(params, fiber_ratio, is_liquid, fatprotein)
         
         delta_t = max(0.0, t - t_meal)
         delta_t_tensor = torch.tensor(delta_t, dtype=torch.float32)
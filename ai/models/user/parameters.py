@@ -1,5 +1,9 @@
 import torch 
 import torch.nn as nn 
+from typing import Any, Dict, Mapping
+
+# raw parameters getK_abs_i depends on
+K_ABS_FIELDS = ("k_base_raw", "su_raw", "alpha_raw", "eta_liq_u_raw", "eta_fp_u")
 
 class UserParams(nn.Module):
     def __init__(self):
@@ -36,6 +40,9 @@ class UserParams(nn.Module):
 
         self.alpha_activity_raw = nn.Parameter(torch.ones(6) * 0.1)
 
+        # plain attribute, so it never reaches state_dict; see k_abs_version
+        self._k_abs_version = 0
+
     @property
     def su(self):
         return 0.7 + (1.3 - 0.7) * torch.sigmoid(self.su_raw)
@@ -53,4 +60,57 @@ class UserParams(nn.Module):
         return 0.5 * torch.sigmoid(self.alpha_raw)
     @property
     def alpha_activity(self):
-        return torch.sigmoid(self.alpha_activity_raw)
\ No newline at end of file
+        return torch.sigmoid(self.alpha_activity_raw)
+
+    @property
+    def k_abs_version(self) -> int:
+        # bumped by load_state_dict and by the training optimizer's step hook; anything
+        # else that writes a K_ABS_FIELDS parameter in place must call bump_version()
+        return self._k_abs_version
+
+    def bump_version(self) -> None:
+        self._k_abs_version += 1
+
+    def load_state_dict(self, *args, **kwargs):
+        result = super().load_state_dict(*args, **kwargs)
+        self.bump_version()
+        return result
+
+
+# (raw parameter, low, high) for the sigmoid-bounded fields: value = low + (high - low) * sigmoid(raw)
+BOUNDED_FIELDS = {
+    "su":        ("su_raw",        0.7,   1.3),
+    "k_base":    ("k_base_raw",    0.015, 0.04),
+    "delta_u":   ("delta_u_raw",   0.5,   1.5),
+    "eta_liq_u": ("eta_liq_u_raw", 0.4,   0.7),
+    "alpha":     ("alpha_raw",     0.0,   0.5),
+}
+_LOGIT_EPS = 1e-4
+
+
+def _inverse_bounded(value: float, low: float, high: float) -> torch.Tensor:
+    frac = torch.tensor((float(value) - low) / (high - low)).clamp(_LOGIT_EPS, 1 - _LOGIT_EPS)
+    return torch.logit(frac)
+
+
+def params_from_dict(row: Mapping[str, Any]) -> UserParams:
+    """
+    Inverse of train.extract_params_dict (and the user_model_params row):
+    bounded fields are stored as their transformed values and are mapped
+    back onto the raw parameters. Missing or null fields keep defaults.
+    """
+    params = UserParams()
+    state: Dict[str, torch.Tensor] = params.state_dict()
+    for name, value in row.items():
+        if value is None:
+            continue
+        if name in BOUNDED_FIELDS:
+            raw, low, high = BOUNDED_FIELDS[name]
+            state[raw] = _inverse_bounded(value, low, high)
+        elif name == "alpha_activity_raw":
+            state[name] = torch.tensor(value, dtype=torch.float32)
+        elif name in state and state[name].dim() == 0:
+            state[name] = torch.tensor(float(value))
+    params.load_state_dict(state)
+    return params
+
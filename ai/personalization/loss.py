@@ -5,7 +5,8 @@ Total Loss:
 
 import torch 
 import torch.nn as nn
-from typing import Dict, List, Tuple, Optional, Any
+from typing import Dict, List, Tuple, Optional, Any, Union
+from torch.nn.utils.rnn import pad_sequence
 import numpy as np
 from ai.models.user.parameters import UserParams
 
@@ -38,8 +39,10 @@ class GlucoseLoss(nn.Module):
         hr_obs: Optional[torch.Tensor] = None, 
         hrv_predicted: Optional[torch.Tensor] = None,
         hrv_observed: Optional[torch.Tensor] = None,
-        med_duration_model: Optional[Any] = None
+        med_duration_model: Optional[Any] = None,
+        return_breakdown: bool = True,
     ) -> Tuple[torch.Tensor, Dict[str, float]]:
+        # return_breakdown=False skips the host sync for the float dict (returned empty)
         if G_b is None:
             if params is not None:
                 G_b = params.Gb.detach()  # tensor value from UserParams
@@ -51,92 +54,97 @@ class GlucoseLoss(nn.Module):
             obs_glucose = torch.tensor(obs_glucose, dtype=torch.float32)  
         if not isinstance(G_b, torch.Tensor):
             G_b = torch.tensor(G_b, dtype=torch.float32)  
-        
-       
-        loss_fingerstick = self._fingerstick_loss(
-            pred_glucose, obs_glucose, G_b
-        )
-        loss_window = self._window_loss(
-            pred_glucose, obs_glucose
+
+        terms = self.batch_terms(
+            pred_glucose, obs_glucose, G_b, params,
+            hr_pred, hr_obs, hrv_predicted, hrv_observed, med_duration_model,
         )
-        loss_phys = torch.tensor(0.0, dtype=torch.float32)
-        if hr_pred is not None and hr_obs is not None:
-            loss_phys = loss_phys + self._hr_loss(hr_pred, hr_obs)
-        if hrv_predicted is not None and hrv_observed is not None:
-            loss_phys = loss_phys + self._hrv_loss(hrv_predicted, hrv_observed)
-        
-        loss_med = torch.tensor(0.0, dtype=torch.float32)
-        if med_duration_model is not None:
-            loss_med = self._med_duration_loss(med_duration_model)
-        
-        loss_param_reg = torch.tensor(0.0, dtype=torch.float32)
-        if params is not None:
-            loss_param_reg = self._parameter_reg(params)  
-        
         total_loss = (
-            self.lambda_f * loss_fingerstick + 
-            self.lambda_w * loss_window +
-            self.lambda_p * loss_phys + 
-            self.lambda_m * loss_med +
-            loss_param_reg
+            self.lambda_f * terms["fingerstick"] + 
+            self.lambda_w * terms["window"] +
+            self.lambda_p * terms["phys"] + 
+            self.lambda_m * terms["med"] +
+            terms["param_reg"]
         )
-        
-        loss_dict = {
-            'total': total_loss.item(),
-            'fingerstick': loss_fingerstick.item(),
-            'window': loss_window.item(),
-            'phys': loss_phys.item(),
-            'med': loss_med.item(),
-            'param_reg': loss_param_reg.item()
-        }
+        if not return_breakdown:
+            return total_loss, {}
+        loss_dict = breakdown({"total": total_loss, **terms})
         return total_loss, loss_dict
-    
+
+    def batch_terms(
+        self,
+        pred: torch.Tensor,
+        obs: torch.Tensor,
+        G_b: torch.Tensor,
+        params: Optional[Any] = None,
+        hr_pred: Optional[torch.Tensor] = None,
+        hr_obs: Optional[torch.Tensor] = None,
+        hrv_pred: Optional[torch.Tensor] = None,
+        hrv_obs: Optional[torch.Tensor] = None,
+        med_duration_model: Optional[Any] = None,
+        weights: Optional[torch.Tensor] = None,
+    ) -> Dict[str, torch.Tensor]:
+        """
+        Every loss term as a 0-d tensor, computed over the whole [B, T]
+        batch in one pass (NaN obs masked, no host syncs). weights: optional
+        per-sample [B] weights; the data terms become weighted means.
+        """
+        zero = pred.new_zeros(())
+        step_w = weights.unsqueeze(-1) if weights is not None and pred.dim() == 2 else weights
+        phys = zero
+        if hr_pred is not None and hr_obs is not None:
+            phys = phys + self._hr_loss(hr_pred, hr_obs, weights)
+        if hrv_pred is not None and hrv_obs is not None:
+            phys = phys + self._hrv_loss(hrv_pred, hrv_obs, weights)
+        return {
+            "fingerstick": self._fingerstick_loss(pred, obs, G_b, step_w),
+            "window":      self._window_loss(pred, obs, step_w),
+            "phys":        phys,
+            "med":         self._med_duration_loss(med_duration_model) if med_duration_model is not None else zero,
+            "param_reg":   self._parameter_reg(params) if params is not None else zero,
+        }
+
     def _fingerstick_loss(
         self,
         pred: torch.Tensor, 
         obs: torch.Tensor,
-        baseline: torch.Tensor
+        baseline: torch.Tensor,
+        weights: Optional[torch.Tensor] = None
     ) -> torch.Tensor:
         baseline_expanded = baseline.unsqueeze(-1)  # [batch_size, 1]
-        obs_response = obs - baseline_expanded
+        valid_mask = ~torch.isnan(obs)
+        obs_response = torch.nan_to_num(obs) - baseline_expanded
         pred_response = pred - baseline_expanded
-
-        valid_mask = ~torch.isnan(obs_response)
-        if not valid_mask.any():
-                return torch.tensor(0.0, dtype=pred.dtype, requires_grad=False)
-        squarred_err = (pred_response - obs_response) ** 2 
-        return squarred_err[valid_mask].mean()
+        return masked_mean((pred_response - obs_response) ** 2, valid_mask, weight=weights)
     
     def _window_loss(
         self,
         pred: torch.Tensor,
-        obs: torch.Tensor 
+        obs: torch.Tensor,
+        weights: Optional[torch.Tensor] = None
     ) -> torch.Tensor:
     # soft band loss - penalises prediction outside + delta of ppbs
-        valid_mask = ~torch.isnan(obs_response)
-        if not valid_mask.any():
-                return torch.tensor(0.0, dtype=pred.dtype, requires_grad=False)
-
-        abs_error = torch.abs(pred[valid_mask] - obs[valid_mask])
+        valid_mask = ~torch.isnan(obs)
+        abs_error = torch.abs(pred - torch.nan_to_num(obs))
         band_loss = torch.clamp(abs_error - self.delta, min=0.0) ** 2
-
-        loss = torch.mean(band_loss)
-        return loss 
+        return masked_mean(band_loss, valid_mask, weight=weights)
     
     def _hrv_loss(
         self,
         hrv_pred: torch.Tensor,
-        hrv_obs: torch.Tensor
+        hrv_obs: torch.Tensor,
+        weights: Optional[torch.Tensor] = None
     ) -> torch.Tensor:
-        loss = torch.mean((hrv_pred - hrv_obs) ** 2)
+        loss = masked_mean((hrv_pred - torch.nan_to_num(hrv_obs)) ** 2, ~torch.isnan(hrv_obs), weight=weights)
         return self.w2 * loss 
     
     def _hr_loss(
         self, 
         hr_pred: torch.Tensor,
-        hr_obs: torch.Tensor
+        hr_obs: torch.Tensor,
+        weights: Optional[torch.Tensor] = None
     ) -> torch.Tensor:
-        loss = torch.mean((hr_pred - hr_obs) ** 2) 
+        loss = masked_mean((hr_pred - torch.nan_to_num(hr_obs)) ** 2, ~torch.isnan(hr_obs), weight=weights)
         return self.w1 * loss 
     
     def _med_duration_loss(
@@ -144,46 +152,103 @@ class GlucoseLoss(nn.Module):
         med_duration_model: Any  
     ) -> torch.Tensor:
         reg_loss = torch.tensor(0.0, dtype=torch.float32)
-        if hasattr(med_duration_model, 'theta'):
-            for theta in med_duration_model.theta.values():
-                reg_loss = reg_loss + torch.pow(theta, 2)
+        if hasattr(med_duration_model, 'theta') and med_duration_model.theta:
+            reg_loss = torch.stack([torch.as_tensor(t) for t in med_duration_model.theta.values()]).pow(2).sum()
         return self.lambda_m * reg_loss
     
     def _parameter_reg(  
         self,
         params: Any
     ) -> torch.Tensor:
-        reg_loss = torch.tensor(0.0, dtype=torch.float32)  
-        if hasattr(params, 'beta1'):
-            for i in range(1, 10):
-                beta = getattr(params, f'beta{i}', None)
-                if beta is not None and isinstance(beta, torch.nn.Parameter):
-                    reg_loss = reg_loss + torch.sum(torch.pow(beta, 2))
-        return 0.001 * reg_loss
+        betas = [getattr(params, f'beta{i}', None) for i in range(1, 10)]
+        betas = [b for b in betas if isinstance(b, torch.nn.Parameter)]
+        if not betas:
+            return torch.tensor(0.0, dtype=torch.float32)
+        return 0.001 * torch.stack([b.reshape(()) for b in betas]).pow(2).sum()
+
+
+def masked_mean(
+    x: torch.Tensor,
+    mask: torch.Tensor,
+    dim: Optional[int] = None,
+    weight: Optional[torch.Tensor] = None,
+) -> torch.Tensor:
+    # mean of x where mask is set, 0 where nothing is. x must be finite everywhere
+    # (nan_to_num the observations first): a NaN outside the mask still poisons the gradient.
+    # weight (broadcastable to x) makes it a weighted mean over the same entries
+    x = torch.where(mask, x, torch.zeros_like(x))
+    m = mask.to(x.dtype)
+    if weight is not None:
+        x = x * weight
+        m = m * weight
+    if dim is None:
+        return x.sum() / m.sum().clamp(min=1.0)
+    return x.sum(dim) / m.sum(dim).clamp(min=1.0)
+
+
+def breakdown(terms: Dict[str, torch.Tensor]) -> Dict[str, float]:
+    # one host sync for the whole dict instead of one .item() per term
+    keys = list(terms)
+    values = torch.stack([terms[k].detach().reshape(()).float() for k in keys]).tolist()
+    return dict(zip(keys, values))
+
+
+def _pad(batch: Union[torch.Tensor, List[torch.Tensor]], value: float) -> torch.Tensor:
+    if isinstance(batch, torch.Tensor):
+        return batch if batch.dim() == 2 else batch.unsqueeze(0)
+    return pad_sequence([torch.as_tensor(b, dtype=torch.float32).reshape(-1) for b in batch],
+                        batch_first=True, padding_value=value)
 
 
 def compute_loss_batch(  
-    predictions: List[torch.Tensor],  
-    observations: List[torch.Tensor], 
-    baselines: List[float], 
+    predictions: Union[torch.Tensor, List[torch.Tensor]],
+    observations: Union[torch.Tensor, List[torch.Tensor]],
+    baselines: Union[torch.Tensor, List[float]],
     loss_fn: GlucoseLoss,
+    return_breakdown: bool = False,
     **kwargs
 ) -> Tuple[torch.Tensor, List[Dict]]: 
-    batch_losses = []
-    loss_dicts = []
-    
-    for pred, obs, baseline in zip(predictions, observations, baselines):
-        loss, loss_dict = loss_fn(
-            pred.unsqueeze(0),
-            obs.unsqueeze(0),
-            torch.tensor([baseline]),  
-            **kwargs
-        )
-        batch_losses.append(loss)
-        loss_dicts.append(loss_dict)
+    """
+    Mean over samples of the per-sample GlucoseLoss, without a per-sample
+    loop: sequences are padded to [B, T] (observations with NaN, so padding
+    is masked out) and each term is a per-row masked mean. Per-sample float
+    dicts are built only with return_breakdown=True (otherwise []).
+    kwargs (hr/hrv tensors, params, med model) apply to every sample, as
+    before.
+    """
+    pred = _pad(predictions, 0.0)
+    obs  = _pad(observations, float("nan"))
+    if obs.shape[1] < pred.shape[1]:
+        obs = torch.nn.functional.pad(obs, (0, pred.shape[1] - obs.shape[1]), value=float("nan"))
+    pred = pred[:, :obs.shape[1]]
+    base = torch.as_tensor(baselines, dtype=pred.dtype).reshape(-1, 1)
+
+    valid = ~torch.isnan(obs)
+    obs0  = torch.nan_to_num(obs)
+    fs = masked_mean(((pred - base) - (obs0 - base)) ** 2, valid, dim=1)                   # [B]
+    w  = masked_mean(torch.clamp(torch.abs(pred - obs0) - loss_fn.delta, min=0.0) ** 2, valid, dim=1)
+
+    shared = loss_fn.batch_terms(
+        pred[:1], obs[:1], base[:1, 0],
+        kwargs.get("params"),
+        kwargs.get("hr_pred"), kwargs.get("hr_obs"),
+        kwargs.get("hrv_predicted"), kwargs.get("hrv_observed"),
+        kwargs.get("med_duration_model"),
+    )
+    per_sample = (
+        loss_fn.lambda_f * fs + loss_fn.lambda_w * w
+        + loss_fn.lambda_p * shared["phys"] + loss_fn.lambda_m * shared["med"] + shared["param_reg"]
+    )
+    batch_loss = per_sample.mean()
+    if not return_breakdown:
+        return batch_loss, []
 
-    batch_loss = torch.mean(torch.stack(batch_losses))
-    return batch_loss, loss_dicts
+    rows = torch.stack([
+        per_sample, fs, w,
+        shared["phys"].expand_as(fs), shared["med"].expand_as(fs), shared["param_reg"].expand_as(fs),
+    ], dim=1).detach().tolist()
+    keys = ("total", "fingerstick", "window", "phys", "med", "param_reg")
+    return batch_loss, [dict(zip(keys, r)) for r in rows]
 
 
 if __name__ == "__main__":
@@ -1,14 +1,52 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import torch
 from ai.models.user.parameters import UserParams
 from ai.simulation.simulate_glucose import simulate_glucose
+NO_MEDICATIONS: Tuple[List[Dict[str, Any]], List[Dict[str, Any]]] = ([], [])
+
+
+def resolve_meal_medications(
+    sequences: List[Dict[str, Any]],
+    medication_schedules: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> List[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+    """
+    (insulin_medications, other_medications) per meal. Training datasets store
+    each schedule once under "medication_schedules" and meals point at it via
+    medication_schedule_id; API payloads may still inline the lists per meal.
+    Meals sharing a schedule share the same list objects.
+    """
+    schedules = medication_schedules or {}
+    resolved: Dict[str, Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]] = {}
+    out = []
+    for s in sequences:
+        sid = s.get('medication_schedule_id')
+        if sid is not None and sid in schedules:
+            if sid not in resolved:
+                sched = schedules[sid]
+                resolved[sid] = (sched.get('insulin_medications', []), sched.get('other_medications', []))
+            out.append(resolved[sid])
+        elif 'insulin_medications' in s or 'other_medications' in s:
+            out.append((s.get('insulin_medications', []), s.get('other_medications', [])))
+        else:
+            out.append(NO_MEDICATIONS)
+    return out
+
+
 def run_glucose_simulation(
     sequences: List[Dict[str, Any]],
     sensor_window: List[Dict[str, Any]],
     params: UserParams,
+    medication_schedules: Optional[Dict[str, Dict[str, Any]]] = None,
+    tbptt_steps: Optional[int] = None,
 ) -> torch.Tensor:
-    
-    G0 = params.Gb
+    """
+    Chains the meals: each meal's simulation starts from the glucose the
+    previous one ended on, so the autograd graph grows with the history.
+    tbptt_steps=K detaches the carried state every K meals, which bounds
+    that graph (and backprop) to K meals; the forward values are the same.
+    Meals are either flat feature dicts (training datasets) or API
+    payloads with the features under "meal_features".
+    """
     time_hours = []
 
     for s in sequences:
@@ -19,32 +57,38 @@ def run_glucose_simulation(
             dt_obj = ts
         time_hours.append(dt_obj.hour + dt_obj.minute / 60.0)
 
-    meals = sequences
+    meals = [
+        {**features, "t_meal": features.get("t_meal", time_hours[i])}
+        for i, features in enumerate(s.get('meal_features', s) for s in sequences)
+    ]
 
-    insulin_medications = [s.get('insulin_medications', []) for s in sequences]
+    meal_meds = resolve_meal_medications(sequences, medication_schedules)
+    insulin_medications = [insulin for insulin, _ in meal_meds]
     insulin_flags = [bool(meds) for meds in insulin_medications]
     insulin_types = [meds[0].get('type') if meds else None for meds in insulin_medications]
-    other_medications = [s.get('other_medications', []) for s in sequences]
+    other_medications = [other for _, other in meal_meds]
     activity = sensor_window
 
-    G = [torch.tensor(G0, dtype=torch.float32)]
+    G = [params.Gb.reshape(1)]
 
     for i in range(len(time_hours) - 1):
         current_time = time_hours[i]
 
         G_next = simulate_glucose(
-            G0=G[i].item() if isinstance(G[i], torch.Tensor) else G[i],
-            time=[current_time, time_hours[i + 1]],  
-            meal=[meals[i]],
-            activity=[activity[i]], 
+            G0=G[i].reshape(()),
+            time=[current_time, time_hours[i + 1]],
+            meals=[meals[i]],
+            activity=[activity[i]],
             insulin_medications=insulin_medications[i] if insulin_flags[i] else [],
             other_medications=other_medications[i],
             params=params,
             insulin=insulin_flags[i],
             insulin_type=insulin_types[i],
-            medication_period=meals[i]['meal_features'].get('medication_period', 'unknown')
+            medication_period=meals[i].get('medication_period', 'unknown')
         )
+        state = G_next[-1].reshape(1)
+        if tbptt_steps and (i + 1) % tbptt_steps == 0:
+            state = state.detach()
+        G.append(state)
 
-        G.append(G_next[-1].detach() if G_next.dim() > 0 else G_next.detach())
-
-    return torch.cat([g.unsqueeze(0) if g.dim() == 0 else g for g in G])
\ No newline at end of file
+    return torch.cat(G)
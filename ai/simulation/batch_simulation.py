@@ -0,0 +1,230 @@
+"""
+Vectorised per-meal simulation: every meal in a batch is simulated
+independently from G0 = Gb over its own post-meal time grid, giving a
+padded [B, T] trajectory in one pass.
+
+Same step equation as models/glucose/dynamics.step_glucose:
+
+    G_{k+1} = G_k + ΔG_k
+    ΔG_k    = β1·C_k·m_c·(1 + ρ·L) + β2·bN + β3·(C_k/100)·bN
+              - β4·iE_k·m_i + β5·A + β6·HRV_drop + β7·HR_pp
+              + β8·(C_k/100)·HRV_drop_norm + β9·bN·HR_response
+
+with C_k the carbs absorbed k steps after the meal and iE_k the
+endogenous + exogenous insulin + medication effect. Data-only terms
+(medication and exogenous insulin curves, night mask) come precomputed
+on the batch.
+
+Each ΔG term is β_i · f_i, where the feature f_i depends on data and a few
+raw parameters (FEATURE_PARAMS). fold_frozen_terms evaluates, once per
+training phase, every term whose β and feature parameters are all frozen
+(summed into one constant [B, T] tensor) and every feature whose
+parameters are frozen; meal_delta_g then only recomputes what the
+unlocked parameters touch.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+import torch
+from ai.models.user.parameters import K_ABS_FIELDS, UserParams
+from ai.models.glucose.absorptions_util import getK_abs_i_batch
+
+
+CARB_PARAMS: Tuple[str, ...] = K_ABS_FIELDS
+
+# term -> (β, raw parameters its feature depends on)
+TERMS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "carb":       ("beta1", CARB_PARAMS),
+    "night":      ("beta2", ()),
+    "night_carb": ("beta3", CARB_PARAMS),
+    "insulin":    ("beta4", CARB_PARAMS + ("delta_u_raw",)),
+    "activity":   ("beta5", ("alpha_activity_raw",)),
+    "hrv_drop":   ("beta6", ()),
+    "hr_post":    ("beta7", ()),
+    "hrv_carb":   ("beta8", CARB_PARAMS),
+    "hr_night":   ("beta9", ()),
+}
+
+
+@dataclass
+class FoldedTerms:
+    delta_g:  torch.Tensor                                              # [B, T] sum of fully frozen terms
+    features: Dict[str, torch.Tensor] = field(default_factory=dict)    # frozen features of live terms
+    terms:    FrozenSet[str]          = frozenset()                     # terms inside delta_g
+
+    def index(self, idx: torch.Tensor) -> "FoldedTerms":
+        return FoldedTerms(
+            delta_g  = self.delta_g.index_select(0, idx),
+            features = {k: v.index_select(0, idx) for k, v in self.features.items()},
+            terms    = self.terms,
+        )
+
+
+def _take(value: Any, idx: torch.Tensor) -> Any:
+    if value is None:
+        return None
+    if isinstance(value, FoldedTerms):
+        return value.index(idx)
+    return value.index_select(0, idx)
+
+
+@dataclass
+class MealBatch:
+    # per meal [B]
+    carbs:          torch.Tensor
+    fiber_ratio:    torch.Tensor
+    fatprotein:     torch.Tensor
+    is_liquid:      torch.Tensor
+    carb_mult:      torch.Tensor
+    insulin_mult:   torch.Tensor
+    activity_feats: torch.Tensor    # [B, 6] in activity_Effect order
+    hrv_drop:       torch.Tensor
+    hrv_post_mean:  torch.Tensor
+    hrv_drop_norm:  torch.Tensor
+    hr_response:    torch.Tensor
+    lengths:        torch.Tensor    # valid steps per meal (long)
+    age_days:       torch.Tensor    # days before the newest meal in the split
+    # per meal per step [B, T]
+    dt_hours:       torch.Tensor    # hours since the meal at each step
+    night:          torch.Tensor    # bN as float
+    ext_insulin:    torch.Tensor    # exogenous insulin + medication effect (param-free)
+    mask:           torch.Tensor    # bool, False on padding
+    # supervision
+    obs_glucose:    torch.Tensor    # [B, T], NaN where no fingerstick
+    hr_obs:         torch.Tensor    # [B]
+    hrv_obs:        torch.Tensor    # [B]
+    G_b:            torch.Tensor    # [B]
+    post_mask:      torch.Tensor    # [B, T] bool, postprandial HR window
+    # set by fold_frozen_terms, valid only while the same parameters stay frozen
+    folded:         Optional[FoldedTerms] = None
+
+    def __len__(self) -> int:
+        return int(self.carbs.shape[0])
+
+    def index(self, idx: torch.Tensor) -> "MealBatch":
+        return MealBatch(**{f.name: _take(getattr(self, f.name), idx) for f in fields(self)})
+
+
+def _carb_terms(batch: MealBatch, params: UserParams) -> Dict[str, torch.Tensor]:
+    k_abs = getK_abs_i_batch(
+        params.k_base,
+        params.su,
+        params.alpha,
+        batch.fiber_ratio,
+        params.eta_liq_u,
+        batch.is_liquid,
+        params.eta_fp_u,
+        batch.fatprotein,
+    ).unsqueeze(1)                                                   # [B, 1]
+    decay    = 1.0 - torch.exp(-batch.dt_hours * k_abs)             # [B, T]
+    absorbed = torch.clamp(batch.carbs.unsqueeze(1) * decay, min=0.0)
+    endo = (
+        batch.carbs.unsqueeze(1) * k_abs * decay
+        * (1.0 - torch.sigmoid(params.delta_u) * batch.night)
+    )
+    return {"absorbed": absorbed, "endo": endo}
+
+
+def _features(batch: MealBatch, params: UserParams, names: Tuple[str, ...]) -> Dict[str, torch.Tensor]:
+    # f_i for the requested terms only; ΔG = Σ β_i · f_i (the insulin feature carries the minus sign)
+    out: Dict[str, torch.Tensor] = {}
+    if any(n in names for n in ("carb", "night_carb", "insulin", "hrv_carb")):
+        carb    = _carb_terms(batch, params)
+        carbS_t = carb["absorbed"] / 100.0
+        if "carb" in names:
+            liquid = batch.is_liquid.float().unsqueeze(1)
+            out["carb"] = carb["absorbed"] * batch.carb_mult.unsqueeze(1) * (1.0 + params.rho * liquid)
+        if "night_carb" in names:
+            out["night_carb"] = carbS_t * batch.night
+        if "insulin" in names:
+            out["insulin"] = -(carb["endo"] + batch.ext_insulin) * batch.insulin_mult.unsqueeze(1)
+        if "hrv_carb" in names:
+            out["hrv_carb"] = carbS_t * batch.hrv_drop_norm.unsqueeze(1)
+    if "night" in names:
+        out["night"] = batch.night
+    if "activity" in names:
+        out["activity"] = (batch.activity_feats * params.alpha_activity).sum(dim=1, keepdim=True)   # [B, 1]
+    if "hrv_drop" in names:
+        out["hrv_drop"] = batch.hrv_drop.unsqueeze(1)
+    if "hr_post" in names:
+        out["hr_post"] = batch.hrv_post_mean.unsqueeze(1)
+    if "hr_night" in names:
+        out["hr_night"] = batch.night * batch.hr_response.unsqueeze(1)
+    return out
+
+
+def fold_frozen_terms(batch: MealBatch, params: UserParams) -> MealBatch:
+    """
+    Copy of `batch` with every term that only depends on frozen parameters
+    (requires_grad False) and data precomputed. Refold whenever the set of
+    trainable parameters or the frozen values change, i.e. once per phase.
+    """
+    frozen = {name for name, p in params.named_parameters() if not p.requires_grad}
+    terms    = frozenset(t for t, (beta, deps) in TERMS.items() if beta in frozen and frozen.issuperset(deps))
+    features = tuple(t for t, (beta, deps) in TERMS.items() if t not in terms and frozen.issuperset(deps))
+    with torch.no_grad():
+        values  = _features(batch, params, tuple(terms) + features)
+        delta_g = torch.zeros_like(batch.dt_hours)
+        for t in terms:
+            delta_g = delta_g + getattr(params, TERMS[t][0]) * values[t]
+    folded = FoldedTerms(delta_g=delta_g, features={t: values[t] for t in features}, terms=terms)
+    return MealBatch(**{**{f.name: getattr(batch, f.name) for f in fields(batch)}, "folded": folded})
+
+
+def meal_delta_g(
+    batch:  MealBatch,
+    params: UserParams,
+    noise:  bool = False,
+) -> torch.Tensor:
+    """ΔG for every meal and step, [B, T]."""
+    folded = batch.folded
+    if folded is None:
+        feats   = _features(batch, params, tuple(TERMS))
+        delta_G = sum(getattr(params, TERMS[t][0]) * feats[t] for t in TERMS)
+    else:
+        live    = tuple(t for t in TERMS if t not in folded.terms and t not in folded.features)
+        feats   = {**folded.features, **_features(batch, params, live)}
+        delta_G = folded.delta_g
+        for t in TERMS:
+            if t not in folded.terms:
+                delta_G = delta_G + getattr(params, TERMS[t][0]) * feats[t]
+    if noise:
+        delta_G = delta_G + torch.randn_like(delta_G) * params.sigma
+    return delta_G
+
+
+def simulate_meal_batch(
+    batch:       MealBatch,
+    params:      UserParams,
+    noise:       bool          = False,
+    tbptt_steps: Optional[int] = None,
+    checkpoint:  bool          = False,
+) -> torch.Tensor:
+    """
+    Returns the [B, T] glucose trajectory; column 0 is G0 = Gb. Values on
+    padded steps (batch.mask False) are meaningless and must be masked out.
+
+    The state recursion G_{k+1} = G_k + ΔG_k is a cumulative sum, so the
+    graph no longer holds one node per step. tbptt_steps=K truncates
+    backprop through the accumulated ΔG: a prediction only sends gradient
+    to the ΔG of its own K-step chunk, while every step still counts in
+    the loss and Gb (each meal's starting state) gets gradient from every
+    step. This shapes the gradient only - the graph is one cumsum either
+    way, so it saves no memory; run_glucose_simulation's tbptt_steps is
+    the one that bounds a graph growing with history. checkpoint=True
+    recomputes the ΔG terms in backward instead of keeping their
+    activations.
+    """
+    if checkpoint and torch.is_grad_enabled():
+        delta_G = torch.utils.checkpoint.checkpoint(meal_delta_g, batch, params, noise, use_reentrant=False)
+    else:
+        delta_G = meal_delta_g(batch, params, noise)
+    B, T = delta_G.shape
+    steps = torch.cat([delta_G.new_zeros(B, 1), delta_G[:, :T - 1]], dim=1)
+    rise = torch.cumsum(steps, dim=1)
+    if tbptt_steps and tbptt_steps < T:
+        # swap each chunk's accumulated rise for its detached value: same forward, cut backward
+        chunk_start = (torch.arange(T) // tbptt_steps) * tbptt_steps
+        start = rise[:, chunk_start]
+        rise = rise - start + start.detach()
+    return params.Gb + rise
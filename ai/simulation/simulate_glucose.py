@@ -27,7 +27,8 @@ def simulate_glucose(
     elif not isinstance(time, torch.Tensor):
         time = torch.tensor([time], dtype=torch.float32)
     
-    G = [torch.tensor(G0, dtype=torch.float32)]
+    # a tensor G0 keeps the incoming state in the graph (run_glucose_simulation chains meals)
+    G = [G0 if isinstance(G0, torch.Tensor) else torch.tensor(G0, dtype=torch.float32)]
     
     for i in range(len(time) - 1):
         current_time = time[i].item() if isinstance(time[i], torch.Tensor) else time[i]
@@ -36,7 +37,7 @@ def simulate_glucose(
         current_sensor = activity[i] if i < len(activity) else None
         # Step glucose forward 
         G_next = step_glucose(
-            G_tilde=G[i].item() if isinstance(G[i], torch.Tensor) else G[i],
+            G_tilde=G[i],
             t=current_time,
             meals=meals,
             activity=[current_sensor] if current_sensor else [],
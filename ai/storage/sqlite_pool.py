@@ -0,0 +1,175 @@
+"""
+Shared read-only SQLite connections for preprocessing, the API and batch
+jobs.
+
+Connections are opened once per database file with a `mode=ro` URI,
+`query_only`, a large page cache and mmap, then reused. A checked-out
+connection belongs to the calling thread until its outermost `with`
+block exits (nested use on the same thread gets the same handle). After
+that it goes back on a per-path idle list, so the next request on any
+thread gets a warm page cache. Handles idle longer than `idle_timeout`
+are closed on the next checkout.
+
+    with connection(db_path) as conn:
+        conn.execute(...)
+"""
+from __future__ import annotations
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+DEFAULT_IDLE_TIMEOUT_SEC = 300.0
+DEFAULT_MAX_IDLE_PER_DB  = 4
+
+READ_PRAGMAS: Tuple[str, ...] = (
+    "PRAGMA query_only = ON",
+    "PRAGMA cache_size = -65536",      # 64 MiB
+    "PRAGMA mmap_size = 268435456",    # 256 MiB
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+def open_read_only(db_path: str, pragmas: Tuple[str, ...] = READ_PRAGMAS) -> sqlite3.Connection:
+    path = Path(db_path).resolve()
+    if not path.exists():
+        raise FileNotFoundError(
+            f"[sqlite_pool] SQLite database not found at '{db_path}'.\n"
+            f"If running locally, export glucose_app.db from the device first."
+        )
+    # check_same_thread=False: idle handles move between threads, but only
+    # one thread ever holds a handle at a time
+    conn = sqlite3.connect(
+        f"file:{quote(str(path))}?mode=ro", uri=True, check_same_thread=False,
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in pragmas:
+        conn.execute(pragma)
+    return conn
+
+
+class ReadOnlyConnectionPool:
+    def __init__(
+        self,
+        idle_timeout:    float           = DEFAULT_IDLE_TIMEOUT_SEC,
+        max_idle_per_db: int             = DEFAULT_MAX_IDLE_PER_DB,
+        pragmas:         Tuple[str, ...] = READ_PRAGMAS,
+    ):
+        self.idle_timeout    = idle_timeout
+        self.max_idle_per_db = max_idle_per_db
+        self.pragmas         = pragmas
+        self._lock  = threading.Lock()
+        self._idle: Dict[str, List[Tuple[sqlite3.Connection, float]]] = {}
+        self._local = threading.local()
+        self._pid   = os.getpid()
+        self.stats  = {"opened": 0, "reused": 0, "evicted": 0}
+
+    def _check_pid(self) -> None:
+        # after fork the inherited handles belong to the parent - forget them, never close them
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._idle  = {}
+                    self._local = threading.local()
+                    self._pid   = os.getpid()
+
+    def _held(self) -> Dict[str, List]:
+        held = getattr(self._local, "held", None)
+        if held is None:
+            held = self._local.held = {}
+        return held
+
+    def _evict_idle(self, now: float) -> List[sqlite3.Connection]:
+        # caller holds the lock
+        stale: List[sqlite3.Connection] = []
+        for key in list(self._idle):
+            keep = []
+            for conn, last_used in self._idle[key]:
+                if now - last_used > self.idle_timeout:
+                    stale.append(conn)
+                else:
+                    keep.append((conn, last_used))
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+        self.stats["evicted"] += len(stale)
+        return stale
+
+    def _checkout(self, key: str) -> sqlite3.Connection:
+        now = time.monotonic()
+        with self._lock:
+            stale = self._evict_idle(now)
+            idle  = self._idle.get(key)
+            conn  = idle.pop()[0] if idle else None
+            if conn is not None:
+                self.stats["reused"] += 1
+        for c in stale:
+            c.close()
+        if conn is None:
+            conn = open_read_only(key, self.pragmas)
+            with self._lock:
+                self.stats["opened"] += 1
+        return conn
+
+    def _checkin(self, key: str, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_db:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self, db_path: str) -> Iterator[sqlite3.Connection]:
+        self._check_pid()
+        key  = str(Path(db_path).resolve())
+        held = self._held()
+        if key in held:
+            # nested use on this thread - hand back the same handle
+            entry = held[key]
+            entry[1] += 1
+            try:
+                yield entry[0]
+            finally:
+                entry[1] -= 1
+            return
+
+        conn = self._checkout(key)
+        held[key] = [conn, 1]
+        try:
+            yield conn
+        finally:
+            del held[key]
+            self._checkin(key, conn)
+
+    def close_idle(self) -> int:
+        with self._lock:
+            conns = [c for entries in self._idle.values() for c, _ in entries]
+            self._idle = {}
+        for c in conns:
+            c.close()
+        return len(conns)
+
+
+_default_pool: Optional[ReadOnlyConnectionPool] = None
+_default_lock = threading.Lock()
+
+
+def get_pool() -> ReadOnlyConnectionPool:
+    global _default_pool
+    if _default_pool is None:
+        with _default_lock:
+            if _default_pool is None:
+                _default_pool = ReadOnlyConnectionPool()
+    return _default_pool
+
+
+def connection(db_path: str):
+    return get_pool().connection(db_path)
@@ -0,0 +1,102 @@
+"""
+One Supabase client per process for the API, preprocessing and training.
+
+create_client used to run on every params fetch, upload and
+preprocessing call, and each one paid for a fresh TLS handshake. Clients
+are now created once per (url, key) on top of an httpx.Client with
+keep-alive, then reused from any thread (httpx clients are thread-safe;
+every query builds its own request). After a fork the child forgets the
+inherited clients without closing them, because their sockets belong to
+the parent, and builds its own on first use.
+
+Tests and local runs can point everything at a stand-in: either set the
+URL to a local Supabase/PostgREST (e.g. `supabase start`), or install a
+factory that returns any object with the same .table(...) interface.
+
+    sb = get_supabase()                       # EXPO_PUBLIC_SUPABASE_URL / _KEY
+    set_client_factory(lambda url, key: FakeSupabase())
+"""
+from __future__ import annotations
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+DEFAULT_TIMEOUT_S        = 30.0
+DEFAULT_KEEPALIVE_S      = 60.0
+DEFAULT_MAX_KEEPALIVE    = 10
+
+ClientFactory = Callable[[str, str], Any]
+
+
+def _credentials(url: Optional[str], key: Optional[str]) -> Tuple[str, str]:
+    url = url or os.environ.get("EXPO_PUBLIC_SUPABASE_URL")
+    key = key or os.environ.get("EXPO_PUBLIC_SUPABASE_KEY")
+    if not url or not key:
+        raise EnvironmentError("Supabase credential not set")
+    return url, key
+
+
+def create_keepalive_client(url: str, key: str) -> Any:
+    import httpx
+    from supabase import ClientOptions, create_client
+    http = httpx.Client(
+        timeout = DEFAULT_TIMEOUT_S,
+        limits  = httpx.Limits(max_keepalive_connections=DEFAULT_MAX_KEEPALIVE,
+                               keepalive_expiry=DEFAULT_KEEPALIVE_S),
+    )
+    return create_client(url, key, options=ClientOptions(httpx_client=http))
+
+
+class SupabaseClients:
+    def __init__(self, factory: ClientFactory = create_keepalive_client):
+        self.factory  = factory
+        self._lock    = threading.Lock()
+        self._clients: Dict[Tuple[str, str], Any] = {}
+        self._pid     = os.getpid()
+        self.stats    = {"created": 0, "reused": 0}
+
+    def _check_pid(self) -> None:
+        # caller holds the lock; inherited clients share the parent's sockets - drop, never close
+        if self._pid != os.getpid():
+            self._clients = {}
+            self._pid     = os.getpid()
+
+    def get(self, url: Optional[str] = None, key: Optional[str] = None) -> Any:
+        creds = _credentials(url, key)
+        with self._lock:
+            self._check_pid()
+            client = self._clients.get(creds)
+            if client is not None:
+                self.stats["reused"] += 1
+                return client
+            # created under the lock so racing threads never build two
+            client = self._clients[creds] = self.factory(*creds)
+            self.stats["created"] += 1
+            return client
+
+    def set_factory(self, factory: Optional[ClientFactory]) -> None:
+        # None restores the real client; existing clients are dropped either way
+        with self._lock:
+            self.factory  = factory or create_keepalive_client
+            self._clients = {}
+
+
+_default_clients: Optional[SupabaseClients] = None
+_default_lock = threading.Lock()
+
+
+def get_clients() -> SupabaseClients:
+    global _default_clients
+    if _default_clients is None:
+        with _default_lock:
+            if _default_clients is None:
+                _default_clients = SupabaseClients()
+    return _default_clients
+
+
+def get_supabase(url: Optional[str] = None, key: Optional[str] = None) -> Any:
+    return get_clients().get(url, key)
+
+
+def set_client_factory(factory: Optional[ClientFactory]) -> None:
+    get_clients().set_factory(factory)
@@ -0,0 +1,150 @@
+"""
+Debounced background checkpoint writes.
+
+Validation improves almost every epoch early in a phase, and a
+synchronous torch.save per improvement dominates training time on slow or
+network filesystems. The trainer keeps the best state in memory and hands
+each new best to a CheckpointWriter. A background thread writes only the
+latest payload per path, at most once every `min_interval_s` seconds
+and/or `min_interval_epochs` epochs. flush() writes whatever is still
+pending and waits, so the file on disk always ends up at the final best.
+
+    writer = CheckpointWriter(min_interval_s=30)
+    writer.submit(path, {"params": snapshot_state(params), ...}, epoch=epoch)
+    ...
+    writer.close()     # final flush
+"""
+from __future__ import annotations
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+import torch
+
+DEFAULT_MIN_INTERVAL_S = 30.0
+
+
+def snapshot_state(module: torch.nn.Module) -> Dict[str, torch.Tensor]:
+    # detached copy - later optimizer steps must not leak into the saved best
+    return {k: v.detach().clone() for k, v in module.state_dict().items()}
+
+
+def save_atomic(payload: Any, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        torch.save(payload, tmp)
+        os.chmod(tmp, 0o644)   # mkstemp creates 0600
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+class CheckpointWriter:
+    def __init__(
+        self,
+        min_interval_s:      Optional[float] = DEFAULT_MIN_INTERVAL_S,
+        min_interval_epochs: Optional[int]   = None,
+    ):
+        self.min_interval_s      = min_interval_s
+        self.min_interval_epochs = min_interval_epochs
+        self._cond    = threading.Condition()
+        self._pending: Dict[Path, Tuple[Any, int]] = {}
+        self._last:    Dict[Path, Tuple[float, int]] = {}   # path -> (monotonic time, epoch) of last write
+        self._busy    = False
+        self._closed  = False
+        self._error: Optional[BaseException] = None
+        self.stats    = {"submitted": 0, "written": 0}
+        self._thread  = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, path: Path, payload: Any, epoch: int = 0) -> None:
+        # payload must already be a snapshot (see snapshot_state); a newer submit replaces an unwritten one
+        with self._cond:
+            self._raise_error()
+            if self._closed:
+                raise RuntimeError("[checkpoint] writer is closed")
+            self._pending[Path(path)] = (payload, epoch)
+            self.stats["submitted"] += 1
+            self._cond.notify_all()
+
+    def _wait_time(self, path: Path, epoch: int, now: float) -> Optional[float]:
+        # 0 = write now, >0 = seconds to wait, None = wait for a later epoch
+        if path not in self._last:
+            return 0.0
+        last_t, last_epoch = self._last[path]
+        if self.min_interval_epochs is not None and epoch - last_epoch < self.min_interval_epochs:
+            return None
+        if self.min_interval_s is not None:
+            return max(0.0, last_t + self.min_interval_s - now)
+        return 0.0
+
+    def _next_due(self, force: bool) -> Tuple[Optional[Path], Optional[float]]:
+        # caller holds the lock
+        now, timeout = time.monotonic(), None
+        for path, (_, epoch) in self._pending.items():
+            wait = 0.0 if force else self._wait_time(path, epoch, now)
+            if wait == 0.0:
+                return path, None
+            if wait is not None:
+                timeout = wait if timeout is None else min(timeout, wait)
+        return None, timeout
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    path, timeout = self._next_due(force=self._closed)
+                    if path is not None or (self._closed and not self._pending):
+                        break
+                    self._cond.wait(timeout)
+                if path is None:
+                    return
+                payload, epoch = self._pending.pop(path)
+                self._busy = True
+            try:
+                save_atomic(payload, path)
+                with self._cond:
+                    self._last[path] = (time.monotonic(), epoch)
+                    self.stats["written"] += 1
+            except BaseException as e:
+                with self._cond:
+                    self._error = e
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise RuntimeError(f"[checkpoint] background write failed: {err}") from err
+
+    def flush(self) -> None:
+        # write everything pending now, ignoring the debounce, and wait for it
+        with self._cond:
+            for path in list(self._pending):
+                self._last.pop(path, None)
+            self._cond.notify_all()
+            while self._pending or self._busy:
+                self._cond.wait()
+            self._raise_error()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        with self._cond:
+            self._raise_error()
+
+    def __enter__(self) -> "CheckpointWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
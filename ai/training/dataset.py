@@ -0,0 +1,199 @@
+"""
+Columnar meal dataset for mini-batch training.
+
+Built once per split from the dicts load_training_data returns. Every
+per-meal field becomes one tensor, and data-only curves (medication and
+exogenous insulin effect, night mask) are precomputed on the [N, T]
+post-meal grid. A batch is then a handful of index_select calls.
+
+Each meal gets its own grid of `horizon_minutes / dt_minutes + 1` steps
+starting at the meal. The grid is cut short (padded and masked) where the
+next meal in the split starts, because the simulator treats meals as
+independent.
+"""
+from __future__ import annotations
+import math
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+import numpy as np
+import torch
+
+from ai.models.glucose.dynamics import MEDICATION_EFFECTS
+from ai.models.glucose.medication import calculate_exo_insulin
+from ai.simulation._run_glucose_simulation import resolve_meal_medications
+from ai.models.user.parameters import UserParams
+from ai.simulation.batch_simulation import MealBatch, fold_frozen_terms
+from components.ai_medication.convert_medication_period import convert_medication_period
+from components.ai_medication.med_durationmodel import Med_class_prior_duation
+
+DEFAULT_DT_MINUTES      = 5.0
+DEFAULT_HORIZON_MINUTES = 120.0
+POST_HR_START_MIN       = 15.0
+POST_HR_END_MIN         = 90.0
+
+
+def _parse_ts(ts: Any) -> datetime:
+    if isinstance(ts, str):
+        return datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    return ts
+
+
+def _is_night(hours: np.ndarray) -> np.ndarray:
+    h = np.mod(hours, 24.0)
+    return ((h >= 22) | (h < 6)).astype(np.float32)
+
+
+def _med_effect_curve(meds: List[Dict[str, Any]], t: np.ndarray) -> np.ndarray:
+    # vectorised calculate_med_effect with theta = 0 (prior durations)
+    total = np.zeros_like(t)
+    for med in meds:
+        dose = med.get("dose", 0) or 0
+        if med.get("med_id") is None or dose <= 0:
+            continue
+        prior = Med_class_prior_duation.get(med.get("med_class"))
+        if prior is None:
+            continue
+        w_k = prior / 3.0
+        total += dose * np.exp(-(((t - med.get("t_k", 0)) / w_k) ** 2))
+    return total
+
+
+def _exo_insulin_curve(
+    insulin_meds: List[Dict[str, Any]],
+    t:            np.ndarray,
+) -> np.ndarray:
+    insulin_type = insulin_meds[0].get("type") if insulin_meds else None
+    if not insulin_meds or not insulin_type:
+        return np.zeros_like(t)
+    return np.array(
+        [float(calculate_exo_insulin(float(tk), insulin_type, insulin_meds, None)) for tk in t],
+        dtype=np.float32,
+    )
+
+
+class MealSequenceDataset:
+    def __init__(self, data: MealBatch, dt_minutes: float, horizon_minutes: float):
+        self.data            = data
+        self.dt_minutes      = dt_minutes
+        self.horizon_minutes = horizon_minutes
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def n_steps(self) -> int:
+        return int(self.data.dt_hours.shape[1])
+
+    @classmethod
+    def from_split(
+        cls,
+        seqs:            Dict,
+        dt_minutes:      float = DEFAULT_DT_MINUTES,
+        horizon_minutes: float = DEFAULT_HORIZON_MINUTES,
+    ) -> "MealSequenceDataset":
+        meals   = seqs.get("meal_features", [])
+        sensors = seqs.get("sensor_windows", [])
+        sticks  = seqs.get("fingersticks", [None] * len(meals))
+        n       = len(meals)
+        T       = int(round(horizon_minutes / dt_minutes)) + 1
+
+        offsets_min = np.arange(T, dtype=np.float32) * dt_minutes
+        dt_hours    = np.tile(offsets_min / 60.0, (n, 1))
+
+        ts        = [_parse_ts(m["timestamp"]) for m in meals]
+        unix      = np.array([t.timestamp() for t in ts], dtype=np.float64)
+        meal_hour = np.array([m.get("hour", t.hour + t.minute / 60.0) for m, t in zip(meals, ts)],
+                             dtype=np.float32)
+        grid_hour = meal_hour[:, None] + dt_hours
+
+        # cut each grid where the next meal in this split starts
+        lengths = np.full(n, T, dtype=np.int64)
+        order   = np.argsort(unix, kind="stable")
+        for a, b in zip(order[:-1], order[1:]):
+            gap_min = (unix[b] - unix[a]) / 60.0
+            lengths[a] = min(T, max(1, int(math.floor(gap_min / dt_minutes)) + 1))
+        mask = np.arange(T)[None, :] < lengths[:, None]
+
+        meal_meds   = resolve_meal_medications(meals, seqs.get("medication_schedules"))
+        ext_insulin = np.zeros((n, T), dtype=np.float32)
+        carb_mult   = np.ones(n, dtype=np.float32)
+        insul_mult  = np.ones(n, dtype=np.float32)
+        for i, m in enumerate(meals):
+            period  = m.get("medication_period", "unknown")
+            effect  = MEDICATION_EFFECTS.get(period, MEDICATION_EFFECTS["unknown"])
+            carb_mult[i]  = effect["carb_mult"]
+            insul_mult[i] = effect["insulin_mult"]
+            insulin, other = meal_meds[i]
+            meds = (convert_medication_period(period, float(meal_hour[i])) or []) + list(other or [])
+            ext_insulin[i] = _med_effect_curve(meds, grid_hour[i]) + _exo_insulin_curve(insulin, grid_hour[i])
+
+        def sensor_col(key: str) -> np.ndarray:
+            return np.array([float(s.get(key, 0.0) or 0.0) for s in sensors], dtype=np.float32)
+
+        # activity_Effect feature order: VM_avg, VM_peak, HR_postprandial, HRV_response, step_freq, -sedentary
+        activity_feats = np.stack([
+            sensor_col("activity_mean"),
+            sensor_col("hr_peak"),
+            sensor_col("hrv_post_mean"),
+            sensor_col("hrv_baseline"),
+            sensor_col("real_packet_count"),
+            np.zeros(n, dtype=np.float32),
+        ], axis=1) if n else np.zeros((0, 6), dtype=np.float32)
+
+        obs_glucose = np.full((n, T), np.nan, dtype=np.float32)
+        for i, fs in enumerate(sticks):
+            if fs is None:
+                continue
+            off_min = (_parse_ts(fs["timestamp"]).timestamp() - unix[i]) / 60.0
+            k = int(round(off_min / dt_minutes))
+            obs_glucose[i, min(max(k, 0), lengths[i] - 1)] = float(fs["glucose_mg_dl"])
+
+        post_mask = (offsets_min[None, :] >= POST_HR_START_MIN) & (offsets_min[None, :] <= POST_HR_END_MIN) & mask
+        # meals cut before the HR window fall back to their last valid step
+        no_post = ~post_mask.any(axis=1)
+        post_mask[np.nonzero(no_post)[0], np.maximum(lengths[no_post] - 1, 0)] = True
+
+        f32 = lambda a: torch.as_tensor(a, dtype=torch.float32)
+        data = MealBatch(
+            carbs          = f32([float(m["carbs"]) for m in meals]),
+            fiber_ratio    = f32([float(m.get("fiber_ratio", 0.0)) for m in meals]),
+            fatprotein     = f32([float(m.get("fatprotein", 0.0)) for m in meals]),
+            is_liquid      = torch.as_tensor([bool(m.get("is_liquid", False)) for m in meals], dtype=torch.bool),
+            carb_mult      = f32(carb_mult),
+            insulin_mult   = f32(insul_mult),
+            activity_feats = f32(activity_feats),
+            hrv_drop       = f32(sensor_col("hrv_drop")),
+            hrv_post_mean  = f32(sensor_col("hrv_post_mean")),
+            hrv_drop_norm  = f32(sensor_col("hrv_drop_norm")),
+            hr_response    = f32(sensor_col("hr_response")),
+            lengths        = torch.as_tensor(lengths, dtype=torch.long),
+            age_days       = f32((unix.max() - unix) / 86400.0 if n else unix),
+            dt_hours       = f32(dt_hours),
+            night          = f32(_is_night(grid_hour)),
+            ext_insulin    = f32(ext_insulin),
+            mask           = torch.as_tensor(mask, dtype=torch.bool),
+            obs_glucose    = f32(obs_glucose),
+            hr_obs         = f32(sensor_col("hr_postprandial")),
+            hrv_obs        = f32(sensor_col("hrv_drop_norm")),
+            G_b            = f32(sensor_col("hr_baseline")),
+            post_mask      = torch.as_tensor(post_mask, dtype=torch.bool),
+        )
+        return cls(data, dt_minutes, horizon_minutes)
+
+    def fold_frozen(self, params: UserParams) -> "MealSequenceDataset":
+        # same meals with the frozen-parameter terms precomputed (see fold_frozen_terms)
+        return MealSequenceDataset(fold_frozen_terms(self.data, params), self.dt_minutes, self.horizon_minutes)
+
+    def batch(self, idx: torch.Tensor) -> MealBatch:
+        return self.data.index(idx)
+
+    def iter_batches(
+        self,
+        batch_size: int,
+        generator:  Optional[torch.Generator] = None,
+        shuffle:    bool                      = True,
+    ) -> Iterator[MealBatch]:
+        n = len(self)
+        order = torch.randperm(n, generator=generator) if shuffle else torch.arange(n)
+        for start in range(0, n, batch_size):
+            yield self.batch(order[start:start + batch_size])
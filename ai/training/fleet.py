@@ -0,0 +1,200 @@
+"""
+Nightly retraining for many users on one multi-core box.
+
+Runs train_user_model for N users at once, one worker process each.
+Every worker is pinned to its own slice of the cores (sched_setaffinity
+where the OS has it) and to a matching torch.set_num_threads budget, so
+concurrent users do not oversubscribe the machine with intra-op threads.
+
+Jobs are scheduled largest dataset first (bytes on disk of the cached
+preprocess_fleet file, or of the user's database, as a proxy for meal
+count): long users start early and short ones fill the gaps at the end,
+which keeps the makespan close to the longest single user. With a
+deadline, no new user is started once it has passed; those users come
+back as "skipped".
+
+    train_fleet(["datasets/u1.json", "datasets/u2.json"], "runs/nightly",
+                max_workers=4, base_kwargs={"batch_size": 32})
+
+Results land in fleet_train_summary.json in out_dir.
+"""
+from __future__ import annotations
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from ai.data.fleet import peek_user_id, write_json_atomic
+
+SUMMARY_FILE = "fleet_train_summary.json"
+
+_worker_cores: List[int] = []
+
+
+def _normalise_job(job: Union[str, Dict]) -> Dict:
+    # a bare string is a preprocess_fleet dataset file
+    if isinstance(job, str):
+        job = {"dataset_file": job}
+    job = dict(job)
+    if not job.get("user_id"):
+        if not job.get("dataset_file"):
+            raise ValueError(f"[fleet] job has neither user_id nor dataset_file: {job}")
+        job["user_id"] = peek_user_id(job["dataset_file"]) or Path(job["dataset_file"]).stem
+    return job
+
+
+def job_size(job: Dict) -> int:
+    for key in ("dataset_file", "db_path"):
+        path = job.get(key)
+        if path and os.path.exists(path):
+            return os.path.getsize(path)
+    return 0
+
+
+def core_slices(max_workers: int, threads_per_worker: Optional[int] = None) -> List[List[int]]:
+    # one core set per worker, disjoint unless workers x threads exceeds the usable cores
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    per = threads_per_worker or max(1, len(cores) // max_workers)
+    return [[cores[(i * per + j) % len(cores)] for j in range(per)] for i in range(max_workers)]
+
+
+def _init_worker(slots: "multiprocessing.Queue") -> None:
+    # each worker process claims one core slice for its whole life
+    import torch
+    global _worker_cores
+    _worker_cores = slots.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, _worker_cores)
+    torch.set_num_threads(len(_worker_cores))
+    torch.set_num_interop_threads(1)
+
+
+def _train_user(job: Dict, out_dir: str, base_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    # runs in the worker process - never raises, failures come back as a status row
+    from ai.training.train import extract_params_dict, train_user_model
+    t0 = time.perf_counter()
+    user_id = job["user_id"]
+    row: Dict[str, Any] = {"user_id": user_id, "cores": _worker_cores}
+    try:
+        kwargs = {"checkpoint_dir": str(Path(out_dir) / "checkpoints"), **base_kwargs,
+                  **{k: v for k, v in job.items() if k != "user_id"}}
+        params = train_user_model(user_id=user_id, **kwargs)
+        with open(Path(kwargs["checkpoint_dir"]) / user_id / "loss_history.json") as f:
+            history = json.load(f)
+        row.update({
+            "status":         "ok",
+            "best_val":       {phase: h.get("best_val") for phase, h in history.items()},
+            "epochs_run":     sum(h.get("epochs_run", len(h.get("train", []))) for h in history.values()),
+            "learned_params": extract_params_dict(params),
+        })
+    except Exception as e:
+        row.update({"status": "error", "error": f"{type(e).__name__}: {e}", "trace": traceback.format_exc()})
+    row["seconds"] = round(time.perf_counter() - t0, 3)
+    return row
+
+
+def train_fleet(
+    jobs:               List[Union[str, Dict]],
+    out_dir:            str,
+    max_workers:        Optional[int]            = None,
+    threads_per_worker: Optional[int]            = None,
+    base_kwargs:        Optional[Dict[str, Any]] = None,
+    deadline_s:         Optional[float]          = None,
+) -> List[Dict[str, Any]]:
+    """
+    jobs: preprocess_fleet dataset files, or dicts of train_user_model
+          kwargs with a "user_id" and/or "dataset_file" (per-job kwargs
+          override base_kwargs).
+    Threads default to an even split of the usable cores over max_workers
+    (default: one single-threaded worker per core). deadline_s counts
+    from the call.
+    """
+    jobs = [_normalise_job(j) for j in jobs]
+    n_cores     = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    max_workers = max(1, min(max_workers or n_cores, len(jobs) or 1))
+    slices      = core_slices(max_workers, threads_per_worker)
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+
+    # largest first; the pool is fed one job per free worker so the order holds.
+    # jobs are tracked by index: the same user may appear more than once
+    sizes = [job_size(j) for j in jobs]
+    queue = sorted(range(len(jobs)), key=sizes.__getitem__)
+    print(f"\n[fleet] Training {len(jobs)} users with {max_workers} workers x "
+          f"{len(slices[0])} threads -> {out_dir}")
+
+    t0 = time.perf_counter()
+    results: List[Dict[str, Any]] = []
+    pending: Dict[Future, int] = {}
+    slots = multiprocessing.Queue()
+    for cores in slices:
+        slots.put(cores)
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(slots,)) as pool:
+        while queue or pending:
+            while queue and len(pending) < max_workers:
+                if deadline_s is not None and time.perf_counter() - t0 > deadline_s:
+                    for i in reversed(queue):
+                        results.append({"user_id": jobs[i]["user_id"], "status": "skipped",
+                                        "error": "deadline reached", "seconds": 0.0, "size_bytes": sizes[i]})
+                        print(f"  [fleet] {jobs[i]['user_id']}: skipped (deadline)")
+                    queue = []
+                    break
+                i = queue.pop()
+                pending[pool.submit(_train_user, jobs[i], out_dir, base_kwargs or {})] = i
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                i = pending.pop(fut)
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    # worker died outright (OOM kill, segfault) - record and move on
+                    result = {"user_id": jobs[i]["user_id"], "status": "error",
+                              "error": f"{type(e).__name__}: {e}", "seconds": 0.0}
+                result["size_bytes"] = sizes[i]
+                results.append(result)
+                if result["status"] == "ok":
+                    print(f"  [fleet] {result['user_id']}: ok ({result['epochs_run']} epochs, "
+                          f"{result['seconds']}s on cores {result['cores']})")
+                else:
+                    print(f"  [fleet] {result['user_id']}: FAILED - {result['error']}")
+
+    wall   = time.perf_counter() - t0
+    n_ok   = sum(1 for r in results if r["status"] == "ok")
+    busy_s = sum(r["seconds"] for r in results)
+    summary = {
+        "n_users":     len(jobs),
+        "n_ok":        n_ok,
+        "n_failed":    sum(1 for r in results if r["status"] == "error"),
+        "n_skipped":   sum(1 for r in results if r["status"] == "skipped"),
+        "max_workers": max_workers,
+        "threads_per_worker": len(slices[0]),
+        "seconds":     round(wall, 3),
+        # share of worker-time spent training; low means stragglers or too many workers
+        "utilisation": round(busy_s / (wall * max_workers), 3) if wall > 0 else None,
+        "results":     [{k: v for k, v in r.items() if k != "trace"} for r in results],
+    }
+    write_json_atomic(Path(out_dir) / SUMMARY_FILE, summary)
+    print(f"[fleet] Done - {n_ok}/{len(jobs)} users ok in {summary['seconds']}s "
+          f"(utilisation {summary['utilisation']})")
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 3:
+        print("Usage: python -m ai.training.fleet <jobs.json> <out_dir> [max_workers]")
+        print('  jobs.json: ["datasets/u1.json", ...] or [{"user_id": ..., "dataset_file": ...}, ...]')
+        sys.exit(1)
+    with open(sys.argv[1]) as f:
+        fleet_jobs = json.load(f)
+    train_fleet(
+        jobs        = fleet_jobs,
+        out_dir     = sys.argv[2],
+        max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else None,
+    )
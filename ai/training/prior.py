@@ -0,0 +1,150 @@
+"""
+Population prior for initialising new users.
+
+A new user otherwise starts from the generic constants in UserParams and
+phase 1 spends most of its epochs walking Gb / beta1 away from them. The
+prior is the per-field median of every trained user's user_model_params
+row, plus one median per medication-class mix ("metformin+sulfonylurea",
+"none", ...) for mixes with at least `min_cluster_size` users. It is
+rebuilt periodically (e.g. after the nightly fleet run) and stored as a
+local JSON file, so training never waits on Supabase for it.
+
+    rebuild_prior("./population_prior.json")
+    train_user_model("u9", population_prior="./population_prior.json")
+
+No demographic columns exist yet; the cluster key is the medication mix
+only.
+"""
+from __future__ import annotations
+import json
+import math
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from ai.data.fleet import write_json_atomic
+from ai.models.user.parameters import UserParams, params_from_dict
+from ai.storage.supabase_client import get_supabase
+
+DEFAULT_PRIOR_PATH    = os.environ.get("POPULATION_PRIOR_PATH", "./population_prior.json")
+DEFAULT_MIN_CLUSTER   = 5
+GLOBAL_KEY            = "global"
+
+# learned fields only - the lambda_* loss weights are configuration, not per-user physiology
+PRIOR_FIELDS = (
+    "Gb", "beta1", "beta2", "beta3", "beta4", "beta5",
+    "su", "k_base", "alpha", "eta_liq_u", "eta_fp_u", "delta_u",
+    "alpha_activity_raw",
+)
+
+
+def med_mix_key(med_classes: Iterable[Optional[str]]) -> str:
+    classes = sorted({c.strip().lower() for c in med_classes if c})
+    return "+".join(classes) if classes else "none"
+
+
+def _median_row(rows: List[Mapping[str, Any]]) -> Dict[str, Any]:
+    # per field, over the rows that have a finite value for it
+    out: Dict[str, Any] = {}
+    for name in PRIOR_FIELDS:
+        values = [r[name] for r in rows if r.get(name) is not None]
+        if name == "alpha_activity_raw":
+            values = [v for v in values if isinstance(v, list) and len(v) == 6]
+            if values:
+                out[name] = np.median(np.array(values, dtype=np.float64), axis=0).tolist()
+            continue
+        values = [float(v) for v in values if math.isfinite(float(v))]
+        if values:
+            out[name] = float(np.median(values))
+    return out
+
+
+def build_prior(
+    rows:             List[Mapping[str, Any]],
+    med_classes:      Optional[Mapping[str, List[str]]] = None,
+    min_cluster_size: int                               = DEFAULT_MIN_CLUSTER,
+) -> Dict[str, Any]:
+    """
+    rows: user_model_params rows (or fleet results' learned_params with a
+    user_id). med_classes: user_id -> active med classes; users missing
+    from it only count towards the global median.
+    """
+    groups: Dict[str, List[Mapping[str, Any]]] = {}
+    for r in rows:
+        if med_classes is not None and r.get("user_id") in med_classes:
+            groups.setdefault(med_mix_key(med_classes[r["user_id"]]), []).append(r)
+    clusters = {
+        key: {"n_users": len(members), "params": _median_row(members)}
+        for key, members in sorted(groups.items()) if len(members) >= min_cluster_size
+    }
+    return {
+        "created_at": time.time(),
+        "n_users":    len(rows),
+        GLOBAL_KEY:   {"n_users": len(rows), "params": _median_row(rows)},
+        "clusters":   clusters,
+    }
+
+
+def fetch_population_rows(
+    supabase_url: Optional[str] = None,
+    supabase_key: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Dict[str, List[str]]]:
+    # every user_model_params row, and each user's active medication classes
+    sb = get_supabase(supabase_url, supabase_key)
+    rows = sb.table("user_model_params").select("*").execute().data or []
+    meds = sb.table("medication").select("user_id, med_class").eq("isActive", True).execute().data or []
+    med_classes: Dict[str, List[str]] = {r["user_id"]: [] for r in rows}
+    for m in meds:
+        if m.get("user_id") in med_classes:
+            med_classes[m["user_id"]].append(m.get("med_class"))
+    return rows, med_classes
+
+
+def rebuild_prior(
+    path:             str                                = DEFAULT_PRIOR_PATH,
+    rows:             Optional[List[Mapping[str, Any]]]  = None,
+    med_classes:      Optional[Mapping[str, List[str]]]  = None,
+    min_cluster_size: int                                = DEFAULT_MIN_CLUSTER,
+    supabase_url:     Optional[str]                      = None,
+    supabase_key:     Optional[str]                      = None,
+) -> Dict[str, Any]:
+    if rows is None:
+        rows, med_classes = fetch_population_rows(supabase_url, supabase_key)
+    prior = build_prior(rows, med_classes, min_cluster_size)
+    write_json_atomic(Path(path), prior)
+    print(f"[prior] Built from {prior['n_users']} users, {len(prior['clusters'])} med-mix clusters -> {path}")
+    return prior
+
+
+def load_prior(path: str = DEFAULT_PRIOR_PATH) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"    [prior] WARNING: Could not read prior {path}: {e}")
+        return None
+
+
+def prior_params(prior: Mapping[str, Any], med_classes: Iterable[Optional[str]]) -> Tuple[UserParams, str]:
+    # the user's med-mix cluster when there is one, the global median otherwise
+    key = med_mix_key(med_classes)
+    entry = prior.get("clusters", {}).get(key)
+    if entry is None:
+        key, entry = GLOBAL_KEY, prior[GLOBAL_KEY]
+    return params_from_dict(entry["params"]), key
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
+        print("Usage: python -m ai.training.prior [out.json] [min_cluster_size]")
+        sys.exit(0)
+    rebuild_prior(
+        path             = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PRIOR_PATH,
+        min_cluster_size = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_MIN_CLUSTER,
+    )
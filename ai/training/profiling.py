@@ -0,0 +1,127 @@
+"""
+Opt-in per-stage profiling for _train_phase.
+
+The trainer wraps its hot paths in `profiler.stage(name)`: simulate,
+loss, backward, step, validate, checkpoint. Each stage records wall time
+and the net change in live Python allocation blocks
+(sys.getallocatedblocks, cheap enough to leave on for a whole run);
+track_memory=True adds tracemalloc bytes and peaks, at a real slowdown;
+a stage's peak includes the stages nested inside it.
+Stages also show up as named ranges in torch.profiler traces, which are
+captured only for the chosen epochs.
+
+A disabled profiler (NULL_PROFILER) makes every stage a no-op, so the
+instrumented code costs nothing in normal runs.
+"""
+from __future__ import annotations
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+import torch
+
+STAGES = ("simulate", "loss", "backward", "step", "validate", "checkpoint")
+
+
+class StageProfiler:
+    def __init__(self, enabled: bool = True, track_memory: bool = False):
+        self.enabled      = enabled
+        self.track_memory = enabled and track_memory
+        self.epochs: List[Dict[str, Any]] = []
+        self._current: Optional[Dict[str, Any]] = None
+        self._epoch_t0 = 0.0
+        self._open_peaks: List[int] = []   # running tracemalloc peak of each open stage, outermost first
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        blocks0 = sys.getallocatedblocks()
+        if self.track_memory:
+            # tracemalloc keeps a single peak: fold it into the enclosing stage before resetting
+            if self._open_peaks:
+                self._open_peaks[-1] = max(self._open_peaks[-1], tracemalloc.get_traced_memory()[1])
+            self._open_peaks.append(0)
+            tracemalloc.reset_peak()
+            mem0 = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        try:
+            with torch.profiler.record_function(name):
+                yield
+        finally:
+            if self.track_memory:
+                # this stage's peak covers its nested stages, and counts towards the enclosing one
+                peak = max(self._open_peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if self._open_peaks:
+                    self._open_peaks[-1] = max(self._open_peaks[-1], peak)
+        seconds = time.perf_counter() - t0
+        if self._current is None:
+            return
+        rec = self._current["stages"].setdefault(name, {"seconds": 0.0, "calls": 0, "alloc_blocks": 0})
+        rec["seconds"]      += seconds
+        rec["calls"]        += 1
+        rec["alloc_blocks"] += sys.getallocatedblocks() - blocks0
+        if self.track_memory:
+            mem1 = tracemalloc.get_traced_memory()[0]
+            rec["alloc_bytes"] = rec.get("alloc_bytes", 0) + (mem1 - mem0)
+            rec["peak_bytes"]  = max(rec.get("peak_bytes", 0), peak - mem0)
+
+    def start_epoch(self, phase: int, epoch: int) -> None:
+        if not self.enabled:
+            return
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._current  = {"phase": phase, "epoch": epoch, "stages": {}}
+        self._epoch_t0 = time.perf_counter()
+
+    def end_epoch(self) -> None:
+        if not self.enabled or self._current is None:
+            return
+        self._current["seconds"] = time.perf_counter() - self._epoch_t0
+        self.epochs.append(self._current)
+        self._current = None
+
+    def stop(self) -> None:
+        if self.track_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def summary(self) -> Dict[str, Any]:
+        # per phase: stage totals, mean per epoch and share of epoch time, plus the raw epochs
+        phases: Dict[str, Dict[str, Any]] = {}
+        for rec in self.epochs:
+            ph = phases.setdefault(f"phase{rec['phase']}", {"epochs": 0, "seconds": 0.0, "stages": {}, "per_epoch": []})
+            ph["epochs"]  += 1
+            ph["seconds"] += rec["seconds"]
+            ph["per_epoch"].append(rec)
+            for name, st in rec["stages"].items():
+                agg = ph["stages"].setdefault(name, {"seconds": 0.0, "calls": 0, "alloc_blocks": 0})
+                for key, value in st.items():
+                    agg[key] = max(agg.get(key, 0), value) if key == "peak_bytes" else agg.get(key, 0) + value
+        for ph in phases.values():
+            for st in ph["stages"].values():
+                st["mean_seconds_per_epoch"] = st["seconds"] / ph["epochs"]
+                st["share"] = st["seconds"] / ph["seconds"] if ph["seconds"] else 0.0
+            ph["unaccounted_seconds"] = ph["seconds"] - sum(st["seconds"] for st in ph["stages"].values())
+        return {"track_memory": self.track_memory, "phases": phases}
+
+
+NULL_PROFILER = StageProfiler(enabled=False)
+
+
+def epoch_trace(trace_dir: Optional[Path], phase: int, epoch: int, epochs_to_trace: Optional[List[int]]):
+    """
+    torch.profiler context for the chosen epochs (chrome trace written to
+    trace_dir/trace_phase{P}_epoch{E}.json on exit), nullcontext otherwise.
+    """
+    if trace_dir is None or not epochs_to_trace or epoch not in epochs_to_trace:
+        return nullcontext()
+    path = Path(trace_dir) / f"trace_phase{phase}_epoch{epoch}.json"
+    return torch.profiler.profile(
+        activities     = [torch.profiler.ProfilerActivity.CPU],
+        record_shapes  = True,
+        profile_memory = True,
+        on_trace_ready = lambda prof: prof.export_chrome_trace(str(path)),
+    )
@@ -0,0 +1,312 @@
+"""
+Hyperparameter sweeps over train_user_model.
+
+A search space maps config keys to candidate values. A key is either a
+train_user_model kwarg ("batch_size") or a dotted path into one of its
+dict kwargs ("phase_lr.1", "phase_epochs.3", "loss_lambdas.window").
+Values are a list of choices, or for random search {"log": [lo, hi]} /
+{"uniform": [lo, hi]}.
+
+    space = {
+        "phase_lr.1":          [1e-2, 3e-2],
+        "phase_epochs.3":      [200, 500],
+        "loss_lambdas.window": {"uniform": [0.2, 1.0]},
+    }
+    run_sweep(["datasets/u1.json"], space, "sweeps/run1", mode="random", n_trials=20)
+
+Every (config, dataset) pair trains in its own worker process on a
+cached preprocess_fleet dataset, with uploads off and its own checkpoint
+directory. Finished trials are appended to trials.jsonl as they land;
+configs are then ranked into leaderboard.jsonl by mean val MAE (mg/dL),
+then mean val loss under the default lambda_* weights, mean fingerstick hit
+rate and wall time. Neither depends on the trial's own lambdas, so they
+stay comparable across configs that change loss_lambdas; the trial's
+lambda-weighted best val loss is recorded but not ranked on.
+"""
+from __future__ import annotations
+import itertools
+import json
+import math
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+TRIALS_FILE      = "trials.jsonl"
+LEADERBOARD_FILE = "leaderboard.jsonl"
+HIT_TOLERANCE    = 10.0   # mg/dL, same band as GlucoseLoss window_tolerance
+
+
+def expand_grid(space: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    keys = sorted(space)
+    for k in keys:
+        if not isinstance(space[k], list):
+            raise ValueError(f"[sweep] grid search needs a list of values for '{k}'")
+    return [dict(zip(keys, combo)) for combo in itertools.product(*(space[k] for k in keys))]
+
+
+def _sample_value(spec: Any, rng: np.random.Generator) -> Any:
+    if isinstance(spec, list):
+        return spec[int(rng.integers(len(spec)))]
+    if isinstance(spec, dict) and "log" in spec:
+        lo, hi = spec["log"]
+        return float(math.exp(rng.uniform(math.log(lo), math.log(hi))))
+    if isinstance(spec, dict) and "uniform" in spec:
+        lo, hi = spec["uniform"]
+        return float(rng.uniform(lo, hi))
+    raise ValueError(f"[sweep] unsupported search spec: {spec!r}")
+
+
+def sample_random(space: Dict[str, Any], n_trials: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = np.random.default_rng(seed)
+    return [{k: _sample_value(space[k], rng) for k in sorted(space)} for _ in range(n_trials)]
+
+
+def _train_defaults() -> Dict[str, Any]:
+    import inspect
+    from ai.training.train import train_user_model
+    return {
+        name: p.default for name, p in inspect.signature(train_user_model).parameters.items()
+        if p.default is not inspect.Parameter.empty
+    }
+
+
+def config_to_kwargs(config: Dict[str, Any]) -> Dict[str, Any]:
+    # "phase_lr.1" -> {"phase_lr": {1: ...}}, merged over train_user_model's own defaults
+    # (loss_lambdas is already merged per key inside train_user_model)
+    defaults = _train_defaults()
+    kwargs: Dict[str, Any] = {}
+    for key, value in config.items():
+        if "." not in key:
+            kwargs[key] = value
+            continue
+        name, sub = key.split(".", 1)
+        if name not in kwargs:
+            kwargs[name] = dict(defaults.get(name) or {})
+        kwargs[name][int(sub) if sub.isdigit() else sub] = value
+    return kwargs
+
+
+def _val_metrics(params: Any, val_split: Dict, tolerance: float) -> Dict[str, Optional[float]]:
+    # raw errors of the meal-independent simulation on the val fingersticks, and the
+    # val loss with every config scored under the same (UserParams default) lambda_* weights
+    import torch
+    from ai.models.user.parameters import UserParams
+    from ai.personalization.loss import GlucoseLoss
+    from ai.simulation.batch_simulation import simulate_meal_batch
+    from ai.training.dataset import MealSequenceDataset
+    from ai.training.train import _minibatch_validate
+    metrics: Dict[str, Optional[float]] = {"val_mae": None, "val_rmse": None, "hit_rate": None, "val_loss_fixed": None}
+    ds = MealSequenceDataset.from_split(val_split)
+    if not len(ds):
+        return metrics
+    fixed = UserParams()
+    defaults = {n: p.detach().clone() for n, p in fixed.named_parameters() if n.startswith("lambda_")}
+    fixed.load_state_dict(params.state_dict())
+    with torch.no_grad():
+        for name, value in defaults.items():
+            getattr(fixed, name).copy_(value)
+    metrics["val_loss_fixed"] = _minibatch_validate(fixed, GlucoseLoss(window_tolerance=tolerance), ds)[0]
+    obs = ds.data.obs_glucose
+    valid = ~torch.isnan(obs)
+    if not valid.any():
+        return metrics
+    with torch.no_grad():
+        err = (simulate_meal_batch(ds.data, params) - obs)[valid]
+    metrics["val_mae"]  = float(err.abs().mean())
+    metrics["val_rmse"] = float(err.pow(2).mean().sqrt())
+    metrics["hit_rate"] = float((err.abs() <= tolerance).float().mean())
+    return metrics
+
+
+def _run_trial(
+    trial_id:     str,
+    config:       Dict[str, Any],
+    dataset_file: str,
+    out_dir:      str,
+    base_kwargs:  Dict[str, Any],
+    num_threads:  int,
+) -> Dict[str, Any]:
+    # runs in the worker process - never raises, failures come back as a status row
+    import torch
+    from ai.data.fleet import load_dataset
+    from ai.training.train import train_user_model
+    torch.set_num_threads(num_threads)
+    t0 = time.perf_counter()
+    row: Dict[str, Any] = {"trial_id": trial_id, "config": config, "dataset": dataset_file}
+    try:
+        cached  = load_dataset(dataset_file)
+        user_id = cached.get("user_id") or Path(dataset_file).stem
+        ckpt    = Path(out_dir) / "checkpoints" / trial_id
+        kwargs  = {**base_kwargs, **config_to_kwargs(config)}
+        params  = train_user_model(
+            user_id            = user_id,
+            dataset_file       = dataset_file,
+            checkpoint_dir     = str(ckpt),
+            upload_to_supabase = False,
+            **kwargs,
+        )
+        with open(ckpt / user_id / "loss_history.json") as f:
+            history = json.load(f)
+        last_phase = history[list(history)[-1]]
+        row.update({
+            "status":     "ok",
+            "user_id":    user_id,
+            "val_loss":   last_phase.get("best_val"),
+            **_val_metrics(params, cached["val"], HIT_TOLERANCE),
+            "epochs_run": sum(h.get("epochs_run", len(h.get("train", []))) for h in history.values()),
+        })
+    except Exception as e:
+        row.update({"status": "error", "error": f"{type(e).__name__}: {e}", "trace": traceback.format_exc()})
+    row["seconds"] = round(time.perf_counter() - t0, 3)
+    return row
+
+
+def _append_jsonl(path: Path, row: Dict[str, Any]) -> None:
+    with open(path, "a") as f:
+        f.write(json.dumps({k: v for k, v in row.items() if k != "trace"}) + "\n")
+
+
+def _fmt(value: Optional[float]) -> str:
+    # metrics are None when the val split has no meals / no fingersticks
+    return "n/a" if value is None else f"{value:.4f}"
+
+
+def rank_configs(trials: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    One row per config, averaged over its datasets: lowest mean val MAE
+    first, then lowest val loss under the default lambda_* weights, highest mean
+    hit rate, least total wall time; a metric with no value (empty val
+    split) sorts after every real one. Configs with any failed trial sort
+    last. val_loss uses each config's own lambdas, so it is reported but
+    never ranked on.
+    """
+    by_config: Dict[str, List[Dict[str, Any]]] = {}
+    for t in trials:
+        by_config.setdefault(json.dumps(t["config"], sort_keys=True), []).append(t)
+
+    def mean(values: List[Optional[float]]) -> Optional[float]:
+        values = [v for v in values if v is not None and math.isfinite(v)]
+        return float(np.mean(values)) if values else None
+
+    rows = []
+    for key, ts in by_config.items():
+        ok = [t for t in ts if t["status"] == "ok"]
+        rows.append({
+            "config":   json.loads(key),
+            "n_trials": len(ts),
+            "n_failed": len(ts) - len(ok),
+            "val_mae":  mean([t.get("val_mae") for t in ok]),
+            "val_rmse": mean([t.get("val_rmse") for t in ok]),
+            "hit_rate": mean([t.get("hit_rate") for t in ok]),
+            "val_loss_fixed": mean([t.get("val_loss_fixed") for t in ok]),
+            "val_loss": mean([t.get("val_loss") for t in ok]),
+            "seconds":  round(sum(t["seconds"] for t in ts), 3),
+            "trial_ids": [t["trial_id"] for t in ts],
+        })
+    rows.sort(key=lambda r: (
+        r["n_failed"] > 0,
+        r["val_mae"] if r["val_mae"] is not None else math.inf,
+        r["val_loss_fixed"] if r["val_loss_fixed"] is not None else math.inf,
+        -(r["hit_rate"] if r["hit_rate"] is not None else -1.0),
+        r["seconds"],
+    ))
+    for rank, r in enumerate(rows, start=1):
+        r["rank"] = rank
+    return rows
+
+
+def run_sweep(
+    dataset_files: List[str],
+    space:         Dict[str, Any],
+    out_dir:       str,
+    mode:          str                      = "grid",
+    n_trials:      int                      = 20,
+    max_workers:   Optional[int]            = None,
+    seed:          int                      = 0,
+    base_kwargs:   Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    mode="grid" trains every combination in `space`; mode="random" draws
+    `n_trials` configs. base_kwargs are passed to every run (e.g.
+    {"batch_size": 32}). Torch threads are split evenly between workers.
+    """
+    if mode == "grid":
+        configs = expand_grid(space)
+    elif mode == "random":
+        configs = sample_random(space, n_trials, seed)
+    else:
+        raise ValueError(f"[sweep] unknown mode '{mode}', expected 'grid' or 'random'")
+
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    trials_path = out / TRIALS_FILE
+    trials_path.write_text("")
+    max_workers = max_workers or os.cpu_count() or 1
+    num_threads = max(1, (os.cpu_count() or 1) // max_workers)
+    jobs = [
+        (f"c{ci:03d}-d{di:02d}", config, str(path))
+        for ci, config in enumerate(configs)
+        for di, path in enumerate(dataset_files)
+    ]
+    print(f"\n[sweep] {len(configs)} configs x {len(dataset_files)} datasets = {len(jobs)} trials, "
+          f"{max_workers} workers x {num_threads} threads -> {out_dir}")
+
+    t0 = time.perf_counter()
+    trials: List[Dict[str, Any]] = []
+    queue = list(reversed(jobs))
+    pending: Dict[Future, tuple] = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        while queue or pending:
+            while queue and len(pending) < 2 * max_workers:
+                job = queue.pop()
+                pending[pool.submit(_run_trial, *job, str(out), base_kwargs or {}, num_threads)] = job
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                trial_id, config, path = pending.pop(fut)
+                try:
+                    row = fut.result()
+                except Exception as e:
+                    # worker died outright (OOM kill, segfault) - record and move on
+                    row = {"trial_id": trial_id, "config": config, "dataset": path,
+                           "status": "error", "error": f"{type(e).__name__}: {e}", "seconds": 0.0}
+                trials.append(row)
+                _append_jsonl(trials_path, row)
+                if row["status"] == "ok":
+                    print(f"  [sweep] {trial_id}: mae={_fmt(row['val_mae'])} val(fixed)={_fmt(row['val_loss_fixed'])} "
+                          f"hit={_fmt(row['hit_rate'])} ({row['seconds']}s)")
+                else:
+                    print(f"  [sweep] {trial_id}: FAILED - {row['error']}")
+
+    leaderboard = rank_configs(trials)
+    with open(out / LEADERBOARD_FILE, "w") as f:
+        for row in leaderboard:
+            f.write(json.dumps(row) + "\n")
+    print(f"[sweep] Done in {time.perf_counter() - t0:.1f}s - best config: "
+          f"{leaderboard[0]['config'] if leaderboard else None}")
+    return leaderboard
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 3:
+        print("Usage: python -m ai.training.sweep <sweep.json> <out_dir> [max_workers]")
+        print('  sweep.json: {"datasets": [...], "space": {...}, "mode": "grid"|"random",')
+        print('               "n_trials": 20, "seed": 0, "base_kwargs": {...}}')
+        sys.exit(1)
+    with open(sys.argv[1]) as f:
+        spec = json.load(f)
+    run_sweep(
+        dataset_files = spec["datasets"],
+        space         = spec["space"],
+        out_dir       = sys.argv[2],
+        mode          = spec.get("mode", "grid"),
+        n_trials      = spec.get("n_trials", 20),
+        max_workers   = int(sys.argv[3]) if len(sys.argv) > 3 else None,
+        seed          = spec.get("seed", 0),
+        base_kwargs   = spec.get("base_kwargs"),
+    )
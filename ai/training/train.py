@@ -13,18 +13,28 @@ Phase 3 (day 8+)     Trainable: + eta_fp_u, beta4, beta5, alpha
 """
 from __future__ import annotations
 import json
+import math
 import os 
 import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime 
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple 
+from typing import Any, Callable, Dict, List, Optional, Tuple 
+import numpy as np
 import torch 
-from torch.optim import Adam 
-from torch.optim.lr_scheduler import CosineAnnealingLR
-from ai.data.preprocessing import load_training_data
-from ai.models.user.parameters import UserParams
+from torch.optim import LBFGS, Adam 
+from torch.optim.lr_scheduler import CosineAnnealingLR, ReduceLROnPlateau
+from ai.data.fleet import load_dataset
+from ai.data.preprocessing import load_training_data, subset_sequences
+from ai.models.user.parameters import UserParams, params_from_dict
 from ai.simulation._run_glucose_simulation import run_glucose_simulation
-from ai.personalization.loss import GlucoseLoss
+from ai.simulation.batch_simulation import MealBatch, simulate_meal_batch
+from ai.storage.supabase_client import get_supabase
+from ai.training.checkpoint import DEFAULT_MIN_INTERVAL_S, CheckpointWriter, snapshot_state
+from ai.training.prior import load_prior, prior_params
+from ai.training.profiling import NULL_PROFILER, StageProfiler, epoch_trace
+from ai.training.dataset import DEFAULT_DT_MINUTES, DEFAULT_HORIZON_MINUTES, MealSequenceDataset
+from ai.personalization.loss import GlucoseLoss, breakdown
 PHASE_PARAMS: Dict[int, List[str]] = {
     1: ["Gb","beta1", "su"],
     2:["Gb", "beta1", "su","delta_u","beta2","beta3","eta_liq_u"],
@@ -36,6 +46,55 @@ HR_SCALE = 0.5 #bpm rise per mg/dl glucose rise
 HRV_SCALE = 0.3 # ms HRV sppression per mg/dl glucose rise 
 LAMBDA_REG = 0.3 # delta_empirical reg weight 
 
+DEFAULT_LOSS_LAMBDAS: Dict[str, float] = {"fingerstick": 1.0, "window": 1.0, "phys": 1.0, "med": 1.0}
+
+# early stopping: stop once val has not improved by MIN_DELTA for `patience`
+# epochs, but never before the phase minimum
+DEFAULT_PHASE_PATIENCE:   Dict[int, int] = {1: 30, 2: 40, 3: 50}
+DEFAULT_PHASE_MIN_EPOCHS: Dict[int, int] = {1: 20, 2: 30, 3: 50}
+MIN_DELTA       = 1e-4
+PLATEAU_FACTOR  = 0.5   # lr multiplier when val stalls for patience // 3 epochs
+STOP_MAX_EPOCHS = "max_epochs"
+STOP_PATIENCE   = "patience"
+STOP_NON_FINITE = "non_finite_val"
+
+# LBFGS mode: each epoch is one optimizer.step of up to LBFGS_MAX_ITER iterations
+OPTIMIZERS       = ("adam", "lbfgs")
+LBFGS_LR         = 1.0
+LBFGS_MAX_ITER   = 20
+LBFGS_HISTORY    = 10
+STOP_CONVERGED   = "converged"
+
+# fine-tune: short run on top of the last trained params
+FINE_TUNE_PHASE      = 3
+FINE_TUNE_EPOCHS     = 40
+FINE_TUNE_LR         = 2e-3
+FINE_TUNE_PATIENCE   = 10
+FINE_TUNE_RECENT_DAYS = 14.0
+FINE_TUNE_OLD_FRAC   = 0.2   # share of meals older than recent_days kept as a replay sample
+
+
+class EarlyStopping:
+    def __init__(self, patience: Optional[int], min_delta: float = MIN_DELTA, min_epochs: int = 0):
+        self.patience   = patience
+        self.min_delta  = min_delta
+        self.min_epochs = min_epochs
+        self.best       = float("inf")
+        self.best_epoch = 0
+        self.bad_epochs = 0
+
+    def step(self, epoch: int, val_loss: float) -> Optional[str]:
+        # returns a stop reason, or None to keep going
+        if not math.isfinite(val_loss):
+            return STOP_NON_FINITE
+        # counted in epochs, not calls, so it holds when validation runs every N epochs
+        if val_loss < self.best - self.min_delta:
+            self.best, self.best_epoch = val_loss, epoch
+        self.bad_epochs = epoch - self.best_epoch
+        if self.patience is not None and epoch >= self.min_epochs and self.bad_epochs >= self.patience:
+            return STOP_PATIENCE
+        return None
+
 def _set_trainable_params(params: UserParams, phase: int) -> None:
     unlocked = set(PHASE_PARAMS[phase])
     for name, p in params.named_parameters():
@@ -81,6 +140,9 @@ def _day_night_deltas(
             day_deltas.append(delta)
     return night_deltas, day_deltas
 
+# called with the user_id after every successful upload (the API registers its param cache here)
+PARAMS_UPLOADED_HOOKS: List[Callable[[str], None]] = []
+
 def upload_params_to_supabase(
     user_id: str,
     params: UserParams,
@@ -91,12 +153,7 @@ def upload_params_to_supabase(
     supabase_key: Optional[str] =None 
 ) -> bool:
     try:
-        from supabase import create_client
-        url = supabase_url or os.environ.get("EXPO_PUBLIC_SUPABASE_URL")
-        key = supabase_key or os.environ.get("EXPO_PUBLIC_SUPABASE_KEY")
-        if not url or not key:
-            raise EnvironmentError("Supabase credential not set")
-        sb = create_client(url,key)
+        sb = get_supabase(supabase_url, supabase_key)
         row = {
             "user_id": user_id,
             "training_phase": training_phase,
@@ -107,12 +164,101 @@ def upload_params_to_supabase(
         }
         sb.table("user_model_params").upsert(row, on_conflict="user_id").execute()
         print(f"    [train] Params uploaded to Supabase for use {user_id}")
+        for hook in PARAMS_UPLOADED_HOOKS:
+            try:
+                hook(user_id)
+            except Exception as e:
+                print(f"    [train] WARNING: params-uploaded hook failed: {e}")
         return True 
     except Exception as e:
         print(f"    [train] WARNING: Could not upload params: {e}")
         traceback.print_exc()
         return False 
         
+def fetch_params_from_supabase(
+    user_id: str,
+    supabase_url: Optional[str] = None,
+    supabase_key: Optional[str] = None,
+) -> Optional[Dict]:
+    try:
+        sb = get_supabase(supabase_url, supabase_key)
+        rows = (
+            sb.table("user_model_params")
+            .select("*")
+            .eq("user_id", user_id)
+            .limit(1)
+            .execute()
+        ).data or []
+        return rows[0] if rows else None
+    except Exception as e:
+        print(f"    [train] WARNING: Could not fetch params: {e}")
+        return None
+
+def load_warm_start(
+    user_id: str,
+    ckpt_dir: Path,
+    supabase_url: Optional[str] = None,
+    supabase_key: Optional[str] = None,
+) -> Tuple[Optional[UserParams], str]:
+    # local final_params.pt first (exact state), then the uploaded Supabase row
+    final_path = ckpt_dir / "final_params.pt"
+    if final_path.exists():
+        params = UserParams()
+        params.load_state_dict(torch.load(final_path))
+        return params, str(final_path)
+    row = fetch_params_from_supabase(user_id, supabase_url, supabase_key)
+    if row is not None:
+        return params_from_dict(row), "supabase"
+    return None, "none"
+
+def _meal_stamps(seqs: Dict) -> List[float]:
+    return [
+        datetime.fromisoformat(m["timestamp"].replace("Z", "+00:00")).timestamp()
+        for m in seqs.get("meal_features", [])
+    ]
+
+def history_window_indices(
+    seqs: Dict,
+    last_days: Optional[float] = None,
+    last_meals: Optional[int] = None,
+    newest: Optional[float] = None,
+) -> List[int]:
+    # meals from the `last_days` before `newest` (default: this split's newest meal),
+    # then at most the `last_meals` most recent of those; original order kept
+    stamps = _meal_stamps(seqs)
+    keep = list(range(len(stamps)))
+    if not stamps:
+        return keep
+    if last_days is not None:
+        cutoff = (newest if newest is not None else max(stamps)) - last_days * 86400.0
+        keep = [i for i in keep if stamps[i] >= cutoff]
+    if last_meals is not None:
+        keep = sorted(sorted(keep, key=lambda i: stamps[i])[-last_meals:]) if last_meals > 0 else []
+    return keep
+
+def decay_weights(seqs: Dict, half_life_days: float) -> torch.Tensor:
+    # 0.5 ** (age / half-life) per meal, age in days before the split's newest meal (as MealBatch.age_days)
+    stamps = torch.tensor(_meal_stamps(seqs), dtype=torch.float64)
+    age_days = (stamps.max() - stamps) / 86400.0 if len(stamps) else stamps
+    return torch.pow(0.5, age_days / half_life_days).float()
+
+def recent_meal_indices(
+    seqs: Dict,
+    recent_days: float,
+    old_frac: float,
+    rng: np.random.Generator,
+) -> List[int]:
+    # every meal from the last `recent_days`, plus a random `old_frac` of older ones
+    stamps = _meal_stamps(seqs)
+    if not stamps:
+        return []
+    cutoff = max(stamps) - recent_days * 86400.0
+    recent = [i for i, t in enumerate(stamps) if t >= cutoff]
+    older  = [i for i, t in enumerate(stamps) if t < cutoff]
+    n_old  = int(round(len(older) * old_frac))
+    sample = rng.choice(older, size=n_old, replace=False).tolist() if n_old else []
+    return sorted(recent + sample)
+
 def _compute_loss(
         loss_fn: GlucoseLoss,
         params: UserParams,
@@ -123,13 +269,12 @@ def _compute_loss(
         hr_obs: Optional[torch.Tensor],
         hrv_pred: Optional[torch.Tensor],
         hrv_obs: Optional[torch.Tensor],
-) -> Tuple[torch.Tensor, Dict[str, float]]:
-    l_fs = loss_fn._fingerstick_loss(pred_glucose, obs_glucose, G_b)
-    l_w = loss_fn._window_loss(pred_glucose, obs_glucose)
-    l_pr = loss_fn._parameter_reg(params)
-    l_hr = loss_fn._hr_loss(hr_pred, hr_obs) if(hr_pred is not None and hr_obs is not None) else torch.tensor(0.0)
-    l_hrv = loss_fn._hrv_loss(hrv_pred,hrv_obs) if(hrv_pred is not None and hrv_obs is not None) else torch.tensor(0.0)
-    l_p = l_hr + l_hrv
+        weights: Optional[torch.Tensor] = None,
+) -> Tuple[torch.Tensor, Dict[str, torch.Tensor]]:
+    # components are detached 0-d tensors; breakdown() turns them into floats when needed
+    terms = loss_fn.batch_terms(pred_glucose, obs_glucose, G_b, params, hr_pred, hr_obs, hrv_pred, hrv_obs,
+                                weights=weights)
+    l_fs, l_w, l_p, l_pr = terms["fingerstick"], terms["window"], terms["phys"], terms["param_reg"]
 
     total = (
         torch.abs(params.lambda_fingerstick) * l_fs +
@@ -138,15 +283,23 @@ def _compute_loss(
         l_pr
     )
     components = {
-        "fingerstick": l_fs.item(),
-        "window":      l_w.item(),
-        "phys":        l_p.item(),
-        "param_reg":   l_pr.item(),
-        "lambda_f":    params.lambda_fingerstick.item(),
-        "lambda_w":    params.lambda_window.item(),
-        "lambda_p":    params.lambda_phys.item(),
+        "fingerstick": l_fs.detach(),
+        "window":      l_w.detach(),
+        "phys":        l_p.detach(),
+        "param_reg":   l_pr.detach(),
+        "lambda_f":    params.lambda_fingerstick.detach(),
+        "lambda_w":    params.lambda_window.detach(),
+        "lambda_p":    params.lambda_phys.detach(),
     }
     return total, components
+def _floats(
+    loss: torch.Tensor,
+    components: Dict[str, torch.Tensor],
+) -> Tuple[float, Dict[str, float]]:
+    # the single host sync per epoch / validation pass
+    values = breakdown({"_loss": loss, **components})
+    return values.pop("_loss"), values
+
 def _extract_obs_tensors(
     sequences: Dict,
     phase: int,
@@ -169,6 +322,179 @@ def _extract_obs_tensors(
     G_b = torch.tensor([s["hr_baseline"] for s in sensor_wins],  dtype=torch.float32)
     return obs_glucose, hr_obs, hrv_obs, G_b
 
+def _chain_loss(
+    params:      UserParams,
+    loss_fn:     GlucoseLoss,
+    seqs:        Dict,
+    obs_tensors: Tuple,
+    prof:        StageProfiler = NULL_PROFILER,
+    tbptt_steps: Optional[int] = None,
+    weights:     Optional[torch.Tensor] = None,
+) -> Tuple[torch.Tensor, Dict[str, torch.Tensor]]:
+    # the whole split simulated as a single meal chain; weights: per-meal (see decay_weights)
+    obs_glucose, hr_obs, hrv_obs, G_b = obs_tensors
+    with prof.stage("simulate"):
+        pred_glucose = run_glucose_simulation(
+            sequences     = seqs["meal_features"],
+            sensor_window = seqs["sensor_windows"],
+            params        = params,
+            medication_schedules = seqs.get("medication_schedules"),
+            tbptt_steps   = tbptt_steps,
+        )
+    with prof.stage("loss"):
+        return _compute_loss(
+            loss_fn      = loss_fn,
+            params       = params,
+            pred_glucose = pred_glucose,
+            obs_glucose  = obs_glucose if obs_glucose is not None else pred_glucose.detach(),
+            G_b          = G_b,
+            hr_pred      = pred_glucose * HR_SCALE,
+            hr_obs       = hr_obs,
+            hrv_pred     = pred_glucose * HRV_SCALE,
+            hrv_obs      = hrv_obs,
+            weights      = weights,
+        )
+
+
+def _chain_train_epoch(
+    params:      UserParams,
+    loss_fn:     GlucoseLoss,
+    optimizer:   torch.optim.Optimizer,
+    seqs:        Dict,
+    obs_tensors: Tuple,
+    prof:        StageProfiler = NULL_PROFILER,
+    tbptt_steps: Optional[int] = None,
+    weights:     Optional[torch.Tensor] = None,
+) -> Tuple[float, Dict[str, float]]:
+    # one step per epoch over the whole chain
+    optimizer.zero_grad()
+    loss, components = _chain_loss(params, loss_fn, seqs, obs_tensors, prof, tbptt_steps, weights)
+    with prof.stage("backward"):
+        loss.backward()
+    with prof.stage("step"):
+        torch.nn.utils.clip_grad_norm_(params.parameters(), max_norm=1.0)
+        optimizer.step()
+    return _floats(loss, components)
+
+
+def _chain_validate(
+    params:      UserParams,
+    loss_fn:     GlucoseLoss,
+    seqs:        Dict,
+    obs_tensors: Tuple,
+) -> Tuple[float, Dict[str, float]]:
+    with torch.no_grad():
+        loss, components = _chain_loss(params, loss_fn, seqs, obs_tensors)
+    return _floats(loss, components)
+
+
+def _lbfgs_train_epoch(
+    optimizer:    LBFGS,
+    loss_closure: Callable[[], Tuple[torch.Tensor, Dict[str, torch.Tensor]]],
+    info:         Dict[str, Any],
+    prof:         StageProfiler = NULL_PROFILER,
+) -> Tuple[float, Dict[str, float]]:
+    """
+    One LBFGS step = up to max_iter quasi-Newton iterations on the full
+    (deterministic) objective. A step that ends before max_iter/max_eval
+    hit one of the tolerances, i.e. converged. Returns the loss at the
+    params the step ended on.
+    """
+    def closure() -> torch.Tensor:
+        optimizer.zero_grad()
+        loss, _ = loss_closure()
+        with prof.stage("backward"):
+            loss.backward()
+        return loss
+
+    group = optimizer.param_groups[0]
+    state = optimizer.state[group["params"][0]]
+    iters_before, evals_before = state.get("n_iter", 0), state.get("func_evals", 0)
+    optimizer.step(closure)
+    iters = state.get("n_iter", 0) - iters_before
+    evals = state.get("func_evals", 0) - evals_before
+    info["iterations"] += iters
+    info["func_evals"] += evals
+    info["converged"]   = iters < group["max_iter"] and evals < group["max_eval"]
+    # the last closure call ran before the final update - score the accepted params
+    with torch.no_grad():
+        loss, components = loss_closure()
+    return _floats(loss, components)
+
+
+def _batch_loss(
+    params:  UserParams,
+    loss_fn: GlucoseLoss,
+    batch:   MealBatch,
+    prof:    StageProfiler   = NULL_PROFILER,
+    half_life_days: Optional[float] = None,
+    sim_kwargs:     Optional[Dict[str, Any]] = None,
+) -> Tuple[torch.Tensor, Dict[str, torch.Tensor]]:
+    # sim_kwargs: simulate_meal_batch options (tbptt_steps, checkpoint)
+    with prof.stage("simulate"):
+        pred = simulate_meal_batch(batch, params, **(sim_kwargs or {}))   # [B, T]
+    with prof.stage("loss"):
+        # exponential time decay: a meal half_life_days older than the newest counts half
+        weights = torch.pow(0.5, batch.age_days / half_life_days) if half_life_days else None
+        # HR/HRV are per-meal scalars: compare against the mean over the postprandial window
+        post = batch.post_mask.float()
+        pred_post = (pred * post).sum(dim=1) / post.sum(dim=1).clamp(min=1.0)
+        return _compute_loss(
+            loss_fn      = loss_fn,
+            params       = params,
+            pred_glucose = pred,
+            obs_glucose  = batch.obs_glucose,
+            G_b          = batch.G_b,
+            hr_pred      = pred_post * HR_SCALE,
+            hr_obs       = batch.hr_obs,
+            hrv_pred     = pred_post * HRV_SCALE,
+            hrv_obs      = batch.hrv_obs,
+            weights      = weights,
+        )
+
+
+def _minibatch_train_epoch(
+    params:     UserParams,
+    loss_fn:    GlucoseLoss,
+    optimizer:  torch.optim.Optimizer,
+    dataset:    MealSequenceDataset,
+    batch_size: int,
+    generator:  Optional[torch.Generator] = None,
+    prof:       StageProfiler             = NULL_PROFILER,
+    half_life_days: Optional[float]       = None,
+    sim_kwargs:     Optional[Dict[str, Any]] = None,
+) -> Tuple[float, Dict[str, float]]:
+    # one optimizer step per shuffled batch; epoch loss/components are meal-weighted means,
+    # accumulated on-device and synced once at the end
+    total, n_seen = torch.zeros(()), 0
+    sums: Dict[str, torch.Tensor] = {}
+    for batch in dataset.iter_batches(batch_size, generator=generator):
+        optimizer.zero_grad()
+        loss, components = _batch_loss(params, loss_fn, batch, prof, half_life_days, sim_kwargs)
+        with prof.stage("backward"):
+            loss.backward()
+        with prof.stage("step"):
+            torch.nn.utils.clip_grad_norm_(params.parameters(), max_norm=1.0)
+            optimizer.step()
+        n = len(batch)
+        total  = total + loss.detach() * n
+        n_seen += n
+        for k, v in components.items():
+            sums[k] = sums[k] + v * n if k in sums else v * n
+    n_seen = max(n_seen, 1)
+    return _floats(total / n_seen, {k: v / n_seen for k, v in sums.items()})
+
+
+def _minibatch_validate(
+    params:  UserParams,
+    loss_fn: GlucoseLoss,
+    dataset: MealSequenceDataset,
+) -> Tuple[float, Dict[str, float]]:
+    with torch.no_grad():
+        loss, components = _batch_loss(params, loss_fn, dataset.data)
+    return _floats(loss, components)
+
+
 def _train_phase(
     phase: int, 
     params: UserParams,
@@ -180,90 +506,219 @@ def _train_phase(
     checkpoint_dir: Path, 
     night_deltas: List[float],
     day_deltas: List[float],
-    ) -> Dict[str, List[float]]:
+    batch_size: Optional[int] = None,
+    train_dataset: Optional[MealSequenceDataset] = None,
+    val_dataset:   Optional[MealSequenceDataset] = None,
+    generator:     Optional[torch.Generator]     = None,
+    on_epoch:      Optional[Callable[[Dict], None]] = None,
+    patience:      Optional[int]                 = None,
+    min_epochs:    int                           = 0,
+    min_delta:     float                         = MIN_DELTA,
+    checkpoint_writer: Optional[CheckpointWriter] = None,
+    optimizer_name: str = "adam",
+    profiler:      StageProfiler                 = NULL_PROFILER,
+    trace_epochs:  Optional[List[int]]           = None,
+    val_interval:  int                           = 1,
+    async_validation: bool                       = False,
+    fold_frozen:   bool                          = True,
+    decay_half_life_days: Optional[float]        = None,
+    tbptt_steps:   Optional[int]                 = None,
+    checkpoint_activations: bool                 = False,
+    ) -> Dict[str, Any]:
+    """
+    batch_size=None keeps the original full-chain step (one optimizer step
+    per epoch). With a batch_size and the columnar datasets, meals are
+    simulated independently and each epoch takes ceil(N / batch_size) steps.
+
+    patience=None runs all `epochs`. Otherwise the phase stops early once
+    val loss has not improved by `min_delta` for `patience` epochs (after
+    `min_epochs`), and the lr is halved after patience // 3 stalled epochs
+    on top of the cosine schedule.
+
+    The best state is kept in memory and loaded back into `params` before
+    returning; phase{N}_best.pt is written by `checkpoint_writer` in the
+    background (a private writer is flushed here if none is given).
+
+    optimizer_name="lbfgs" swaps Adam + schedules for LBFGS with a
+    strong-Wolfe line search on the full train objective (mini-batch mode
+    uses the whole dataset as one batch). `lr` is ignored, and the phase
+    ends as soon as an LBFGS step converges.
+
+    `profiler` times each stage of every epoch; epochs in `trace_epochs`
+    also get a torch.profiler trace in checkpoint_dir.
+
+    Validation runs every `val_interval` epochs (and on the last one).
+    With async_validation it runs on a copy of the params in a background
+    thread while training continues; the best checkpoint is always the
+    snapshot that was validated, so best-state selection stays exact even
+    though early-stopping decisions can lag by one interval.
+
+    fold_frozen (mini-batch path) precomputes the ΔG terms of the params
+    this phase leaves frozen, so each epoch only evaluates the live ones.
+
+    decay_half_life_days weights each training meal by
+    0.5 ** (age / half-life) on both paths; validation stays unweighted.
+
+    tbptt_steps bounds backprop to K meals of the chain path
+    (run_glucose_simulation), where the graph grows with history; on the
+    mini-batch path it only truncates each meal's accumulated ΔG (see
+    simulate_meal_batch). checkpoint_activations (mini-batch path)
+    recomputes ΔG in backward. Validation runs without a graph and
+    ignores both.
+    """
+    if optimizer_name not in OPTIMIZERS:
+        raise ValueError(f"[train] unknown optimizer '{optimizer_name}', expected one of {OPTIMIZERS}")
+    use_lbfgs = optimizer_name == "lbfgs"
     print(f"\n{'='*20}")
-    print(f"    PHASE {phase} ({epochs} epochs, lr={lr})")
+    print(f"    PHASE {phase} ({epochs} epochs, " + ("lbfgs" if use_lbfgs else f"lr={lr}") + ")")
     print(f"{'='*20}")
 
     _set_trainable_params(params, phase)
 
+    # only unfrozen params reach the optimizer, so frozen ones never move
     trainable = [p for p in params.parameters() if p.requires_grad]
-    optimizer = Adam(trainable, lr=lr)
-    scheduler = CosineAnnealingLR(optimizer, T_max=epochs, eta_min=lr * 0.01)
+    if use_lbfgs:
+        optimizer = LBFGS(trainable, lr=LBFGS_LR, max_iter=LBFGS_MAX_ITER,
+                          history_size=LBFGS_HISTORY, line_search_fn="strong_wolfe")
+        scheduler = plateau = None
+    else:
+        optimizer = Adam(trainable, lr=lr)
+        scheduler = CosineAnnealingLR(optimizer, T_max=epochs, eta_min=lr * 0.01)
+        # cosine steps are chainable, so a plateau cut carries through the rest of the schedule
+        plateau = ReduceLROnPlateau(
+            optimizer, mode="min", factor=PLATEAU_FACTOR, patience=max(1, patience // 3 // val_interval),
+            threshold=min_delta, threshold_mode="abs", min_lr=lr * 1e-3,
+        ) if patience else None
+    # in-place updates are invisible to cached_k_abs_i otherwise
+    optimizer.register_step_post_hook(lambda *_: params.bump_version())
+    lbfgs_info: Dict[str, Any] = {"iterations": 0, "func_evals": 0, "converged": False}
+    stopper = EarlyStopping(patience, min_delta, min_epochs)
+    stop_reason = STOP_MAX_EPOCHS
     best_val = float("inf")
-    history = {"train": [], "val":[]}
+    best_state: Optional[Dict[str, torch.Tensor]] = None
+    writer = checkpoint_writer or CheckpointWriter()
+    history: Dict[str, Any] = {"train": [], "val":[], "val_epochs": [], "lr": []}
     ckpt_path = checkpoint_dir / f"phase{phase}_best.pt"
 
-    train_obs_glucose, train_hr_obs, train_hrv_obs, train_G_b = _extract_obs_tensors(train_seqs, phase)
-    val_obs_glucose,   val_hr_obs,   val_hrv_obs,   val_G_b   = _extract_obs_tensors(val_seqs,   phase)
-    
-    for epoch in range(1, epochs+1):
-        params.train()
-        optimizer.zero_grad()
-        pred_glucose_train = run_glucose_simulation(
-            sequences = train_seqs["meal_features"],
-            sensor_window = train_seqs["sensor_windows"],
-            params    = params,
-        )
-        hr_pred_train = pred_glucose_train * HR_SCALE
-        hrv_pred_train = pred_glucose_train * HRV_SCALE
+    if batch_size:
+        if train_dataset is None or val_dataset is None:
+            raise ValueError("[train] batch_size set but no MealSequenceDataset given")
+        if fold_frozen:
+            # frozen params cannot change during the phase - evaluate their terms once
+            train_dataset = train_dataset.fold_frozen(params)
+            val_dataset   = val_dataset.fold_frozen(params)
+        sim_kwargs  = {"tbptt_steps": tbptt_steps, "checkpoint": checkpoint_activations}
+        train_epoch = lambda: _minibatch_train_epoch(params, loss_fn, optimizer, train_dataset, batch_size,
+                                                     generator, profiler, decay_half_life_days, sim_kwargs)
+        validate    = lambda p: _minibatch_validate(p, loss_fn, val_dataset)
+        full_loss   = lambda: _batch_loss(params, loss_fn, train_dataset.data, profiler,
+                                          decay_half_life_days, sim_kwargs)
+    else:
+        train_obs = _extract_obs_tensors(train_seqs, phase)
+        val_obs   = _extract_obs_tensors(val_seqs,   phase)
+        weights   = decay_weights(train_seqs, decay_half_life_days) if decay_half_life_days else None
+        train_epoch = lambda: _chain_train_epoch(params, loss_fn, optimizer, train_seqs, train_obs, profiler,
+                                                 tbptt_steps, weights)
+        validate    = lambda p: _chain_validate(p, loss_fn, val_seqs, val_obs)
+        full_loss   = lambda: _chain_loss(params, loss_fn, train_seqs, train_obs, profiler, tbptt_steps, weights)
+    if use_lbfgs:
+        # LBFGS moves params between closure evaluations inside one step
+        def lbfgs_loss() -> Tuple[torch.Tensor, Dict[str, torch.Tensor]]:
+            params.bump_version()
+            return full_loss()
+        train_epoch = lambda: _lbfgs_train_epoch(optimizer, lbfgs_loss, lbfgs_info, profiler)
 
-        train_loss, train_components = _compute_loss(
-            loss_fn = loss_fn, 
-            params       = params,
-            pred_glucose = pred_glucose_train,
-            obs_glucose  = train_obs_glucose if train_obs_glucose is not None else pred_glucose_train.detach(),
-            G_b          = train_G_b,
-            hr_pred      = hr_pred_train,
-            hr_obs       = train_hr_obs,
-            hrv_pred     = hrv_pred_train,
-            hrv_obs      = train_hrv_obs,
-        )
-        train_loss.backward()
-        
-        torch.nn.utils.clip_grad_norm_(params.parameters(), max_norm=1.0)
-        optimizer.step()
-        scheduler.step()
+    val_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="val") if async_validation else None
+    pending_val: List[Tuple[int, Future, Dict[str, torch.Tensor]]] = []
+    last_val = float("nan")
 
-        params.eval()
-        with torch.no_grad():
-            pred_glucose_val = run_glucose_simulation(
-                sequences      = val_seqs["meal_features"],
-                sensor_windows = val_seqs["sensor_windows"],
-                params         = params,
-            )
-            hr_pred_val = pred_glucose_val * HR_SCALE
-            hrv_pred_val = pred_glucose_val * HRV_SCALE 
-
-            val_loss, val_components = _compute_loss(
-                loss_fn = loss_fn,
-                params       = params,
-                pred_glucose = pred_glucose_val,
-                obs_glucose  = val_obs_glucose if val_obs_glucose is not None else pred_glucose_val,
-                G_b          = val_G_b,
-                hr_pred      = hr_pred_val,
-                hr_obs       = val_hr_obs,
-                hrv_pred     = hrv_pred_val,
-                hrv_obs      = val_hrv_obs,
-            )
-        history["train"].append(train_loss.item())
-        history["val"].append(val_loss.item())
-
-        if val_loss.item() < best_val:
-            best_val = val_loss.item()
-            torch.save({
-                "epoch": epoch,
-                "phase": phase,
-                "params": params.state_dict(),
-                "val_loss": best_val,
-                "components": val_components,
-            }, ckpt_path)
+    def record_val(epoch: int, val_loss: float, val_components: Dict, state: Optional[Dict]) -> Optional[str]:
+        # state: the validated snapshot (async), or None to snapshot the live params now (sync)
+        nonlocal best_val, best_state, last_val
+        last_val = val_loss
+        history["val"].append(val_loss)
+        history["val_epochs"].append(epoch)
+        if plateau is not None and math.isfinite(val_loss):
+            plateau.step(val_loss)
+        if val_loss < best_val:
+            with profiler.stage("checkpoint"):
+                best_val = val_loss
+                best_state = state if state is not None else snapshot_state(params)
+                writer.submit(ckpt_path, {
+                    "epoch": epoch,
+                    "phase": phase,
+                    "params": best_state,
+                    "val_loss": best_val,
+                    "components": val_components,
+                }, epoch=epoch)
+        return stopper.step(epoch, val_loss)
+
+    def drain(block: bool) -> Optional[str]:
+        # record finished background validations in epoch order
+        reason = None
+        while pending_val and (block or pending_val[0][1].done()):
+            v_epoch, fut, state = pending_val.pop(0)
+            v_loss, v_components = fut.result()
+            reason = reason or record_val(v_epoch, v_loss, v_components, state)
+        return reason
+
+    for epoch in range(1, epochs+1):
+        profiler.start_epoch(phase, epoch)
+        reason = None
+        with epoch_trace(checkpoint_dir, phase, epoch, trace_epochs):
+            params.train()
+            train_loss, train_components = train_epoch()
+            if scheduler is not None:
+                scheduler.step()
+
+            params.eval()
+            if epoch % val_interval == 0 or epoch == epochs:
+                with profiler.stage("validate"):
+                    if val_pool is not None:
+                        state = snapshot_state(params)
+                        shadow = UserParams()
+                        shadow.load_state_dict(state)
+                        pending_val.append((epoch, val_pool.submit(validate, shadow), state))
+                    else:
+                        val_loss, val_components = validate(params)
+                        reason = record_val(epoch, val_loss, val_components, None)
+            reason = drain(block=False) or reason
+        history["train"].append(train_loss)
+        history["lr"].append(optimizer.param_groups[0]["lr"])
+        profiler.end_epoch()
+        if on_epoch is not None:
+            on_epoch({"phase": phase, "epoch": epoch, "epochs": epochs,
+                      "train_loss": train_loss, "val_loss": last_val, "best_val": best_val})
         if epoch % 10 == 0 or epoch ==1:
             print ( f"  Epoch {epoch:3d}/{epochs} | "
-                f"train={train_loss.item():.4f} | "
-                f"val={val_loss.item():.4f} | "
+                f"train={train_loss:.4f} | "
+                f"val={last_val:.4f} | "
                 f"fs={train_components['fingerstick']:.4f} | "
                 f"phys={train_components['phys']:.4f}")
+        if reason is None and use_lbfgs and lbfgs_info["converged"]:
+            reason = STOP_CONVERGED
+        if reason is not None:
+            stop_reason = reason
+            print(f"  Early stop at epoch {epoch}/{epochs} ({reason}, best epoch {stopper.best_epoch})")
+            break
+    if val_pool is not None:
+        # validations still in flight only matter for picking the best state
+        drain(block=True)
+        val_pool.shutdown()
+    history["epochs_run"]  = len(history["train"])
+    history["max_epochs"]  = epochs
+    history["best_epoch"]  = stopper.best_epoch
+    history["stop_reason"] = stop_reason
+    history["best_val"]    = best_val
+    history["optimizer"]   = optimizer_name
+    if use_lbfgs:
+        history["lbfgs"] = lbfgs_info
+        print(f"  LBFGS: {lbfgs_info['iterations']} iterations, {lbfgs_info['func_evals']} evals, "
+              f"{'converged' if lbfgs_info['converged'] else 'not converged'}")
+    if best_state is not None:
+        params.load_state_dict(best_state)
+    if checkpoint_writer is None:
+        writer.close()
     print(f"\n  Phase {phase} done — best val loss: {best_val:.4f}  (saved → {ckpt_path})")
     return history
 # public entry point 
@@ -280,34 +735,134 @@ def train_user_model(
         phase_epochs:     Dict[int, int] = {1: 200, 2: 300, 3: 500},
         phase_lr:         Dict[int, float] = {1: 1e-2, 2: 5e-3, 3: 1e-3},
         seed:             int            = 42,
+        batch_size:       Optional[int]  = None,
+        dt_minutes:       float          = DEFAULT_DT_MINUTES,
+        horizon_minutes:  float          = DEFAULT_HORIZON_MINUTES,
+        progress_callback: Optional[Callable[[Dict], None]] = None,
+        phase_patience:   Optional[Dict[int, int]] = DEFAULT_PHASE_PATIENCE,
+        phase_min_epochs: Dict[int, int] = DEFAULT_PHASE_MIN_EPOCHS,
+        min_delta:        float          = MIN_DELTA,
+        checkpoint_interval_s: Optional[float] = DEFAULT_MIN_INTERVAL_S,
+        checkpoint_interval_epochs: Optional[int] = None,
+        phase_optimizer:  Optional[Dict[int, str]] = None,
+        profile:          bool           = False,
+        profile_memory:   bool           = False,
+        profile_trace_epochs: Optional[Dict[int, List[int]]] = None,
+        val_interval:     int            = 1,
+        async_validation: bool           = False,
+        fold_frozen:      bool           = True,
+        loss_lambdas:     Optional[Dict[str, float]] = None,
+        dataset_file:     Optional[str]  = None,
+        fine_tune:        bool           = False,
+        fine_tune_epochs: int            = FINE_TUNE_EPOCHS,
+        fine_tune_lr:     float          = FINE_TUNE_LR,
+        recent_days:      float          = FINE_TUNE_RECENT_DAYS,
+        old_sample_frac:  float          = FINE_TUNE_OLD_FRAC,
+        population_prior: Optional[str]  = None,
+        history_days:     Optional[float] = None,
+        history_meals:    Optional[int]   = None,
+        phase_decay_half_life_days: Optional[Dict[int, float]] = None,
+        tbptt_steps:      Optional[int]  = None,
+        checkpoint_activations: bool     = False,
 ) -> UserParams:
+    """
+    fine_tune=True starts from the user's final_params.pt (or their Supabase
+    row) and runs a single short phase-3 pass on the last `recent_days` of
+    meals plus an `old_sample_frac` replay sample of older ones. Without
+    any saved params it falls back to the full phased run.
+
+    dataset_file: a preprocess_fleet output file; skips load_training_data.
+    loss_lambdas: overrides for the fingerstick/window/phys/med weights.
+    profile: per-stage timings/allocations go to profile_summary.json next
+    to loss_history.json; profile_trace_epochs={phase: [epochs]} also
+    writes torch.profiler chrome traces for those epochs.
+    population_prior: a prior.rebuild_prior file; a user trained from
+    scratch starts at their medication-mix median instead of the
+    UserParams defaults.
+    history_days / history_meals bound the history trained on: only meals
+    from the last N days of the user's data, and at most the M most recent
+    train meals (val is cut to the same time span), so per-epoch cost
+    stops growing with tenure. phase_decay_half_life_days={phase: days}
+    additionally down-weights older meals in that phase's training loss.
+    """
     torch.manual_seed(seed)
     ckpt_dir = Path(checkpoint_dir) / user_id 
     ckpt_dir.mkdir(parents=True, exist_ok=True)
 
-    print(f"\n[train] Loading data for user {user_id}...")
-    train_seqs, val_seqs, test_seqs, meds_dicts= load_training_data(
-        db_path             = db_path,
-        user_id             = user_id,
-        supabase_url        = supabase_url,
-        supabase_key        = supabase_key,
-        fingerstick_json    = fingerstick_json,
-        entries_list        = fingerstick_entries,
-        days_since_start    = days_since_start,
-        seed                = seed,
-    )
+    if dataset_file is not None:
+        print(f"\n[train] Loading cached dataset {dataset_file} for user {user_id}...")
+        cached = load_dataset(dataset_file)
+        train_seqs, val_seqs, test_seqs, meds_dicts = (
+            cached["train"], cached["val"], cached["test"], cached.get("medications", []),
+        )
+    else:
+        print(f"\n[train] Loading data for user {user_id}...")
+        train_seqs, val_seqs, test_seqs, meds_dicts= load_training_data(
+            db_path             = db_path,
+            user_id             = user_id,
+            supabase_url        = supabase_url,
+            supabase_key        = supabase_key,
+            fingerstick_json    = fingerstick_json,
+            entries_list        = fingerstick_entries,
+            days_since_start    = days_since_start,
+            seed                = seed,
+        )
     print(f"[train] train={len(train_seqs['meal_features'])}  "
           f"val={len(val_seqs['meal_features'])}  "
           f"meds={len(meds_dicts)}")
 
-    params = UserParams()
+    if history_days is not None or history_meals is not None:
+        n_before = len(train_seqs["meal_features"])
+        newest   = max(_meal_stamps(train_seqs) + _meal_stamps(val_seqs), default=None)
+        keep     = history_window_indices(train_seqs, history_days, history_meals, newest)
+        train_seqs = subset_sequences(train_seqs, keep)
+        oldest   = min(_meal_stamps(train_seqs), default=None)
+        if oldest is not None:
+            span_days = (newest - oldest) / 86400.0
+            val_seqs  = subset_sequences(val_seqs, history_window_indices(val_seqs, span_days, None, newest))
+        print(f"[train] history window: {len(keep)}/{n_before} train meals, "
+              f"{len(val_seqs['meal_features'])} val meals "
+              f"(last {history_days if history_days is not None else 'all'} days, "
+              f"max {history_meals if history_meals is not None else 'all'} meals)")
+
+    warm_params: Optional[UserParams] = None
+    if fine_tune:
+        warm_params, source = load_warm_start(user_id, ckpt_dir, supabase_url, supabase_key)
+        if warm_params is None:
+            print("[train] WARNING: fine_tune requested but no saved params found — running full training")
+        else:
+            keep = recent_meal_indices(train_seqs, recent_days, old_sample_frac, np.random.default_rng(seed))
+            print(f"[train] fine-tune from {source}: {len(keep)}/{len(train_seqs['meal_features'])} "
+                  f"train meals (last {recent_days:g} days + {old_sample_frac:.0%} of older)")
+            train_seqs = subset_sequences(train_seqs, keep)
+
+    train_ds = val_ds = generator = None
+    if batch_size:
+        train_ds  = MealSequenceDataset.from_split(train_seqs, dt_minutes, horizon_minutes)
+        val_ds    = MealSequenceDataset.from_split(val_seqs,   dt_minutes, horizon_minutes)
+        generator = torch.Generator().manual_seed(seed)
+        print(f"[train] mini-batch mode: batch_size={batch_size}  "
+              f"steps/epoch={-(-len(train_ds) // batch_size)}  T={train_ds.n_steps}")
+
+    params = warm_params if warm_params is not None else UserParams()
+    if warm_params is None and population_prior:
+        prior = load_prior(population_prior)
+        if prior is not None:
+            params, prior_key = prior_params(prior, [m.get("med_class") for m in meds_dicts])
+            print(f"[train] Initialised from population prior '{prior_key}' ({population_prior})")
+    lambdas = {**DEFAULT_LOSS_LAMBDAS, **(loss_lambdas or {})}
     loss_fn = GlucoseLoss(
-        lambda_fingerstick = 1.0,  
-        lambda_window      = 1.0,
-        lambda_phys        = 1.0,
-        lambda_med         = 1.0,
+        lambda_fingerstick = lambdas["fingerstick"],
+        lambda_window      = lambdas["window"],
+        lambda_phys        = lambdas["phys"],
+        lambda_med         = lambdas["med"],
         window_tolerance   = 10.0,
     )
+    if loss_lambdas:
+        # _compute_loss weights terms by the (frozen) lambda_* params, so seed those too
+        with torch.no_grad():
+            for name, value in loss_lambdas.items():
+                getattr(params, f"lambda_{name}").fill_(float(value))
 
     night_deltas, day_deltas = _day_night_deltas(train_seqs, params)
 
@@ -318,8 +873,18 @@ def train_user_model(
     else:
         start_phase = 3
 
-    print(f"[train] days_since_start={days_since_start} -> starting at phase {start_phase}")
-    if start_phase >1:
+    if warm_params is not None:
+        phases         = [FINE_TUNE_PHASE]
+        phase_epochs   = {FINE_TUNE_PHASE: fine_tune_epochs}
+        phase_lr       = {FINE_TUNE_PHASE: fine_tune_lr}
+        phase_patience = {FINE_TUNE_PHASE: FINE_TUNE_PATIENCE} if phase_patience else None
+        phase_min_epochs = {}
+    else:
+        phases = list(range(start_phase, 4))
+
+    if warm_params is None:
+        print(f"[train] days_since_start={days_since_start} -> starting at phase {start_phase}")
+    if start_phase >1 and warm_params is None:
         prev_ckpt = ckpt_dir / f"phase{start_phase - 1}_best.pt"
         if prev_ckpt.exists():
             checkpoint = torch.load(prev_ckpt)
@@ -331,38 +896,65 @@ def train_user_model(
     all_history: Dict[str, Dict] = {}
     total_meals    = len(train_seqs["meal_features"]) + len(val_seqs["meal_features"])
     final_val_loss = float("inf")
+    writer = CheckpointWriter(checkpoint_interval_s, checkpoint_interval_epochs)
+    profiler = StageProfiler(track_memory=profile_memory) if profile else NULL_PROFILER
 
-    for phase in range(start_phase,4):
-        history = _train_phase(
-            phase          = phase,
-            params         = params,
-            loss_fn        = loss_fn,
-            train_seqs     = train_seqs,
-            val_seqs       = val_seqs,
-            epochs         = phase_epochs[phase],
-            lr             = phase_lr[phase],
-            checkpoint_dir = ckpt_dir,
-            night_deltas   = night_deltas,
-            day_deltas     = day_deltas,
-        )
-        all_history[f"phase{phase}"] = history 
-        best_ckpt = ckpt_dir / f"phase{phase}_best.pt"
-        ckpt_data = torch.load(best_ckpt)
-        params.load_state_dict(ckpt_data["params"])
-        final_val_loss = ckpt_data["val_loss"]
-        
-    final_path = ckpt_dir / "final_params.pt"
-    torch.save(params.state_dict(), final_path)
+    try:
+        for phase in phases:
+            history = _train_phase(
+                phase          = phase,
+                params         = params,
+                loss_fn        = loss_fn,
+                train_seqs     = train_seqs,
+                val_seqs       = val_seqs,
+                epochs         = phase_epochs[phase],
+                lr             = phase_lr[phase],
+                checkpoint_dir = ckpt_dir,
+                night_deltas   = night_deltas,
+                day_deltas     = day_deltas,
+                batch_size     = batch_size,
+                train_dataset  = train_ds,
+                val_dataset    = val_ds,
+                generator      = generator,
+                on_epoch       = progress_callback,
+                patience       = phase_patience.get(phase) if phase_patience else None,
+                min_epochs     = phase_min_epochs.get(phase, 0),
+                min_delta      = min_delta,
+                checkpoint_writer = writer,
+                optimizer_name = (phase_optimizer or {}).get(phase, "adam"),
+                profiler       = profiler,
+                trace_epochs   = (profile_trace_epochs or {}).get(phase),
+                val_interval   = val_interval,
+                async_validation = async_validation,
+                fold_frozen    = fold_frozen,
+                decay_half_life_days = (phase_decay_half_life_days or {}).get(phase),
+                tbptt_steps    = tbptt_steps,
+                checkpoint_activations = checkpoint_activations,
+            )
+            all_history[f"finetune_phase{phase}" if warm_params is not None else f"phase{phase}"] = history 
+            final_val_loss = history["best_val"]
+
+        final_path = ckpt_dir / "final_params.pt"
+        writer.submit(final_path, snapshot_state(params))
+    finally:
+        # flush queued checkpoints and stop the writer thread even when a phase raises
+        writer.close()
     print(f"\n[train] Training complete. Final params aved -> {final_path}")
     history_path = ckpt_dir / "loss_history.json"
     with open(history_path,"w") as f:
         json.dump(all_history, f, indent=2)
     print(f"[train] Loss history saved -> {history_path}")
+    if profile:
+        profiler.stop()
+        profile_path = ckpt_dir / "profile_summary.json"
+        with open(profile_path, "w") as f:
+            json.dump(profiler.summary(), f, indent=2)
+        print(f"[train] Profile summary saved -> {profile_path}")
     if upload_to_supabase:
         upload_params_to_supabase(
             user_id        = user_id,
             params         = params,
-            training_phase = start_phase,     
+            training_phase = phases[-1],      # FINE_TUNE_PHASE for fine-tune runs
             best_val_loss  = final_val_loss,
             num_meals_seen = total_meals,
             supabase_url   = supabase_url,
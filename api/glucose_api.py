@@ -1,56 +1,49 @@
 from __future__ import annotations
 from flask import Flask, request, jsonify 
-from typing import Dict, List, Any 
+from typing import Dict, List, Any, Optional
 import torch 
 import json
 import os 
 import traceback
 from ai.models.user.parameters import UserParams
+from ai.storage.supabase_client import get_supabase
+from api.param_cache import get_param_cache
 from ai.prediction.forecast import forecast, select_window
 from ai.prediction.confidence import build_forecast_response
 
 app = Flask(__name__)
 
+def _fetch_user_params_row(user_id: str) -> Optional[Dict[str, Any]]:
+    # the user's user_model_params row, None if they have none; errors propagate
+    url = os.environ.get("EXPO_PUBLIC_SUPABASE_URL")
+    key = os.environ.get("EXPO_PUBLIC_SUPABASE_KEY")
+    if not url or not key:
+        print(f"  [api] Supabase credentials missing — using default params for {user_id}")
+        return None
+    sb = get_supabase(url, key)
+    resp =(
+        sb.table("user_model_params")
+        .select("*")
+        .eq("user_id", user_id)
+        .limit(1)
+        .execute()
+    )
+    rows = resp.data or []
+    if not rows:
+        print(f"    [api] No trained params fond for {user_id} - using defaults")
+        return None
+    print(f"    [api] Loaded trained params for user {user_id}"
+        f"(phase {rows[0].get('training_phase','?')})")
+    return rows[0]
+
 def _load_user_params(user_id: str) -> UserParams:
-    params = UserParams()
+    # frozen, shared between requests - callers must not modify it
     try:
-        from supabase import create_client
-        url = os.environ.get("EXPO_PUBLIC_SUPABASE_URL")
-        key = os.environ.get("EXPO_PUBLIC_SUPABASE_KEY")
-        if not url or not key:
-            print(f"  [api] Supabase credentials missing — using default params for {user_id}")
-            return params
-        sb = create_client(url,key)
-        resp =(
-            sb.table("user_model_params")
-            .select("*")
-            .eq("user_id", user_id)
-            .limit(1)
-            .execute()
-        )
-        rows = resp.data or []
-        if not rows:
-            print(f"    [api] No trained params fond for {user_id} - using defaults")
-            return params
-        row = rows[0]
-        scalar_fields = ["Gb", "beta1", "beta2", "beta3", "beta4", "beta5",
-            "su", "k_base", "alpha", "eta_liq_u", "eta_fp_u", "delta_u",
-            "lambda_fingerstick", "lambda_window", "lambda_phys", "lambda_med",]
-        state = params.state_dict()
-        for field in scalar_fields:
-            if field in row and row[field] is not None:
-                state[field] = torch.tensor(float(row[field]))
-        if "alpha_activity_raw" in row and row["alpha_activity_raw"] is not None:
-            state["alpha_activity_raw"] = torch.tensor(
-                row["alpha_activity_raw"], dtype=torch.float32
-            )
-        params.load_state_dict(state)
-        print(f"    [api] Loaded trained params for user {user_id}"
-            f"(phase {row.get('training_phase','?')})")
+        return get_param_cache().get(user_id, _fetch_user_params_row)
     except Exception as e:
         print(f"    [api] WARNING: Could not load user params: {e}")
         traceback.print_exc()
-    return params
+        return UserParams()
 
 @app.route('/simulate-glucose', methods=['POST'])
 def simulate_glucose_endpoint():
@@ -79,43 +72,72 @@ def simulate_glucose_endpoint():
         traceback.print_exc()
         return jsonify({"error":str(e)}), 500
 
+def _job_response(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "jobId":      job["job_id"],
+        "userId":     job["user_id"],
+        "status":     job["status"],
+        "progress":   job["progress"],
+        "error":      job["error"],
+        "createdAt":  job["created_at"],
+        "startedAt":  job["started_at"],
+        "finishedAt": job["finished_at"],
+        **(job["result"] or {}),
+    }
+
 @app.route('/train-model', methods=['POST'])
 def train_model_endpoint():
+    # queues the run and returns at once - poll GET /train-model/<job_id>
     try:
         data = request.get_json()
         user_id = data.get('userId')
-        num_epochs = data.get('num_epochs',100)
         db_path = data.get("dbPath","./glucose_app.db")
         days_since_start = int(data.get("daysSinceStart",0))
         fingerstick_entries = data.get("fingersticks")
         phase_epochs = data.get("phaseEpochs") or {1: 200, 2: 300, 3: 500}
         seed = int(data.get("seed",42))
+        batch_size = data.get("batchSize")
+        fine_tune = bool(data.get("fineTune", False))
+        phase_optimizer = data.get("phaseOptimizer")
+        val_interval = int(data.get("valInterval", 1))
+        async_validation = bool(data.get("asyncValidation", False))
+        history_days = data.get("historyDays")
+        history_meals = data.get("historyMeals")
 
         if not user_id:
             return jsonify({'error': 'userId required'}), 400 
-        from ai.training.train import train_user_model, extract_params_dict
+        from api.training_jobs import get_job_queue
 
-        params = train_user_model(
-            user_id             = user_id,
-            db_path             = db_path,
-            days_since_start    = days_since_start,
-            fingerstick_entries = fingerstick_entries,
-            phase_epochs        = phase_epochs,
-            seed                = seed,
-            supabase_url        = os.environ.get("EXPO_PUBLIC_SUPABASE_URL"),
-            supabase_key        = os.environ.get("EXPO_PUBLIC_SUPABASE_KEY"),
-            upload_to_supabase  = True,
-        )
-        return jsonify({
-            'messgage': 'Model trained successfully',
-            'userID': user_id,
-            "learnedParams": extract_params_dict(params)
+        job = get_job_queue().submit(user_id, {
+            "db_path":             db_path,
+            "days_since_start":    days_since_start,
+            "fingerstick_entries": fingerstick_entries,
+            "phase_epochs":        phase_epochs,
+            "seed":                seed,
+            "batch_size":          int(batch_size) if batch_size else None,
+            "fine_tune":           fine_tune,
+            "phase_optimizer":     phase_optimizer,
+            "val_interval":        val_interval,
+            "async_validation":    async_validation,
+            "population_prior":    os.environ.get("POPULATION_PRIOR_PATH"),
+            "history_days":        float(history_days) if history_days is not None else None,
+            "history_meals":       int(history_meals) if history_meals is not None else None,
+            "upload_to_supabase":  True,
         })
+        return jsonify({**_job_response(job), "coalesced": job["coalesced"]}), 202
     except Exception as e:
         print(f"Error in train_model endpoint: {e}")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/train-model/<job_id>', methods=['GET'])
+def train_model_status_endpoint(job_id: str):
+    from api.training_jobs import get_job_queue
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": f"unknown job {job_id}"}), 404
+    return jsonify(_job_response(job))
+
 @app.route("/health", methods=["GET"])
 def health():
     return jsonify({"status":"ok"})
@@ -0,0 +1,164 @@
+"""
+Per-user UserParams cache for /simulate-glucose.
+
+Without it every prediction request queried user_model_params and
+rebuilt a UserParams module. Entries are frozen (no grad) modules kept in
+an in-process LRU for `ttl_s` seconds; users without a trained row are
+cached too (as defaults), since training completion invalidates them.
+
+Invalidation is pushed, not just timed out: a finished training job and
+upload_params_to_supabase both drop the user's entry. With `shared_dir`
+(PARAM_CACHE_DIR) the API workers also share one on-disk copy of each
+row, and an invalidation in any process (including the training worker
+processes) writes a stamp file that every other worker checks before it
+trusts its own entry.
+
+    cache  = get_param_cache()
+    params = cache.get("u1", fetch_row)     # fetch_row(user_id) -> row dict or None
+    cache.invalidate("u1")
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+from ai.data.fleet import write_json_atomic
+from ai.models.user.parameters import UserParams, params_from_dict
+
+DEFAULT_TTL_S       = float(os.environ.get("PARAM_CACHE_TTL_S", "300"))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("PARAM_CACHE_MAX", "1024"))
+DEFAULT_SHARED_DIR  = os.environ.get("PARAM_CACHE_DIR") or None
+
+RowLoader = Callable[[str], Optional[Mapping[str, Any]]]
+
+
+def _freeze(row: Optional[Mapping[str, Any]]) -> UserParams:
+    params = params_from_dict(row) if row else UserParams()
+    params.requires_grad_(False)
+    params.eval()
+    return params
+
+
+class UserParamsCache:
+    def __init__(
+        self,
+        ttl_s:       float         = DEFAULT_TTL_S,
+        max_entries: int           = DEFAULT_MAX_ENTRIES,
+        shared_dir:  Optional[str] = DEFAULT_SHARED_DIR,
+    ):
+        self.ttl_s       = ttl_s
+        self.max_entries = max(1, max_entries)
+        self.shared_dir  = Path(shared_dir) if shared_dir else None
+        self._entries: "OrderedDict[str, Tuple[UserParams, float]]" = OrderedDict()   # user -> (params, loaded_at)
+        # bumped by invalidate (per user) and clear (all users): a load that saw an older value is stale
+        self._generations: Dict[str, int] = {}
+        self._clears = 0
+        self._lock  = threading.Lock()
+        self.stats  = {"hits": 0, "misses": 0, "shared_hits": 0, "invalidations": 0, "stale_loads": 0}
+        if self.shared_dir is not None:
+            self.shared_dir.mkdir(parents=True, exist_ok=True)
+
+    # shared dir: <hash>.json holds the row, <hash>.stamp marks the last invalidation;
+    # user_id comes from request bodies, so it is hashed rather than used as a path
+    def _shared_paths(self, user_id: str) -> Tuple[Path, Path]:
+        name = hashlib.sha256(user_id.encode()).hexdigest()
+        return self.shared_dir / f"{name}.json", self.shared_dir / f"{name}.stamp"
+
+    def _invalidated_after(self, user_id: str, loaded_at: float) -> bool:
+        if self.shared_dir is None:
+            return False
+        try:
+            return self._shared_paths(user_id)[1].stat().st_mtime >= loaded_at
+        except FileNotFoundError:
+            return False
+
+    def _read_shared(self, user_id: str, now: float) -> Optional[Tuple[Optional[Mapping[str, Any]], float]]:
+        if self.shared_dir is None:
+            return None
+        row_path, _ = self._shared_paths(user_id)
+        try:
+            with open(row_path) as f:
+                cached = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        loaded_at = cached.get("loaded_at", 0.0)
+        if now - loaded_at > self.ttl_s or self._invalidated_after(user_id, loaded_at):
+            return None
+        return cached.get("row"), loaded_at
+
+    def _generation(self, user_id: str) -> Tuple[int, int]:
+        return self._clears, self._generations.get(user_id, 0)
+
+    def get(self, user_id: str, loader: RowLoader) -> UserParams:
+        """
+        Cached params for `user_id`; on a miss, loader(user_id) returns the
+        user_model_params row (None = no trained params). Loader errors
+        propagate and are not cached. A load that an invalidate() overtook
+        is returned to its caller but never cached.
+        """
+        now = time.time()
+        with self._lock:
+            generation = self._generation(user_id)
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry[1] <= self.ttl_s and not self._invalidated_after(user_id, entry[1]):
+                self._entries.move_to_end(user_id)
+                self.stats["hits"] += 1
+                return entry[0]
+        shared = self._read_shared(user_id, now)
+        if shared is not None:
+            row, loaded_at = shared
+            self.stats["shared_hits"] += 1
+        else:
+            row, loaded_at = loader(user_id), now
+            self.stats["misses"] += 1
+            # a stale shared row is still caught by the stamp check (stamp mtime >= loaded_at)
+            if self.shared_dir is not None and self._generation(user_id) == generation:
+                write_json_atomic(self._shared_paths(user_id)[0], {"loaded_at": loaded_at, "row": row})
+        params = _freeze(row)
+        with self._lock:
+            if self._generation(user_id) != generation:
+                self.stats["stale_loads"] += 1
+                return params
+            self._entries[user_id] = (params, loaded_at)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return params
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self.stats["invalidations"] += 1
+        if self.shared_dir is not None:
+            row_path, stamp_path = self._shared_paths(user_id)
+            stamp_path.touch()
+            row_path.unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._clears += 1
+
+
+_default_cache: Optional[UserParamsCache] = None
+_default_lock = threading.Lock()
+
+
+def get_param_cache() -> UserParamsCache:
+    global _default_cache
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                _default_cache = UserParamsCache()
+    return _default_cache
+
+
+def invalidate_user_params(user_id: str) -> None:
+    get_param_cache().invalidate(user_id)
@@ -0,0 +1,387 @@
+"""
+Background training jobs for /train-model.
+
+Jobs are rows in a small local SQLite file, so a queued or finished job
+survives an API restart. A dispatcher thread in the API process claims
+queued rows and hands them to a bounded pool of worker processes; the
+worker runs train_user_model and writes progress and the result back to
+the same row. Flask threads only ever insert or read rows, so
+/simulate-glucose stays responsive while models train.
+
+One user has at most one live job: submitting while a job for the same
+user is queued or running returns that job (a queued job takes the newer
+request's arguments).
+
+Credentials never reach the file: submit() drops supabase_url /
+supabase_key from the kwargs and the worker reads them from its own
+environment (EXPO_PUBLIC_SUPABASE_URL / EXPO_PUBLIC_SUPABASE_KEY).
+
+Several API processes may share the file. A claimed row records its owner
+(host, boot id, pid) and a heartbeat that the owner's dispatcher and the
+worker's progress writes keep fresh; a running row is only handed back to
+the queue once its owner is known dead or its heartbeat has gone stale.
+
+    queue = get_job_queue()
+    job   = queue.submit("u1", {"days_since_start": 3})
+    queue.get(job["job_id"])
+"""
+from __future__ import annotations
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+DEFAULT_JOBS_DB      = os.environ.get("TRAINING_JOBS_DB", "./training_jobs.db")
+DEFAULT_MAX_WORKERS  = int(os.environ.get("TRAINING_MAX_WORKERS", "2"))
+PROGRESS_INTERVAL_S  = 1.0
+DISPATCH_POLL_S      = 1.0
+HEARTBEAT_INTERVAL_S = 10.0
+STALE_AFTER_S        = float(os.environ.get("TRAINING_JOB_STALE_S", "120"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+LIVE_STATUSES = (QUEUED, RUNNING)
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS training_jobs (
+    job_id       TEXT PRIMARY KEY,
+    user_id      TEXT NOT NULL,
+    status       TEXT NOT NULL,
+    kwargs       TEXT NOT NULL,
+    progress     TEXT,
+    result       TEXT,
+    error        TEXT,
+    created_at   REAL NOT NULL,
+    started_at   REAL,
+    finished_at  REAL,
+    owner        TEXT,
+    heartbeat_at REAL
+)"""
+# columns added after the first release; older files get them on open
+MIGRATED_COLUMNS = {"owner": "TEXT", "heartbeat_at": "REAL"}
+INDEX = "CREATE INDEX IF NOT EXISTS idx_training_jobs_user_status ON training_jobs (user_id, status)"
+
+JSON_FIELDS = ("kwargs", "progress", "result")
+# kwargs that are never persisted; the worker fills them from its environment
+CREDENTIAL_KWARGS = {
+    "supabase_url": "EXPO_PUBLIC_SUPABASE_URL",
+    "supabase_key": "EXPO_PUBLIC_SUPABASE_KEY",
+}
+PHASE_KEYED_KWARGS = (
+    "phase_epochs", "phase_lr", "phase_patience", "phase_min_epochs", "phase_optimizer",
+    "phase_decay_half_life_days",
+)
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    # short-lived handles; WAL lets the API read while a worker writes progress
+    conn = sqlite3.connect(db_path, timeout=30.0, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+def _boot_id() -> str:
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def process_owner() -> str:
+    return f"{socket.gethostname()}:{_boot_id()}:{os.getpid()}"
+
+
+def _owner_gone(owner: Optional[str]) -> bool:
+    # only decidable for owners on this host; anything else waits for its heartbeat to go stale
+    if not owner:
+        return True
+    parts = owner.rsplit(":", 2)
+    if len(parts) != 3:
+        return False
+    host, boot, pid = parts
+    if host != socket.gethostname():
+        return False
+    if boot != _boot_id():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except (PermissionError, ValueError):
+        return False
+    return False
+
+
+def _row_to_job(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    job = dict(row)
+    for key in JSON_FIELDS:
+        job[key] = json.loads(job[key]) if job[key] else None
+    return job
+
+
+def _update(db_path: str, job_id: str, **fields: Any) -> None:
+    for key in JSON_FIELDS:
+        if key in fields and fields[key] is not None:
+            fields[key] = json.dumps(fields[key])
+    cols = ", ".join(f"{k} = ?" for k in fields)
+    conn = _connect(db_path)
+    try:
+        conn.execute(f"UPDATE training_jobs SET {cols} WHERE job_id = ?", (*fields.values(), job_id))
+    finally:
+        conn.close()
+
+
+def _run_job(db_path: str, job_id: str, user_id: str, kwargs: Dict[str, Any]) -> str:
+    # runs in the worker process - the row is the only channel back to the API
+    from ai.training.train import PARAMS_UPLOADED_HOOKS, extract_params_dict, train_user_model
+    from api.param_cache import invalidate_user_params
+
+    # uploads from this worker reach the API workers through the shared cache dir
+    if invalidate_user_params not in PARAMS_UPLOADED_HOOKS:
+        PARAMS_UPLOADED_HOOKS.append(invalidate_user_params)
+
+    for key, env in CREDENTIAL_KWARGS.items():
+        kwargs[key] = os.environ.get(env)
+    # JSON object keys come back as strings; train_user_model indexes by phase int
+    for key in PHASE_KEYED_KWARGS:
+        if kwargs.get(key):
+            kwargs[key] = {int(k): v for k, v in kwargs[key].items()}
+    last_write = [0.0]
+
+    def on_progress(p: Dict) -> None:
+        now = time.monotonic()
+        if now - last_write[0] >= PROGRESS_INTERVAL_S or p["epoch"] == p["epochs"]:
+            last_write[0] = now
+            _update(db_path, job_id, progress=p, heartbeat_at=time.time())
+
+    try:
+        params = train_user_model(user_id=user_id, progress_callback=on_progress, **kwargs)
+        _update(db_path, job_id, status=DONE, finished_at=time.time(),
+                result={"learnedParams": extract_params_dict(params)})
+        return DONE
+    except Exception as e:
+        traceback.print_exc()
+        _update(db_path, job_id, status=FAILED, finished_at=time.time(),
+                error=f"{type(e).__name__}: {e}")
+        return FAILED
+
+
+class TrainingJobQueue:
+    def __init__(self, db_path: str = DEFAULT_JOBS_DB, max_workers: int = DEFAULT_MAX_WORKERS):
+        self.db_path     = str(Path(db_path).resolve())
+        self.max_workers = max(1, max_workers)
+        self.owner       = process_owner()
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = _connect(self.db_path)
+        try:
+            conn.execute(SCHEMA)
+            have = {r["name"] for r in conn.execute("PRAGMA table_info(training_jobs)")}
+            for name, kind in MIGRATED_COLUMNS.items():
+                if name not in have:
+                    conn.execute(f"ALTER TABLE training_jobs ADD COLUMN {name} {kind}")
+            conn.execute(INDEX)
+            # files written before credentials were stripped still carry them in queued/finished rows
+            paths = [f"'$.{key}'" for key in CREDENTIAL_KWARGS]
+            conn.execute(
+                f"UPDATE training_jobs SET kwargs = json_remove(kwargs, {', '.join(paths)}) "
+                f"WHERE {' OR '.join(f'json_type(kwargs, {p}) IS NOT NULL' for p in paths)}"
+            )
+        finally:
+            conn.close()
+
+        # spawn, not fork: the API process has live threads and torch state
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"),
+        )
+        self._running: Dict[str, Future] = {}
+        self._wake    = threading.Event()
+        self._stop    = threading.Event()
+        self._last_heartbeat = time.monotonic()
+        self.requeue_orphans()
+        self._thread  = threading.Thread(target=self._dispatch_loop, name="training-dispatch", daemon=True)
+        self._thread.start()
+
+    def requeue_orphans(self) -> List[str]:
+        """
+        Puts running jobs whose owner process is gone, or whose heartbeat
+        is older than STALE_AFTER_S, back in the queue. Live jobs of other
+        API processes sharing the file are left alone.
+        """
+        cutoff = time.time() - STALE_AFTER_S
+        conn = _connect(self.db_path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT job_id, owner, heartbeat_at FROM training_jobs WHERE status = ?", (RUNNING,),
+            ).fetchall()
+            orphans = [r["job_id"] for r in rows
+                       if r["owner"] != self.owner
+                       and ((r["heartbeat_at"] or 0.0) < cutoff or _owner_gone(r["owner"]))]
+            for job_id in orphans:
+                conn.execute(
+                    "UPDATE training_jobs SET status = ?, started_at = NULL, owner = NULL, heartbeat_at = NULL "
+                    "WHERE job_id = ? AND status = ?",
+                    (QUEUED, job_id, RUNNING),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        if orphans:
+            print(f"    [jobs] Re-queued {len(orphans)} interrupted training job(s)")
+            self._wake.set()
+        return orphans
+
+    def _heartbeat(self) -> None:
+        # the worker only writes while it reports progress; this covers data loading and slow epochs
+        if not self._running:
+            return
+        job_ids = list(self._running)
+        conn = _connect(self.db_path)
+        try:
+            conn.execute(
+                f"UPDATE training_jobs SET heartbeat_at = ? WHERE owner = ? AND status = ? "
+                f"AND job_id IN ({', '.join('?' for _ in job_ids)})",
+                (time.time(), self.owner, RUNNING, *job_ids),
+            )
+        finally:
+            conn.close()
+
+    def submit(self, user_id: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        kwargs = {k: v for k, v in kwargs.items() if k not in CREDENTIAL_KWARGS}
+        conn = _connect(self.db_path)
+        try:
+            # IMMEDIATE: two requests for the same user cannot both miss the live job
+            conn.execute("BEGIN IMMEDIATE")
+            live = conn.execute(
+                "SELECT * FROM training_jobs WHERE user_id = ? AND status IN (?, ?) "
+                "ORDER BY created_at LIMIT 1",
+                (user_id, *LIVE_STATUSES),
+            ).fetchone()
+            if live is not None:
+                if live["status"] == QUEUED:
+                    conn.execute("UPDATE training_jobs SET kwargs = ? WHERE job_id = ?",
+                                 (json.dumps(kwargs), live["job_id"]))
+                conn.execute("COMMIT")
+                job = self.get(live["job_id"])
+                job["coalesced"] = True
+                return job
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO training_jobs (job_id, user_id, status, kwargs, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job_id, user_id, QUEUED, json.dumps(kwargs), time.time()),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        self._wake.set()
+        job = self.get(job_id)
+        job["coalesced"] = False
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        conn = _connect(self.db_path)
+        try:
+            row = conn.execute("SELECT * FROM training_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return _row_to_job(row)
+
+    def _claim_next(self) -> Optional[Dict[str, Any]]:
+        conn = _connect(self.db_path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM training_jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,),
+            ).fetchone()
+            if row is not None:
+                now = time.time()
+                conn.execute(
+                    "UPDATE training_jobs SET status = ?, started_at = ?, owner = ?, heartbeat_at = ? "
+                    "WHERE job_id = ?",
+                    (RUNNING, now, self.owner, now, row["job_id"]),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return _row_to_job(row)
+
+    def _on_done(self, job_id: str, user_id: str, fut: Future) -> None:
+        from api.param_cache import invalidate_user_params
+        self._running.pop(job_id, None)
+        # new params (or none) either way - drop this process's cached copy
+        invalidate_user_params(user_id)
+        try:
+            status = fut.result()
+            print(f"    [jobs] {job_id}: {status}")
+        except Exception as e:
+            # worker died before it could write its own status (OOM kill, segfault)
+            _update(self.db_path, job_id, status=FAILED, finished_at=time.time(),
+                    error=f"{type(e).__name__}: {e}")
+            print(f"    [jobs] {job_id}: worker lost - {e}")
+        self._wake.set()
+
+    def _dispatch_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                while len(self._running) < self.max_workers:
+                    job = self._claim_next()
+                    if job is None:
+                        break
+                    job_id = job["job_id"]
+                    print(f"    [jobs] {job_id}: training user {job['user_id']}")
+                    fut = self._pool.submit(_run_job, self.db_path, job_id, job["user_id"], job["kwargs"])
+                    self._running[job_id] = fut
+                    fut.add_done_callback(lambda f, j=job_id, u=job["user_id"]: self._on_done(j, u, f))
+                if time.monotonic() - self._last_heartbeat >= HEARTBEAT_INTERVAL_S:
+                    self._last_heartbeat = time.monotonic()
+                    self._heartbeat()
+                    self.requeue_orphans()
+            except Exception as e:
+                print(f"    [jobs] WARNING: dispatch failed: {e}")
+                traceback.print_exc()
+            self._wake.wait(DISPATCH_POLL_S)
+            self._wake.clear()
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._pool.shutdown(wait=wait)
+
+
+_default_queue: Optional[TrainingJobQueue] = None
+_default_lock = threading.Lock()
+
+
+def get_job_queue() -> TrainingJobQueue:
+    # created on first use so importing the API never starts worker processes
+    global _default_queue
+    if _default_queue is None:
+        with _default_lock:
+            if _default_queue is None:
+                _default_queue = TrainingJobQueue()
+    return _default_queue
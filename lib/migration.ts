@@ -1,6 +1,6 @@
 import { getDBHandle, initDB } from "./db";
 
-const SCHEMA_VERSION = 2;
+const SCHEMA_VERSION = 3;
 
 export async function runMigration(): Promise<void> {
   await initDB();
@@ -93,6 +93,14 @@ export async function runMigration(): Promise<void> {
       "CREATE INDEX IF NOT EXISTS idx_glucose_readings_timestamp ON glucose_readings (timestamp);",
     );
   }
+  // ── v3
+  if (currentVersion < 3) {
+    // covers the training-side meal query (ai/data/preprocessing.py MEAL_QUERY):
+    // range on timestamp, carbs > 0 filter, and every projected column
+    await db.execAsync(
+      "CREATE INDEX IF NOT EXISTS idx_food_log_timestamp_carbs ON food_log (timestamp, carbs, fat, protein, fiber, is_liquid, id);",
+    );
+  }
   await db.runAsync(
     "INSERT OR REPLACE INTO _meta (key, value) VALUES ('schema_version', ?);",
     [String(SCHEMA_VERSION)],
@@ -0,0 +1,126 @@
+"""Shared synthetic inputs for the behaviour tests (no databases, no network)."""
+from __future__ import annotations
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List
+
+import pytest
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai.data.ingest import ingest_database  # noqa: E402
+from ai.simulation.batch_simulation import MealBatch  # noqa: E402
+
+T0 = datetime(2025, 6, 1, 7, 0, tzinfo=timezone.utc)
+
+
+def make_meal_batch(B: int = 4, T: int = 12, seed: int = 0) -> MealBatch:
+    g = torch.Generator().manual_seed(seed)
+    rand = lambda *shape: torch.rand(*shape, generator=g)
+    obs = torch.full((B, T), float("nan"))
+    obs[:, T // 2] = 120.0 + 20.0 * rand(B)
+    return MealBatch(
+        carbs          = 30.0 + 40.0 * rand(B),
+        fiber_ratio    = 0.1 * rand(B),
+        fatprotein     = rand(B),
+        is_liquid      = rand(B) > 0.7,
+        carb_mult      = torch.ones(B),
+        insulin_mult   = torch.ones(B),
+        activity_feats = rand(B, 6),
+        hrv_drop       = rand(B),
+        hrv_post_mean  = rand(B),
+        hrv_drop_norm  = rand(B),
+        hr_response    = rand(B),
+        lengths        = torch.full((B,), T, dtype=torch.long),
+        age_days       = torch.arange(B, dtype=torch.float32),
+        dt_hours       = torch.arange(T, dtype=torch.float32).repeat(B, 1) * 0.25,
+        night          = torch.zeros(B, T),
+        ext_insulin    = 0.1 * rand(B, T),
+        mask           = torch.ones(B, T, dtype=torch.bool),
+        obs_glucose    = obs,
+        hr_obs         = rand(B),
+        hrv_obs        = rand(B),
+        G_b            = torch.full((B,), 96.0),
+        post_mask      = torch.ones(B, T, dtype=torch.bool),
+    )
+
+
+def make_meal_chain(n: int = 12) -> Dict[str, List[Dict]]:
+    # flat meal dicts and sensor windows in the training-dataset layout
+    t0 = T0
+    meals, windows = [], []
+    for i in range(n):
+        meals.append({
+            "meal_id": f"m{i}", "timestamp": (t0 + timedelta(hours=1.5 * i)).isoformat(),
+            "carbs": 20.0 + i, "fiber_ratio": 0.1, "fatprotein": 0.3, "is_liquid": False,
+            "medication_period": "unknown", "insulin_medications": [], "other_medications": [],
+        })
+        windows.append({"activity_mean": 0.1, "hr_peak": 90.0, "hrv_post_mean": 0.2, "hrv_baseline": 40.0,
+                        "real_packet_count": 10.0, "hrv_drop": 0.1, "hr_response": 0.1, "hrv_drop_norm": 0.1})
+    return {"meal_features": meals, "sensor_windows": windows}
+
+
+def make_raw_packets(n: int, start_unix: int, step_s: int = 60, first_seq: int = 0,
+                     seed: int = 0, skip: Iterable[int] = ()) -> List[Dict]:
+    # device-shaped packet dicts, one every step_s seconds; `skip` drops packets (by offset) to leave seq gaps
+    rnd = torch.Generator().manual_seed(seed)
+    rand = lambda: float(torch.rand((), generator=rnd))
+    skip = set(skip)
+    packets = []
+    for k in range(n):
+        u = start_unix + step_s * k
+        packet = {"seq": first_seq + k, "unix": u,
+                  "timestamp": datetime.fromtimestamp(u, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                  "steps": int(50 * rand()), "vm": rand(), "peak_vm": 2 * rand(),
+                  "hr": 70 + 20 * rand(), "hrv": 40 + 10 * rand(), "hrv_drop": rand(),
+                  "hr_drop": rand(), "hr_stability": rand(), "sleep_score": 100 * rand()}
+        if k not in skip:
+            packets.append(packet)
+    return packets
+
+
+def make_food_log(n_meals: int, seed: int = 0) -> List[Dict]:
+    # three meals a day from T0, food_log row shape
+    rnd = torch.Generator().manual_seed(seed)
+    rand = lambda: float(torch.rand((), generator=rnd))
+    return [{"id": f"f{i}", "recipe_name": f"meal {i}", "meal_type": "lunch",
+             "timestamp": (T0 + timedelta(days=i // 3, hours=5 * (i % 3))).isoformat().replace("+00:00", "Z"),
+             "carbs": 20 + 40 * rand(), "protein": 10 * rand(), "fat": 10 * rand(), "fiber": 5 * rand()}
+            for i in range(n_meals)]
+
+
+def make_user_db(path: str, n_meals: int = 24, seed: int = 0) -> str:
+    # n_meals meals with 1-min sensor packets from 30 min before to 2 h after each, one reading at +45 min
+    food, packets, readings = make_food_log(n_meals, seed), [], []
+    for i, meal in enumerate(food):
+        t = datetime.fromisoformat(meal["timestamp"].replace("Z", "+00:00"))
+        packets += make_raw_packets(150, int(t.timestamp()) - 1800, first_seq=150 * i, seed=seed + i)
+        r = t + timedelta(minutes=45)
+        readings.append({"id": f"g{i}", "timestamp": r.isoformat(), "unix": int(r.timestamp()),
+                         "glucose_mg_dl": 110.0 + 2 * i, "context": "post_meal", "meal_id": meal["id"]})
+    ingest_database(path, raw_packets=packets, food_log=food, glucose_readings=readings)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def _no_supabase(monkeypatch):
+    # never reach a real project from the tests
+    monkeypatch.delenv("EXPO_PUBLIC_SUPABASE_URL", raising=False)
+    monkeypatch.delenv("EXPO_PUBLIC_SUPABASE_KEY", raising=False)
+
+
+@pytest.fixture(scope="session")
+def user_db(tmp_path_factory) -> str:
+    return make_user_db(str(tmp_path_factory.mktemp("db") / "glucose_app.db"))
+
+
+@pytest.fixture
+def meal_batch() -> MealBatch:
+    return make_meal_batch()
+
+
+@pytest.fixture
+def meal_chain() -> Dict[str, List[Dict]]:
+    return make_meal_chain()
@@ -0,0 +1,64 @@
+import math
+
+import pytest
+import torch
+
+from ai.models.user.parameters import UserParams
+from ai.personalization.loss import GlucoseLoss, compute_loss_batch, masked_mean
+
+
+def _ragged(seed=0):
+    g = torch.Generator().manual_seed(seed)
+    preds, obs = [], []
+    for n in (5, 8, 3, 8):
+        preds.append(120 + 20 * torch.randn(n, generator=g))
+        o = 115 + 20 * torch.randn(n, generator=g)
+        o[torch.rand(n, generator=g) < 0.3] = float("nan")
+        obs.append(o)
+    return preds, obs, [100.0, 95.0, 110.0, 105.0]
+
+
+def test_batch_matches_per_sample_loop():
+    loss_fn = GlucoseLoss()
+    params = UserParams()
+    preds, obs, bases = _ragged()
+    batch, rows = compute_loss_batch(preds, obs, bases, loss_fn, return_breakdown=True, params=params)
+    expected = []
+    for p, o, b in zip(preds, obs, bases):
+        loss, terms = loss_fn(p.unsqueeze(0), o.unsqueeze(0), torch.tensor([b]), params=params)
+        expected.append(loss)
+        assert rows[len(expected) - 1]["fingerstick"] == pytest.approx(terms["fingerstick"], rel=1e-5)
+    assert batch.item() == pytest.approx(torch.stack(expected).mean().item(), rel=1e-5)
+
+
+def test_nan_observations_leave_gradients_finite():
+    pred = torch.full((2, 6), 130.0, requires_grad=True)
+    obs = torch.full((2, 6), float("nan"))
+    obs[0, 2] = 150.0
+    loss, _ = GlucoseLoss()(pred, obs, torch.tensor([100.0, 100.0]), return_breakdown=False)
+    loss.backward()
+    assert torch.isfinite(pred.grad).all()
+    # only the observed step carries gradient
+    assert (pred.grad != 0).sum() == 1
+
+
+def test_breakdown_is_optional_and_consistent():
+    preds, obs, bases = _ragged(seed=1)
+    pred, o = torch.stack([preds[1], preds[3]]), torch.stack([obs[1], obs[3]])
+    base = torch.tensor([bases[1], bases[3]])
+    loss_fn = GlucoseLoss()
+    quiet, empty = loss_fn(pred, o, base, return_breakdown=False)
+    loud, terms = loss_fn(pred, o, base)
+    assert empty == {}
+    assert quiet.item() == pytest.approx(terms["total"]) == pytest.approx(loud.item())
+    assert all(math.isfinite(v) for v in terms.values())
+
+
+def test_masked_mean_weights_and_empty_rows():
+    x = torch.tensor([[1.0, 3.0], [5.0, 7.0]])
+    mask = torch.tensor([[True, True], [False, False]])
+    assert masked_mean(x, mask, dim=1).tolist() == [2.0, 0.0]
+    weight = torch.tensor([[3.0], [1.0]])
+    full = torch.ones_like(mask)
+    # weighted mean of the row means (2 and 6) with weights 3:1
+    assert masked_mean(x, full, weight=weight).item() == pytest.approx(3.0)
@@ -0,0 +1,71 @@
+import json
+import time
+
+import pytest
+import torch
+
+from ai.training.checkpoint import CheckpointWriter, snapshot_state
+from ai.training.train import train_user_model
+
+
+def test_debounced_writes_keep_only_the_latest_payload(tmp_path):
+    path = tmp_path / "best.pt"
+    writer = CheckpointWriter(min_interval_s=3600)
+    writer.submit(path, {"epoch": 1}, epoch=1)
+    writer.flush()
+    for epoch in (2, 3, 4):
+        writer.submit(path, {"epoch": epoch}, epoch=epoch)
+    time.sleep(0.1)
+    # still inside the interval: nothing new on disk yet
+    assert torch.load(path) == {"epoch": 1}
+    writer.close()
+    assert torch.load(path) == {"epoch": 4}
+    assert writer.stats == {"submitted": 4, "written": 2}
+
+
+def test_epoch_interval(tmp_path):
+    path = tmp_path / "best.pt"
+    with CheckpointWriter(min_interval_s=None, min_interval_epochs=5) as writer:
+        writer.submit(path, {"epoch": 1}, epoch=1)
+        writer.flush()
+        writer.submit(path, {"epoch": 3}, epoch=3)
+        time.sleep(0.1)
+        assert torch.load(path) == {"epoch": 1}
+        writer.submit(path, {"epoch": 6}, epoch=6)
+        deadline = time.monotonic() + 5
+        while writer.stats["written"] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert torch.load(path) == {"epoch": 6}
+
+
+def test_background_errors_surface_on_flush(tmp_path):
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("")
+    writer = CheckpointWriter()
+    writer.submit(blocker / "best.pt", {"epoch": 1})
+    with pytest.raises(RuntimeError, match="background write failed"):
+        writer.flush()
+    writer.close()
+    with pytest.raises(RuntimeError, match="closed"):
+        writer.submit(tmp_path / "best.pt", {})
+
+
+def test_snapshot_does_not_follow_later_updates():
+    module = torch.nn.Linear(2, 1)
+    state = snapshot_state(module)
+    with torch.no_grad():
+        module.weight.add_(1.0)
+    assert not torch.equal(state["weight"], module.weight)
+    assert not state["weight"].requires_grad
+
+
+def test_training_leaves_the_final_best_on_disk(user_db, tmp_path):
+    train_user_model("u1", db_path=user_db, checkpoint_dir=str(tmp_path), upload_to_supabase=False,
+                     phase_epochs={1: 4, 2: 4, 3: 4}, checkpoint_interval_s=3600)
+    history = json.loads((tmp_path / "u1" / "loss_history.json").read_text())
+    for phase in (1, 2, 3):
+        ckpt = torch.load(tmp_path / "u1" / f"phase{phase}_best.pt")
+        assert ckpt["val_loss"] == pytest.approx(history[f"phase{phase}"]["best_val"])
+    final = torch.load(tmp_path / "u1" / "final_params.pt")
+    for name, value in ckpt["params"].items():
+        assert torch.equal(final[name], value)
@@ -0,0 +1,33 @@
+import torch
+
+from ai.models.user.parameters import UserParams
+from ai.personalization.loss import GlucoseLoss
+from ai.training.train import _chain_loss, decay_weights
+
+
+def _obs(n: int):
+    obs = torch.full((n,), float("nan"))
+    obs[0], obs[-1] = 180.0, 90.0
+    return obs, torch.full((n,), 80.0), torch.full((n,), 0.2), torch.full((n,), 96.0)
+
+
+def _loss(seqs, weights):
+    torch.manual_seed(0)
+    with torch.no_grad():
+        return _chain_loss(UserParams(), GlucoseLoss(), seqs, _obs(len(seqs["meal_features"])),
+                           weights=weights)[0].item()
+
+
+def test_decay_weights_halve_per_half_life(meal_chain):
+    w = decay_weights(meal_chain, half_life_days=1.0)
+    # meals are 1.5 h apart, newest last
+    assert w[-1] == 1.0
+    assert torch.allclose(w[0], torch.tensor(0.5 ** (1.5 * 11 / 24)))
+    assert torch.all(w[1:] > w[:-1])
+
+
+def test_chain_loss_applies_decay_weights(meal_chain):
+    n = len(meal_chain["meal_features"])
+    unweighted = _loss(meal_chain, None)
+    assert _loss(meal_chain, torch.ones(n)) == unweighted
+    assert _loss(meal_chain, decay_weights(meal_chain, half_life_days=0.05)) != unweighted
@@ -0,0 +1,71 @@
+import sqlite3
+from datetime import datetime, time
+
+import openpyxl
+import pytest
+
+from ai.data.dexcom_import import import_dexcom_workbook
+
+
+def _workbook(path, rows):
+    # columns A date, B time, C carbs, E glucose, F fasting, I notes; data from row 3
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["Dexcom export"])
+    ws.append(["Date", "Time", "Carbs", None, "Glucose", "Fasting", None, None, "Notes"])
+    for date, t, carbs, glucose, fasting, notes in rows:
+        ws.append([date, t, carbs, None, glucose, fasting, None, None, notes])
+    wb.save(path)
+    return str(path)
+
+
+ROWS = [
+    (datetime(2025, 6, 1), time(7, 50), None, None, 92,   None),
+    (None,                 time(8, 10), None, 120,  None, None),
+    (None,                 time(8, 40), None, 160,  None, None),
+    (None,                 time(8, 0),  45,   None, None, "oats"),   # meal typed after its readings
+    (None,                 time(8, 40), None, 161,  None, None),     # same second as the row above it
+    (None,                 time(7, 0),  None, 150,  None, None),     # 1h back: anomaly
+    (None,                 time(11, 55), None, 110, None, None),
+    (None,                 time(0, 20), None, 115,  None, None),     # 12:20 PM typed as 00:20
+    (None,                 time(23, 30), None, 105, None, None),
+    (None,                 time(0, 45), None, 100,  None, None),     # past midnight, before the next date
+    (datetime(2025, 6, 2), time(8, 0),  None, 95,   None, None),
+]
+
+
+def _table(db, sql):
+    with sqlite3.connect(db) as conn:
+        return conn.execute(sql).fetchall()
+
+
+def test_import_places_rows_and_counts_anomalies(tmp_path):
+    xlsx, db = _workbook(tmp_path / "export.xlsx", ROWS), str(tmp_path / "app.db")
+    counts = import_dexcom_workbook(xlsx, db)
+    assert counts == {"rows": len(ROWS), "food_log": 1, "glucose_readings": 8,
+                      "existing": 0, "collisions": 1, "skipped": 1}
+
+    stamps = [t for (t,) in _table(db, "SELECT timestamp FROM glucose_readings ORDER BY unix")]
+    assert stamps == [
+        "2025-06-01T07:50:00Z", "2025-06-01T08:10:00Z", "2025-06-01T08:40:00Z", "2025-06-01T11:55:00Z",
+        "2025-06-01T12:20:00Z", "2025-06-01T23:30:00Z", "2025-06-02T00:45:00Z", "2025-06-02T08:00:00Z",
+    ]
+    # first row for a second wins, and the fasting column marks pre-meal readings
+    assert _table(db, "SELECT glucose_mg_dl FROM glucose_readings WHERE timestamp = '2025-06-01T08:40:00Z'") == [(160.0,)]
+    assert _table(db, "SELECT context FROM glucose_readings WHERE timestamp = '2025-06-01T07:50:00Z'") == [("pre_meal",)]
+    assert _table(db, "SELECT recipe_name, timestamp, meal_type, carbs FROM food_log") == [
+        ("oats", "2025-06-01T08:00:00Z", "breakfast", 45.0)]
+
+
+def test_reimport_leaves_tables_unchanged(tmp_path):
+    xlsx, db = _workbook(tmp_path / "export.xlsx", ROWS), str(tmp_path / "app.db")
+    import_dexcom_workbook(xlsx, db)
+    again = import_dexcom_workbook(xlsx, db)
+    assert again["food_log"] == again["glucose_readings"] == 0
+    assert again["existing"] == 9
+    assert _table(db, "SELECT COUNT(*) FROM glucose_readings") == [(8,)]
+
+
+def test_missing_workbook(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        import_dexcom_workbook(str(tmp_path / "nope.xlsx"), str(tmp_path / "app.db"))
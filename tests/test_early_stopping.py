@@ -0,0 +1,40 @@
+import json
+import math
+
+from ai.training.train import STOP_NON_FINITE, STOP_PATIENCE, EarlyStopping, train_user_model
+
+
+def test_stops_after_patience_epochs_without_improvement():
+    stopper = EarlyStopping(patience=3, min_delta=0.1)
+    losses = [5.0, 4.0, 3.95, 3.92, 3.91]
+    reasons = [stopper.step(epoch, loss) for epoch, loss in enumerate(losses)]
+    # improvements under min_delta do not count
+    assert reasons == [None, None, None, None, STOP_PATIENCE]
+    assert (stopper.best, stopper.best_epoch) == (4.0, 1)
+
+
+def test_patience_counts_epochs_not_validation_calls():
+    stopper = EarlyStopping(patience=10)
+    assert stopper.step(0, 1.0) is None
+    assert stopper.step(5, 1.0) is None
+    assert stopper.step(10, 1.0) == STOP_PATIENCE
+
+
+def test_min_epochs_and_non_finite():
+    stopper = EarlyStopping(patience=1, min_epochs=5)
+    assert [stopper.step(e, 1.0) for e in range(5)] == [None] * 5
+    assert stopper.step(5, 1.0) == STOP_PATIENCE
+    assert EarlyStopping(patience=None).step(0, math.nan) == STOP_NON_FINITE
+    assert EarlyStopping(patience=None).step(100, 1.0) is None
+
+
+def test_phase_ends_early_and_reports_why(user_db, tmp_path):
+    train_user_model("u1", db_path=user_db, checkpoint_dir=str(tmp_path), upload_to_supabase=False,
+                     phase_epochs={1: 50, 2: 50, 3: 50}, phase_patience={1: 2, 2: 2, 3: 2},
+                     phase_min_epochs={}, min_delta=1e6, checkpoint_interval_s=None)
+    history = json.loads((tmp_path / "u1" / "loss_history.json").read_text())
+    for phase in ("phase1", "phase2", "phase3"):
+        assert history[phase]["stop_reason"] == STOP_PATIENCE
+        # epochs count from 1; nothing beats the first validation by min_delta
+        assert history[phase]["best_epoch"] == 1
+        assert history[phase]["epochs_run"] == 3
@@ -0,0 +1,60 @@
+import sqlite3
+
+import pytest
+
+from ai.data.ingest import open_ingest_connection
+from ai.data.preprocessing import fetch_meal_columns, fetch_meals
+
+# id, timestamp, carbs, fat, protein, fiber, is_liquid
+FOOD = [
+    ("a", "2025-06-01T08:00:00Z", 40.0, 10.0, 5.0,  4.0,  0),
+    ("b", "2025-06-01T12:00:00Z", 0.0,  20.0, 30.0, 0.0,  0),    # no carbs: dropped
+    ("c", "2025-06-02T08:00:00Z", 30.0, 0.0,  0.0,  0.0,  1),
+    ("d", "2025-06-03T08:00:00Z", 12.5, 3.3,  0.0,  1.1,  0),
+    ("e", "not a time",           20.0, 0.0,  0.0,  0.0,  0),    # unparseable: skipped in fetch_meals
+]
+
+
+@pytest.fixture
+def conn(tmp_path):
+    db = str(tmp_path / "app.db")
+    c = open_ingest_connection(db)
+    c.executemany("INSERT INTO food_log (id, recipe_name, timestamp, meal_type, carbs, fat, protein, fiber, is_liquid) "
+                  "VALUES (?, '', ?, 'lunch', ?, ?, ?, ?, ?)", FOOD)
+    c.close()
+    c = sqlite3.connect(db)
+    c.row_factory = sqlite3.Row
+    yield c
+    c.close()
+
+
+def _reference(carbs, fat, protein, fiber):
+    # the per-row Python derivation fetch_meals used before the SQL pushdown
+    total = carbs + fat + protein
+    return round(fiber / carbs, 4), round((fat + protein) / total if total > 0 else 0.2, 4)
+
+
+def test_fetch_meals_filters_and_derives(conn):
+    meals = fetch_meals(conn)
+    assert [m.meal_id for m in meals] == ["a", "c", "d"]
+    expected = {r[0]: r for r in FOOD}
+    for m in meals:
+        _, _, carbs, fat, protein, fiber, liquid = expected[m.meal_id]
+        assert (m.fiber_ratio, m.fatprotein) == _reference(carbs, fat, protein, fiber)
+        assert m.carbs == carbs and m.is_liquid == bool(liquid)
+        assert m.hour == 8.0
+
+
+def test_date_range_is_pushed_into_the_query(conn):
+    assert [m.meal_id for m in fetch_meals(conn, "2025-06-02", "2025-06-02")] == ["c"]
+    assert [m.meal_id for m in fetch_meals(conn, "2025-06-02")] == ["c", "d"]
+    cols = fetch_meal_columns(conn, "2025-06-02")
+    assert len(cols) == 3 and cols.is_liquid.tolist() == [True, False, False]
+
+
+def test_empty_table(tmp_path):
+    db = str(tmp_path / "empty.db")
+    open_ingest_connection(db).close()
+    with sqlite3.connect(db) as c:
+        assert len(fetch_meal_columns(c)) == 0
+        assert fetch_meals(c) == []
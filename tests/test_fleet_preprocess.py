@@ -0,0 +1,33 @@
+import json
+import os
+import stat
+
+from ai.data.fleet import SUMMARY_FILE, load_dataset, peek_user_id, preprocess_fleet, write_json_atomic
+
+
+def test_preprocess_fleet_isolates_failures(user_db, tmp_path):
+    out = tmp_path / "datasets"
+    results = preprocess_fleet(
+        [{"user_id": "u1", "db_path": user_db}, {"user_id": "u2", "db_path": str(tmp_path / "missing" / "x.db")}],
+        str(out), max_workers=2,
+    )
+    by_user = {r["user_id"]: r for r in results}
+    assert by_user["u1"]["status"] == "ok"
+    assert by_user["u2"]["status"] == "error"
+
+    data = load_dataset(by_user["u1"]["path"])
+    assert peek_user_id(by_user["u1"]["path"]) == "u1"
+    assert len(data["train"]["meal_features"]) == by_user["u1"]["n_train"] > 0
+    summary = json.loads((out / SUMMARY_FILE).read_text())
+    assert (summary["n_ok"], summary["n_failed"]) == (1, 1)
+    assert all("trace" not in r for r in summary["results"])
+    assert not [p for p in os.listdir(out) if p.endswith(".tmp")]
+
+
+def test_write_json_atomic_replaces_whole_files(tmp_path):
+    path = tmp_path / "nested" / "d.json"
+    write_json_atomic(path, {"user_id": "a", "x": [1]})
+    write_json_atomic(path, {"user_id": "b"})
+    assert json.loads(path.read_text()) == {"user_id": "b"}
+    assert stat.S_IMODE(path.stat().st_mode) == 0o644
+    assert os.listdir(path.parent) == ["d.json"]
@@ -0,0 +1,57 @@
+import json
+
+import ai.training.fleet as fleet
+from ai.data.fleet import peek_user_id
+from ai.training.fleet import _normalise_job, core_slices, train_fleet
+
+
+def _fake_train_user(job, out_dir, base_kwargs):
+    # module-level so forked pool workers can unpickle it
+    return {"user_id": job["user_id"], "status": "ok", "epochs_run": 0, "cores": [],
+            "seconds": 0.0, "dataset_file": job.get("dataset_file")}
+
+
+def _dataset(tmp_path, name, user_id, padding):
+    path = tmp_path / name
+    path.write_text(json.dumps({"user_id": user_id, "train": ["x" * padding]}))
+    return str(path)
+
+
+def test_normalise_job_reads_user_id_from_the_header(tmp_path):
+    path = _dataset(tmp_path, "a.json", 'user "q"', 10)
+    assert peek_user_id(path) == 'user "q"'
+    assert _normalise_job(path)["user_id"] == 'user "q"'
+    assert _normalise_job({"user_id": "u9", "dataset_file": path})["user_id"] == "u9"
+
+    other = tmp_path / "plain.json"
+    other.write_text(json.dumps({"train": [], "user_id": "late"}))
+    assert peek_user_id(str(other)) is None
+    assert _normalise_job(str(other))["user_id"] == "plain"
+
+
+def test_duplicate_users_keep_their_own_size_and_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(fleet, "_train_user", _fake_train_user)
+    small = _dataset(tmp_path, "small.json", "u1", 10)
+    big   = _dataset(tmp_path, "big.json",   "u1", 5000)
+    mid   = _dataset(tmp_path, "mid.json",   "u2", 1000)
+
+    results = train_fleet([small, big, mid], str(tmp_path / "out"), max_workers=1)
+    # one worker: results come back in schedule order, largest dataset first
+    assert [r["dataset_file"] for r in results] == [big, mid, small]
+    sizes = {r["dataset_file"]: r["size_bytes"] for r in results}
+    assert sizes[big] > sizes[mid] > sizes[small]
+    summary = json.loads((tmp_path / "out" / fleet.SUMMARY_FILE).read_text())
+    assert summary["n_users"] == 3 and summary["n_ok"] == 3
+
+
+def test_deadline_skips_remaining_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(fleet, "_train_user", _fake_train_user)
+    jobs = [_dataset(tmp_path, f"d{i}.json", f"u{i}", 10 * (i + 1)) for i in range(3)]
+    results = train_fleet(jobs, str(tmp_path / "out"), max_workers=1, deadline_s=-1.0)
+    assert [r["status"] for r in results] == ["skipped"] * 3
+    assert all("size_bytes" in r for r in results)
+
+
+def test_core_slices_are_disjoint_when_they_fit():
+    slices = core_slices(1)
+    assert len(slices) == 1 and slices[0]
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+import torch
+
+from ai.models.user.parameters import UserParams
+from ai.simulation.batch_simulation import fold_frozen_terms, simulate_meal_batch
+from ai.training.train import _set_trainable_params, train_user_model
+
+
+def _nudged_params(phase):
+    # move every parameter off its default so no term is trivially zero
+    params = UserParams()
+    with torch.no_grad():
+        for i, p in enumerate(params.parameters()):
+            p.add_(0.01 * (i + 1))
+    _set_trainable_params(params, phase)
+    return params
+
+
+@pytest.mark.parametrize("phase", [1, 2, 3])
+def test_folded_simulation_matches_full_forward_and_grads(meal_batch, phase):
+    params = _nudged_params(phase)
+    folded = fold_frozen_terms(meal_batch, params)
+    full = simulate_meal_batch(meal_batch, params)
+    fast = simulate_meal_batch(folded, params)
+    assert torch.allclose(fast, full, rtol=1e-6, atol=1e-5)
+
+    trainable = [p for p in params.parameters() if p.requires_grad]
+    expected = torch.autograd.grad(full[meal_batch.mask].sum(), trainable)
+    got = torch.autograd.grad(fast[meal_batch.mask].sum(), trainable)
+    for a, b in zip(got, expected):
+        assert torch.allclose(a, b, rtol=1e-5, atol=1e-6)
+
+
+def test_only_terms_without_trainable_dependencies_are_folded(meal_batch):
+    folded = fold_frozen_terms(meal_batch, _nudged_params(1)).folded
+    # phase 1 trains Gb and beta1 only (su is a property, su_raw stays frozen):
+    # the carb term is live but its feature is constant
+    assert folded.terms == {"night", "night_carb", "insulin", "activity", "hrv_drop", "hr_post", "hrv_carb", "hr_night"}
+    assert set(folded.features) == {"carb"}
+    assert folded.delta_g.shape == meal_batch.dt_hours.shape
+    assert not folded.delta_g.requires_grad
+
+
+def test_folded_batches_index_like_the_rest(meal_batch):
+    params = _nudged_params(2)
+    idx = torch.tensor([2, 0])
+    a = simulate_meal_batch(fold_frozen_terms(meal_batch, params).index(idx), params)
+    b = simulate_meal_batch(fold_frozen_terms(meal_batch.index(idx), params), params)
+    assert torch.equal(a, b)
+
+
+def test_training_with_and_without_folding_agrees(user_db, tmp_path):
+    histories = {}
+    for fold in (True, False):
+        out = tmp_path / str(fold)
+        train_user_model("u1", db_path=user_db, checkpoint_dir=str(out), upload_to_supabase=False,
+                         phase_epochs={1: 2, 2: 2, 3: 2}, batch_size=8, fold_frozen=fold,
+                         checkpoint_interval_s=None, seed=0)
+        histories[fold] = json.loads((out / "u1" / "loss_history.json").read_text())
+    for phase in ("phase1", "phase2", "phase3"):
+        assert histories[True][phase]["train"] == pytest.approx(histories[False][phase]["train"], rel=1e-5)
+        assert histories[True][phase]["val"] == pytest.approx(histories[False][phase]["val"], rel=1e-5)
+
+
+def test_unfrozen_k_abs_keeps_carb_features_live(meal_batch):
+    params = _nudged_params(1)
+    params.su_raw.requires_grad_(True)
+    folded = fold_frozen_terms(meal_batch, params).folded
+    assert not folded.terms & {"carb", "night_carb", "insulin", "hrv_carb"}
+    assert not set(folded.features) & {"carb", "night_carb", "insulin", "hrv_carb"}
@@ -0,0 +1,44 @@
+import re
+
+import pytest
+import torch
+
+from ai.data.preprocessing import subset_sequences
+from ai.models.user.parameters import UserParams
+from ai.personalization.loss import GlucoseLoss
+from ai.training.train import _batch_loss, _meal_stamps, history_window_indices, train_user_model
+
+
+def test_window_by_days_then_meals(meal_chain):
+    # 12 meals 1.5 h apart: the last 6 h hold the newest 5
+    assert history_window_indices(meal_chain, last_days=0.25) == [7, 8, 9, 10, 11]
+    assert history_window_indices(meal_chain, last_meals=3) == [9, 10, 11]
+    assert history_window_indices(meal_chain, last_days=0.25, last_meals=2) == [10, 11]
+    assert history_window_indices(meal_chain, last_meals=0) == []
+    assert history_window_indices(meal_chain) == list(range(12))
+
+
+def test_window_keeps_split_order_and_an_external_newest(meal_chain):
+    shuffled = subset_sequences(meal_chain, [11, 0, 5, 9, 3])
+    assert history_window_indices(shuffled, last_meals=2) == [0, 3]
+    newest = max(_meal_stamps(meal_chain))
+    # cut relative to the user's newest meal even when this split ends earlier
+    head = subset_sequences(meal_chain, range(6))
+    assert history_window_indices(head, last_days=0.5, newest=newest) == [3, 4, 5]
+
+
+def test_batch_decay_weights_down_weight_old_meals(meal_batch):
+    params, loss_fn = UserParams(), GlucoseLoss()
+    with torch.no_grad():
+        plain = _batch_loss(params, loss_fn, meal_batch)[0].item()
+        flat  = _batch_loss(params, loss_fn, meal_batch, half_life_days=1e9)[0].item()
+        steep = _batch_loss(params, loss_fn, meal_batch, half_life_days=0.01)[0].item()
+    assert flat == pytest.approx(plain, rel=1e-6)
+    assert steep != pytest.approx(plain, rel=1e-3)
+
+
+def test_training_uses_only_the_newest_meals(user_db, tmp_path, capsys):
+    train_user_model("u1", db_path=user_db, checkpoint_dir=str(tmp_path), upload_to_supabase=False,
+                     phase_epochs={1: 1, 2: 1, 3: 1}, history_meals=5, checkpoint_interval_s=None)
+    kept, total = map(int, re.search(r"history window: (\d+)/(\d+) train meals", capsys.readouterr().out).groups())
+    assert kept == 5 and total > 5
@@ -0,0 +1,64 @@
+import sqlite3
+
+import pytest
+
+from ai.data.ingest import (
+    FOOD_LOG_INSERT, _bulk_insert, _food_log_row, ingest_database, ingest_food_log,
+    ingest_sensor_packets, open_ingest_connection,
+)
+from ai.data.sensor_packet import process_packet_stream
+
+from conftest import make_food_log, make_raw_packets
+
+START = 1_750_000_000
+
+
+def _count(db_path, table):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_packets_are_gap_filled_and_reingest_is_a_no_op(tmp_path):
+    db = str(tmp_path / "app.db")
+    raw = make_raw_packets(100, START, skip=(40,))
+    counts = ingest_database(db, raw_packets=raw, food_log=make_food_log(5))
+    # 99 received + 1 interpolated midpoint for the gap
+    assert counts == {"sensor_packets": 100, "food_log": 5, "glucose_readings": 0}
+
+    conn = open_ingest_connection(db)
+    try:
+        assert ingest_sensor_packets(conn, process_packet_stream(raw), batch_size=7) == 0
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    finally:
+        conn.close()
+    assert _count(db, "sensor_packets") == 100
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT SUM(interpolated) FROM sensor_packets").fetchone()[0] == 1
+
+
+def test_food_log_upserts(tmp_path):
+    db = str(tmp_path / "app.db")
+    conn = open_ingest_connection(db)
+    try:
+        food = make_food_log(3)
+        ingest_food_log(conn, food)
+        ingest_food_log(conn, [{**food[0], "carbs": 99.0}])
+        carbs = conn.execute("SELECT carbs FROM food_log WHERE id = ?", (food[0]["id"],)).fetchone()[0]
+    finally:
+        conn.close()
+    assert carbs == 99.0
+    assert _count(db, "food_log") == 3
+
+
+def test_failed_batch_rolls_back_only_itself(tmp_path):
+    conn = open_ingest_connection(str(tmp_path / "app.db"))
+    try:
+        good = [_food_log_row(e) for e in make_food_log(4)]
+        bad = good[3][:3] + (None,) + good[3][4:]    # timestamp NOT NULL
+        with pytest.raises(sqlite3.IntegrityError):
+            _bulk_insert(conn, FOOD_LOG_INSERT, good[:3] + [bad], batch_size=2)
+        assert not conn.in_transaction
+        # first batch committed, second (holding the bad row) rolled back
+        assert conn.execute("SELECT COUNT(*) FROM food_log").fetchone()[0] == 2
+    finally:
+        conn.close()
@@ -0,0 +1,57 @@
+import torch
+
+from ai.models.glucose.absorptions_util import _k_abs_i, cached_k_abs_i
+from ai.models.user.parameters import UserParams
+
+
+def test_reused_within_a_step_and_invalidated_by_optimizer_step():
+    params = UserParams()
+    optimizer = torch.optim.Adam(params.parameters(), lr=0.1)
+    optimizer.register_step_post_hook(lambda *_: params.bump_version())
+
+    first = cached_k_abs_i(params, 0.1, False, 0.3)
+    assert first.requires_grad
+    # every time step of one forward pass shares the same tensor
+    assert cached_k_abs_i(params, 0.1, False, 0.3) is first
+    assert cached_k_abs_i(params, 0.2, False, 0.3) is not first
+
+    (first + cached_k_abs_i(params, 0.1, False, 0.3)).backward()
+    assert params.su_raw.grad is not None and params.su_raw.grad.abs() > 0
+    optimizer.step()
+
+    after = cached_k_abs_i(params, 0.1, False, 0.3)
+    assert after is not first
+    assert torch.allclose(after, _k_abs_i(params, 0.1, False, 0.3))
+    assert not torch.allclose(after, first.detach())
+
+
+def test_grad_and_no_grad_entries_are_separate():
+    params = UserParams()
+    with torch.no_grad():
+        plain = cached_k_abs_i(params, 0.1, True, 0.0)
+    assert not plain.requires_grad
+    graphed = cached_k_abs_i(params, 0.1, True, 0.0)
+    assert graphed.requires_grad
+    with torch.no_grad():
+        assert cached_k_abs_i(params, 0.1, True, 0.0) is plain
+
+
+def test_load_state_dict_invalidates():
+    params = UserParams()
+    with torch.no_grad():
+        before = cached_k_abs_i(params, 0.0, False, 0.5)
+        state = {k: v.clone() for k, v in params.state_dict().items()}
+        state["su_raw"] += 1.0
+        params.load_state_dict(state)
+        after = cached_k_abs_i(params, 0.0, False, 0.5)
+    assert after is not before
+    assert not torch.allclose(after, before)
+
+
+def test_backward_without_step_rebuilds_the_entry():
+    params = UserParams()
+    first = cached_k_abs_i(params, 0.1, False, 0.3)
+    first.backward()
+    second = cached_k_abs_i(params, 0.1, False, 0.3)
+    assert second is not first
+    second.backward()
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+import torch
+from torch.optim import LBFGS
+
+from ai.models.user.parameters import UserParams
+from ai.training.train import PHASE_PARAMS, STOP_CONVERGED, _lbfgs_train_epoch, _train_phase, train_user_model
+
+
+def test_epoch_reports_the_loss_at_the_accepted_params():
+    x = torch.nn.Parameter(torch.tensor([3.0, -2.0]))
+    target = torch.tensor([1.0, 1.0])
+    loss_fn = lambda: (((x - target) ** 2).sum(), {"fingerstick": (x[0] - 1.0) ** 2})
+    optimizer = LBFGS([x], lr=1.0, max_iter=20, line_search_fn="strong_wolfe")
+    info = {"iterations": 0, "func_evals": 0, "converged": False}
+    loss, components = _lbfgs_train_epoch(optimizer, loss_fn, info)
+    assert torch.allclose(x.detach(), target, atol=1e-4)
+    assert loss == pytest.approx(0.0, abs=1e-7)
+    assert set(components) == {"fingerstick"}
+    assert info["converged"] and 0 < info["iterations"] < 20
+
+
+def test_unknown_optimizer_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="unknown optimizer"):
+        _train_phase(phase=1, params=UserParams(), loss_fn=None, train_seqs={}, val_seqs={}, epochs=1,
+                     lr=1e-2, checkpoint_dir=tmp_path, night_deltas=None, day_deltas=None, optimizer_name="sgd")
+
+
+def test_lbfgs_phase_moves_only_its_own_params(user_db, tmp_path):
+    train_user_model("u1", db_path=user_db, checkpoint_dir=str(tmp_path), upload_to_supabase=False,
+                     phase_epochs={1: 3, 2: 3, 3: 3}, phase_optimizer={1: "lbfgs"}, checkpoint_interval_s=None)
+    history = json.loads((tmp_path / "u1" / "loss_history.json").read_text())
+    lbfgs = history["phase1"]["lbfgs"]
+    assert lbfgs["iterations"] > 0 and lbfgs["func_evals"] >= lbfgs["iterations"]
+    assert history["phase1"]["stop_reason"] in (STOP_CONVERGED, "max_epochs")
+    assert "lbfgs" not in history["phase2"]
+    phase1 = torch.load(tmp_path / "u1" / "phase1_best.pt")["params"]
+    defaults = UserParams().state_dict()
+    moved = {name for name, value in phase1.items() if not torch.equal(value, defaults[name])}
+    assert moved and moved <= set(PHASE_PARAMS[1])
@@ -0,0 +1,42 @@
+import ai.data.preprocessing as preprocessing
+from ai.data.preprocessing import MedicationEntry, build_medication_schedule, load_training_data, subset_sequences
+from ai.simulation._run_glucose_simulation import NO_MEDICATIONS, resolve_meal_medications
+
+MEDS = [
+    MedicationEntry("m1", 10.0, 8.0, "rapid_insulin", "rapid"),
+    MedicationEntry("m2", 500.0, 20.0, "metformin"),
+]
+
+
+def test_schedule_id_is_a_content_hash():
+    schedule = build_medication_schedule(MEDS)
+    assert schedule.schedule_id == build_medication_schedule(list(reversed(MEDS))).schedule_id
+    edited = [MEDS[0], MedicationEntry("m2", 850.0, 20.0, "metformin")]
+    assert build_medication_schedule(edited).schedule_id != schedule.schedule_id
+    assert [m.med_id for m in schedule.insulin_medications] == ["m1"]
+    assert [m.med_id for m in schedule.other_medications] == ["m2"]
+    assert build_medication_schedule([]) is None
+
+
+def test_dataset_stores_each_schedule_once(user_db, monkeypatch):
+    monkeypatch.setattr(preprocessing, "fetch_medication", lambda *a, **k: MEDS)
+    train, val, _, meds = load_training_data(db_path=user_db, user_id="u1")
+    (sid, stored), = train["medication_schedules"].items()
+    assert {m["medication_schedule_id"] for m in train["meal_features"] + val["meal_features"]} == {sid}
+    assert all("insulin_medications" not in m for m in train["meal_features"])
+    assert [m["med_id"] for m in stored["insulin_medications"]] == ["m1"]
+    assert len(meds) == 2
+
+    resolved = resolve_meal_medications(train["meal_features"], train["medication_schedules"])
+    # every meal shares the one pair of lists
+    assert len({id(r[0]) for r in resolved}) == 1
+    assert resolved[0][0] is stored["insulin_medications"]
+
+    assert subset_sequences(train, [])["medication_schedules"] == {}
+    assert subset_sequences(train, [0])["medication_schedules"] == train["medication_schedules"]
+
+
+def test_inline_and_missing_medications_still_resolve():
+    inline = {"insulin_medications": [{"med_id": "x"}]}
+    assert resolve_meal_medications([inline, {}]) == [([{"med_id": "x"}], []), NO_MEDICATIONS]
+    assert resolve_meal_medications([{"medication_schedule_id": "gone"}], {}) == [NO_MEDICATIONS]
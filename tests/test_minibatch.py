@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+import torch
+
+from ai.models.user.parameters import UserParams
+from ai.personalization.loss import GlucoseLoss
+from ai.training.dataset import MealSequenceDataset
+from ai.training.train import _minibatch_train_epoch, _minibatch_validate
+
+
+def _split(meal_chain):
+    meals = meal_chain["meal_features"]
+    sticks = [None] * len(meals)
+    for i in range(0, len(meals), 2):
+        t = datetime.fromisoformat(meals[i]["timestamp"]) + timedelta(minutes=47)
+        sticks[i] = {"timestamp": t.isoformat(), "glucose_mg_dl": 140.0 + i, "context": "post_meal"}
+    return {**meal_chain, "fingersticks": sticks}
+
+
+def test_grid_is_cut_at_the_next_meal_and_obs_snap_to_it(meal_chain):
+    ds = MealSequenceDataset.from_split(_split(meal_chain), dt_minutes=5.0, horizon_minutes=120.0)
+    assert len(ds) == 12 and ds.n_steps == 25
+    # meals are 90 min apart: 19 steps each, the last one keeps the full horizon
+    assert ds.data.lengths.tolist() == [19] * 11 + [25]
+    assert ds.data.mask.sum(dim=1).tolist() == ds.data.lengths.tolist()
+    obs = ds.data.obs_glucose
+    assert obs[0, 9].item() == 140.0                 # +47 min rounds to step 9
+    assert torch.isnan(obs[1]).all()
+    assert (~torch.isnan(obs)).sum().item() == 6
+
+
+def test_batches_cover_each_meal_once(meal_chain):
+    ds = MealSequenceDataset.from_split(_split(meal_chain))
+    batches = list(ds.iter_batches(5, generator=torch.Generator().manual_seed(0)))
+    assert [len(b) for b in batches] == [5, 5, 2]
+    carbs = torch.cat([b.carbs for b in batches])
+    assert sorted(carbs.tolist()) == sorted(ds.data.carbs.tolist())
+
+
+def test_minibatch_epoch_lowers_the_loss(meal_chain):
+    ds = MealSequenceDataset.from_split(_split(meal_chain))
+    params, loss_fn = UserParams(), GlucoseLoss(window_tolerance=10.0)
+    optimizer = torch.optim.Adam(params.parameters(), lr=0.05)
+    before, _ = _minibatch_validate(params, loss_fn, ds)
+    gen = torch.Generator().manual_seed(0)
+    for _ in range(5):
+        train_loss, components = _minibatch_train_epoch(params, loss_fn, optimizer, ds, 4, gen)
+    after, _ = _minibatch_validate(params, loss_fn, ds)
+    assert after < before
+    assert isinstance(train_loss, float) and "fingerstick" in components
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from ai.data.packet_buffer import MIN_CAPACITY, PacketBuffer, packets_to_buffer
+from ai.data.sensor_packet import get_window, packets_to_dicts, process_packet_stream
+
+from conftest import make_raw_packets
+
+START = 1_750_000_000
+
+
+@pytest.fixture
+def packets():
+    # two gaps, so process_packet_stream adds interpolated midpoints
+    return process_packet_stream(make_raw_packets(50, START, step_s=2, skip=(10, 30)))
+
+
+def test_round_trips_the_dataclass_list(packets):
+    buf = packets_to_buffer(packets)
+    assert len(buf) == len(packets) == 50
+    assert list(buf) == packets
+    assert buf[-1] == packets[-1]
+    assert packets_to_dicts(buf) == packets_to_dicts(packets)
+    assert buf.column("interpolated").sum() == 2
+
+
+def test_window_matches_the_list_scan(packets):
+    buf = packets_to_buffer(packets)
+    for lo, hi in [(START, START), (START + 15, START + 41), (START - 100, START + 1000), (START + 5000, START + 6000)]:
+        assert list(get_window(buf, lo, hi)) == get_window(packets, lo, hi)
+
+
+def test_views_share_memory_but_appends_do_not_leak(packets):
+    buf = packets_to_buffer(packets)
+    view = buf[5:10]
+    assert np.shares_memory(view.column("hr"), buf.column("hr"))
+    before = buf.packet(10)
+    view.append(packets[-1])
+    assert buf.packet(10) == before
+    with pytest.raises(ValueError):
+        buf[::2]
+
+
+def test_growth_and_ordering(packets):
+    buf = PacketBuffer(capacity=1)
+    for p in packets:
+        buf.append(p)
+    assert len(buf) == len(packets)
+    assert buf.capacity >= MIN_CAPACITY
+    with pytest.raises(ValueError):
+        buf.append(packets[0])
+    with pytest.raises(ValueError):
+        PacketBuffer().extend(list(reversed(packets)))
+
+
+def test_from_columns_validates(packets):
+    cols = {name: packets_to_buffer(packets).column(name) for name in ("seq", "unix")}
+    with pytest.raises(ValueError, match="missing columns"):
+        PacketBuffer.from_columns(**cols)
+    full = packets_to_buffer(packets)
+    rebuilt = PacketBuffer.from_columns(**{n: full.column(n) for n in full._cols})
+    assert list(rebuilt) == packets
+
+
+def test_to_rows_follows_sqlite_column_order(packets):
+    row = next(packets_to_buffer(packets).to_rows())
+    p = packets[0]
+    assert row[:3] == (p.seq, p.unix, p.timestamp)
+    assert row[-1] == 0
@@ -0,0 +1,80 @@
+import os
+
+from api.param_cache import UserParamsCache
+
+ROW = {"Gb": 101.0}
+
+
+def _loader(rows, calls):
+    def load(user_id):
+        calls.append(user_id)
+        return rows.get(user_id)
+    return load
+
+
+def test_hit_miss_and_invalidate():
+    cache, calls = UserParamsCache(ttl_s=60), []
+    load = _loader({"u1": ROW}, calls)
+    first = cache.get("u1", load)
+    assert cache.get("u1", load) is first
+    assert calls == ["u1"]
+    assert not any(p.requires_grad for p in first.parameters())
+
+    cache.invalidate("u1")
+    assert cache.get("u1", load) is not first
+    assert calls == ["u1", "u1"]
+
+
+def test_ttl_expiry():
+    cache, calls = UserParamsCache(ttl_s=0.0), []
+    load = _loader({}, calls)
+    cache.get("u1", load)
+    cache.get("u1", load)
+    assert len(calls) == 2
+
+
+def test_invalidate_during_load_drops_the_result():
+    cache, calls = UserParamsCache(ttl_s=60), []
+
+    def racing_load(user_id):
+        calls.append(user_id)
+        if len(calls) == 1:
+            # training finishes and invalidates while the old row is in flight
+            cache.invalidate(user_id)
+        return ROW
+
+    cache.get("u1", racing_load)
+    assert cache.stats["stale_loads"] == 1
+    cache.get("u1", racing_load)
+    assert calls == ["u1", "u1"]
+    cache.get("u1", racing_load)
+    assert calls == ["u1", "u1"]
+    assert cache.stats["hits"] == 1
+
+
+def test_lru_bound():
+    cache, calls = UserParamsCache(ttl_s=60, max_entries=2), []
+    load = _loader({}, calls)
+    for user_id in ("a", "b", "a", "c", "a", "b"):
+        cache.get(user_id, load)
+    # b was evicted by c and reloaded; a stayed hot
+    assert calls == ["a", "b", "c", "b"]
+
+
+def test_shared_dir_is_hashed_and_invalidated_across_processes(tmp_path):
+    one = UserParamsCache(ttl_s=60, shared_dir=str(tmp_path))
+    two = UserParamsCache(ttl_s=60, shared_dir=str(tmp_path))
+    calls = []
+    load = _loader({"../../etc/u1": ROW}, calls)
+
+    one.get("../../etc/u1", load)
+    assert all(os.path.dirname(p) == "" and ".." not in p for p in os.listdir(tmp_path))
+    two.get("../../etc/u1", load)
+    assert calls == ["../../etc/u1"]
+    assert two.stats["shared_hits"] == 1
+
+    two.invalidate("../../etc/u1")
+    # the stamp makes the other worker distrust its in-memory entry
+    os.utime(next(tmp_path.glob("*.stamp")), (2e9, 2e9))
+    one.get("../../etc/u1", load)
+    assert calls == ["../../etc/u1", "../../etc/u1"]
@@ -0,0 +1,67 @@
+import math
+
+import pytest
+import torch
+
+from ai.training.prior import GLOBAL_KEY, build_prior, load_prior, med_mix_key, prior_params, rebuild_prior
+from ai.training.train import train_user_model
+
+
+def _rows(n, beta1, start=0):
+    return [{"user_id": f"u{start + i}", "Gb": 90.0 + i, "beta1": beta1, "beta2": 0.02,
+             "alpha_activity_raw": [0.1 * i] * 6, "lambda_window": 9.0} for i in range(n)]
+
+
+def test_global_and_cluster_medians():
+    rows = _rows(5, beta1=0.05) + _rows(2, beta1=0.2, start=5)
+    med_classes = {f"u{i}": ["Metformin"] for i in range(5)}
+    med_classes.update({"u5": ["insulin", "metformin"], "u6": ["metformin", "Insulin "]})
+    prior = build_prior(rows, med_classes, min_cluster_size=3)
+    assert prior["n_users"] == 7
+    assert prior[GLOBAL_KEY]["params"]["beta1"] == 0.05
+    assert prior[GLOBAL_KEY]["params"]["Gb"] == 91.0
+    # the two-user insulin+metformin mix is too small for its own cluster
+    assert set(prior["clusters"]) == {"metformin"}
+    cluster = prior["clusters"]["metformin"]
+    assert cluster["n_users"] == 5
+    assert cluster["params"]["alpha_activity_raw"] == pytest.approx([0.2] * 6)
+    assert "lambda_window" not in cluster["params"]
+
+
+def test_missing_and_non_finite_values_are_skipped():
+    rows = [{"Gb": 100.0, "beta1": None}, {"Gb": float("nan"), "beta1": 0.1}, {"Gb": 110.0}]
+    params = build_prior(rows)[GLOBAL_KEY]["params"]
+    assert params["Gb"] == 105.0
+    assert params["beta1"] == 0.1
+    assert "beta2" not in params
+
+
+def test_prior_params_falls_back_to_global(tmp_path):
+    path = tmp_path / "prior.json"
+    rows = _rows(3, beta1=0.05) + _rows(3, beta1=0.3, start=3)
+    med_classes = {f"u{i}": ([] if i < 3 else ["sulfonylurea"]) for i in range(6)}
+    rebuild_prior(str(path), rows=rows, med_classes=med_classes, min_cluster_size=3)
+    prior = load_prior(str(path))
+    params, key = prior_params(prior, ["Sulfonylurea", None])
+    assert key == "sulfonylurea" and params.beta1.item() == pytest.approx(0.3)
+    params, key = prior_params(prior, ["dpp4"])
+    assert key == GLOBAL_KEY and params.beta1.item() == pytest.approx(0.175)
+    assert med_mix_key([None, ""]) == "none"
+
+
+def test_unreadable_prior_is_ignored(tmp_path):
+    assert load_prior(str(tmp_path / "missing.json")) is None
+    (tmp_path / "bad.json").write_text("{not json")
+    assert load_prior(str(tmp_path / "bad.json")) is None
+
+
+def test_new_user_starts_from_the_prior(user_db, tmp_path):
+    path = tmp_path / "prior.json"
+    rebuild_prior(str(path), rows=[{"Gb": 101.0, "beta1": 0.04, "beta2": 0.123, "beta5": 0.077}])
+    train_user_model("u1", db_path=user_db, checkpoint_dir=str(tmp_path), upload_to_supabase=False,
+                     phase_epochs={1: 2, 2: 2, 3: 2}, population_prior=str(path), checkpoint_interval_s=None)
+    # phase 1 does not train beta2 / beta5, so they still hold the prior's values
+    state = torch.load(tmp_path / "u1" / "phase1_best.pt")["params"]
+    assert state["beta2"].item() == pytest.approx(0.123)
+    assert state["beta5"].item() == pytest.approx(0.077)
+    assert math.isfinite(state["Gb"].item())
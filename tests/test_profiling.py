@@ -0,0 +1,66 @@
+import tracemalloc
+
+from ai.training.profiling import NULL_PROFILER, StageProfiler
+
+MB = 1 << 20
+
+
+def _allocate(n_bytes: int) -> None:
+    block = bytearray(n_bytes)
+    del block
+
+
+def test_nested_stage_keeps_outer_peak():
+    prof = StageProfiler(track_memory=True)
+    try:
+        prof.start_epoch(1, 0)
+        with prof.stage("simulate"):
+            _allocate(8 * MB)
+            with prof.stage("loss"):
+                _allocate(1 * MB)
+        prof.end_epoch()
+    finally:
+        prof.stop()
+    stages = prof.epochs[0]["stages"]
+    assert stages["simulate"]["peak_bytes"] >= 8 * MB
+    assert 1 * MB <= stages["loss"]["peak_bytes"] < 8 * MB
+    assert not tracemalloc.is_tracing()
+
+
+def test_inner_peak_counts_towards_outer():
+    prof = StageProfiler(track_memory=True)
+    try:
+        prof.start_epoch(1, 0)
+        with prof.stage("simulate"):
+            with prof.stage("loss"):
+                _allocate(4 * MB)
+        prof.end_epoch()
+    finally:
+        prof.stop()
+    stages = prof.epochs[0]["stages"]
+    assert stages["simulate"]["peak_bytes"] >= 4 * MB
+    assert stages["loss"]["peak_bytes"] >= 4 * MB
+
+
+def test_stage_records_calls_and_summary():
+    prof = StageProfiler()
+    for epoch in range(2):
+        prof.start_epoch(2, epoch)
+        for _ in range(3):
+            with prof.stage("step"):
+                pass
+        prof.end_epoch()
+    with prof.stage("validate"):
+        pass   # outside an epoch: not recorded
+    phase = prof.summary()["phases"]["phase2"]
+    assert phase["epochs"] == 2
+    assert phase["stages"]["step"]["calls"] == 6
+    assert "validate" not in phase["stages"]
+
+
+def test_null_profiler_records_nothing():
+    NULL_PROFILER.start_epoch(1, 0)
+    with NULL_PROFILER.stage("simulate"):
+        pass
+    NULL_PROFILER.end_epoch()
+    assert NULL_PROFILER.epochs == []
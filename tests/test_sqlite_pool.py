@@ -0,0 +1,60 @@
+import sqlite3
+import threading
+
+import pytest
+
+from ai.storage.sqlite_pool import ReadOnlyConnectionPool
+
+
+def test_reuses_warm_connections_and_nests_on_one_thread(user_db):
+    pool = ReadOnlyConnectionPool()
+    with pool.connection(user_db) as outer:
+        with pool.connection(user_db) as inner:
+            assert inner is outer
+    with pool.connection(user_db) as again:
+        assert again is outer
+        assert again.execute("SELECT COUNT(*) FROM food_log").fetchone()[0] > 0
+    assert pool.stats == {"opened": 1, "reused": 1, "evicted": 0}
+    assert pool.close_idle() == 1
+
+
+def test_connections_are_read_only(user_db):
+    pool = ReadOnlyConnectionPool()
+    with pool.connection(user_db) as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM food_log")
+    pool.close_idle()
+
+
+def test_threads_get_their_own_handle(user_db):
+    pool = ReadOnlyConnectionPool()
+    entered, release, seen = threading.Event(), threading.Event(), []
+
+    def hold():
+        with pool.connection(user_db) as conn:
+            seen.append(conn)
+            entered.set()
+            release.wait(5)
+
+    t = threading.Thread(target=hold)
+    t.start()
+    entered.wait(5)
+    with pool.connection(user_db) as mine:
+        assert mine is not seen[0]
+    release.set()
+    t.join()
+    assert pool.stats["opened"] == 2
+    assert pool.close_idle() == 2
+
+
+def test_idle_handles_expire_and_missing_files_raise(user_db, tmp_path):
+    pool = ReadOnlyConnectionPool(idle_timeout=0.0, max_idle_per_db=1)
+    with pool.connection(user_db):
+        pass
+    with pool.connection(user_db):
+        pass
+    assert pool.stats["evicted"] == 1 and pool.stats["reused"] == 0
+    pool.close_idle()
+    with pytest.raises(FileNotFoundError):
+        with pool.connection(str(tmp_path / "nope.db")):
+            pass
@@ -0,0 +1,96 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from ai.storage.supabase_client import SupabaseClients, get_clients, set_client_factory
+from ai.training.prior import fetch_population_rows
+
+
+class FakeTable:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def select(self, *_):
+        return self
+
+    def eq(self, column, value):
+        return FakeTable([r for r in self.rows if r.get(column) == value])
+
+    def execute(self):
+        return SimpleNamespace(data=list(self.rows))
+
+
+class FakeSupabase:
+    def __init__(self, url, key, tables=None):
+        self.url, self.key, self.tables = url, key, tables or {}
+
+    def table(self, name):
+        return FakeTable(self.tables.get(name, []))
+
+
+def test_one_client_per_credentials():
+    clients = SupabaseClients(FakeSupabase)
+    a = clients.get("http://a", "k1")
+    assert clients.get("http://a", "k1") is a
+    assert clients.get("http://a", "k2") is not a
+    assert clients.stats == {"created": 2, "reused": 1}
+
+
+def test_credentials_fall_back_to_the_environment(monkeypatch):
+    clients = SupabaseClients(FakeSupabase)
+    with pytest.raises(EnvironmentError):
+        clients.get()
+    monkeypatch.setenv("EXPO_PUBLIC_SUPABASE_URL", "http://env")
+    monkeypatch.setenv("EXPO_PUBLIC_SUPABASE_KEY", "env-key")
+    client = clients.get()
+    assert (client.url, client.key) == ("http://env", "env-key")
+    assert clients.get("http://env", "env-key") is client
+
+
+def test_racing_threads_build_a_single_client():
+    built = []
+    gate = threading.Barrier(8)
+
+    def counting_factory(url, key):
+        built.append(url)
+        return FakeSupabase(url, key)
+
+    clients = SupabaseClients(counting_factory)
+    seen = []
+
+    def worker():
+        gate.wait()
+        seen.append(clients.get("http://a", "k"))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(built) == 1
+    assert all(c is seen[0] for c in seen)
+
+
+def test_forked_child_builds_its_own_client():
+    clients = SupabaseClients(FakeSupabase)
+    parent = clients.get("http://a", "k")
+    clients._pid = -1   # as if this process were a fork of another one
+    assert clients.get("http://a", "k") is not parent
+    assert clients.stats["created"] == 2
+
+
+def test_factory_swap_reaches_the_callers():
+    tables = {
+        "user_model_params": [{"user_id": "u1", "Gb": 100.0}, {"user_id": "u2", "Gb": 110.0}],
+        "medication": [{"user_id": "u1", "med_class": "metformin", "isActive": True},
+                       {"user_id": "u2", "med_class": "insulin", "isActive": False}],
+    }
+    set_client_factory(lambda url, key: FakeSupabase(url, key, tables))
+    try:
+        rows, med_classes = fetch_population_rows("http://fake", "key")
+        assert [r["user_id"] for r in rows] == ["u1", "u2"]
+        assert med_classes == {"u1": ["metformin"], "u2": []}
+    finally:
+        set_client_factory(None)
+    assert not get_clients()._clients
@@ -0,0 +1,44 @@
+from ai.training.sweep import _fmt, rank_configs
+
+
+def _trial(trial_id, config, status="ok", **metrics):
+    row = {"trial_id": trial_id, "config": config, "status": status, "seconds": 1.0,
+           "val_mae": None, "val_rmse": None, "hit_rate": None, "val_loss_fixed": None, "val_loss": None}
+    row.update(metrics)
+    return row
+
+
+def test_ranks_on_fixed_lambda_metrics_not_own_val_loss():
+    rows = rank_configs([
+        # a config that shrinks its own lambdas gets a tiny val_loss but must not win on it
+        _trial("a", {"lr": 1}, val_mae=10.0, val_loss_fixed=5.0, val_loss=0.01, hit_rate=0.5),
+        _trial("b", {"lr": 2}, val_mae=10.0, val_loss_fixed=3.0, val_loss=9.0,  hit_rate=0.5),
+        _trial("c", {"lr": 3}, val_mae=8.0,  val_loss_fixed=9.0, val_loss=9.0,  hit_rate=0.1),
+    ])
+    assert [r["config"]["lr"] for r in rows] == [3, 2, 1]
+    assert [r["rank"] for r in rows] == [1, 2, 3]
+
+
+def test_missing_metrics_and_failures_sort_last():
+    rows = rank_configs([
+        _trial("empty", {"lr": 1}),
+        _trial("failed", {"lr": 2}, status="error", error="boom"),
+        _trial("scored", {"lr": 3}, val_mae=20.0, val_loss_fixed=50.0, hit_rate=0.0),
+        _trial("loss_only", {"lr": 4}, val_loss_fixed=1.0),
+    ])
+    assert [r["config"]["lr"] for r in rows] == [3, 4, 1, 2]
+
+
+def test_averages_over_datasets():
+    rows = rank_configs([
+        _trial("a0", {"lr": 1}, val_mae=4.0, val_loss_fixed=1.0),
+        _trial("a1", {"lr": 1}, val_mae=None, val_loss_fixed=3.0),
+    ])
+    assert rows[0]["n_trials"] == 2
+    assert rows[0]["val_mae"] == 4.0
+    assert rows[0]["val_loss_fixed"] == 2.0
+
+
+def test_fmt_handles_missing_values():
+    assert _fmt(None) == "n/a"
+    assert _fmt(1.23456) == "1.2346"
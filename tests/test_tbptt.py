@@ -0,0 +1,73 @@
+import torch
+
+from ai.models.user.parameters import UserParams
+from ai.simulation._run_glucose_simulation import run_glucose_simulation
+from ai.simulation.batch_simulation import simulate_meal_batch
+
+
+def _graph_size(t: torch.Tensor) -> int:
+    # autograd nodes behind the last chain state (skips the output torch.cat, which links every state)
+    seen, stack = set(), [t.grad_fn]
+    while stack and type(stack[-1]).__name__ in ("SelectBackward0", "CatBackward0"):
+        stack = [stack.pop().next_functions[-1][0]]
+    while stack:
+        fn = stack.pop()
+        if fn is None or fn in seen:
+            continue
+        seen.add(fn)
+        stack.extend(next_fn for next_fn, _ in fn.next_functions)
+    return len(seen)
+
+
+def _batch_grads(batch, tbptt_steps):
+    params = UserParams()
+    simulate_meal_batch(batch, params, tbptt_steps=tbptt_steps).sum().backward()
+    return params
+
+
+def test_batch_tbptt_keeps_forward_and_gb_gradient(meal_batch):
+    params = UserParams()
+    full = simulate_meal_batch(meal_batch, params)
+    cut  = simulate_meal_batch(meal_batch, params, tbptt_steps=5)
+    assert torch.allclose(full, cut)
+
+    B, T = full.shape
+    full_p, cut_p = _batch_grads(meal_batch, None), _batch_grads(meal_batch, 5)
+    # Gb is every meal's starting state: one unit of gradient per predicted step, with or without TBPTT
+    assert full_p.Gb.grad.item() == B * T
+    assert cut_p.Gb.grad.item() == B * T
+    # the ΔG terms lose the cross-chunk paths only
+    assert cut_p.beta1.grad.abs() < full_p.beta1.grad.abs()
+    assert cut_p.beta1.grad.abs() > 0
+
+
+def test_batch_tbptt_gb_gradient_inside_first_chunk(meal_batch):
+    params = UserParams()
+    G = simulate_meal_batch(meal_batch, params, tbptt_steps=5)
+    G[:, 3].sum().backward()
+    assert params.Gb.grad.item() == len(meal_batch)
+
+
+def test_chain_tbptt_bounds_graph_and_gradient(meal_chain):
+    meals, windows = meal_chain["meal_features"], meal_chain["sensor_windows"]
+    n = len(meals)
+    torch.manual_seed(0)
+    params = UserParams()
+    full = run_glucose_simulation(meals, windows, params)
+    cut  = run_glucose_simulation(meals, windows, params, tbptt_steps=3)
+    assert full.shape == cut.shape == (n,)
+
+    # the last state's graph reaches back over the whole history without TBPTT, 3 meals with it
+    assert _graph_size(cut[-1]) < _graph_size(full[-1]) / 2
+    longer = run_glucose_simulation(meals * 2, windows * 2, params, tbptt_steps=3)
+    assert _graph_size(longer[-1]) == _graph_size(cut[-1])
+
+    def gb_grad(output: torch.Tensor) -> float:
+        params.zero_grad()
+        output.backward()
+        return params.Gb.grad.item()
+
+    # Gb is the chain's initial state: every prediction without TBPTT, only the first chunk with it
+    assert gb_grad(run_glucose_simulation(meals, windows, params).sum()) == n
+    assert gb_grad(run_glucose_simulation(meals, windows, params, tbptt_steps=3).sum()) == 3
+    assert gb_grad(run_glucose_simulation(meals, windows, params, tbptt_steps=3)[-1]) == 0
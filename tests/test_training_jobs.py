@@ -0,0 +1,96 @@
+import json
+import sqlite3
+import time
+
+import pytest
+
+import ai.training.train as train_mod
+from ai.models.user.parameters import UserParams
+from api.training_jobs import DONE, QUEUED, RUNNING, TrainingJobQueue, _run_job
+
+CREDS = {"supabase_url": "https://example.supabase.co", "supabase_key": "secret-key"}
+
+
+@pytest.fixture
+def queue(tmp_path):
+    # dispatcher stopped before anything is queued, so jobs stay rows and never start a worker
+    q = TrainingJobQueue(str(tmp_path / "jobs.db"), max_workers=1)
+    q.shutdown()
+    return q
+
+
+def _raw_kwargs(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return [row[0] for row in conn.execute("SELECT kwargs FROM training_jobs")]
+
+
+def test_submit_never_persists_credentials(queue):
+    job = queue.submit("u1", {"days_since_start": 3, **CREDS})
+    assert job["kwargs"] == {"days_since_start": 3}
+    assert all("secret-key" not in raw for raw in _raw_kwargs(queue.db_path))
+
+
+def test_live_job_coalesces_and_takes_newer_kwargs(queue):
+    first = queue.submit("u1", {"seed": 1})
+    second = queue.submit("u1", {"seed": 2})
+    assert not first["coalesced"] and second["coalesced"]
+    assert second["job_id"] == first["job_id"]
+    assert queue.get(first["job_id"])["kwargs"] == {"seed": 2}
+    assert queue.submit("u2", {})["job_id"] != first["job_id"]
+
+
+def test_claim_and_requeue_orphans(queue):
+    job = queue.submit("u1", {})
+    claimed = queue._claim_next()
+    assert claimed["job_id"] == job["job_id"]
+    row = queue.get(job["job_id"])
+    assert row["status"] == RUNNING and row["owner"] == queue.owner
+    # our own running job is never an orphan
+    assert queue.requeue_orphans() == []
+
+    with sqlite3.connect(queue.db_path) as conn:
+        conn.execute("UPDATE training_jobs SET owner = 'elsewhere:boot:1', heartbeat_at = ?",
+                     (time.time() - 10_000,))
+    assert queue.requeue_orphans() == [job["job_id"]]
+    row = queue.get(job["job_id"])
+    assert row["status"] == QUEUED and row["owner"] is None
+
+
+def test_opening_an_old_file_migrates_and_scrubs_credentials(tmp_path):
+    db_path = str(tmp_path / "jobs.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE training_jobs (job_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, "
+                     "status TEXT NOT NULL, kwargs TEXT NOT NULL, progress TEXT, result TEXT, error TEXT, "
+                     "created_at REAL NOT NULL, started_at REAL, finished_at REAL)")
+        conn.execute("INSERT INTO training_jobs VALUES ('j1', 'u1', 'done', ?, NULL, NULL, NULL, 0, NULL, NULL)",
+                     (json.dumps({"seed": 4, **CREDS}),))
+    q = TrainingJobQueue(db_path, max_workers=1)
+    q.shutdown()
+    job = q.get("j1")
+    assert job["kwargs"] == {"seed": 4}
+    assert "owner" in job and "heartbeat_at" in job
+
+
+def test_worker_reads_credentials_from_environment(queue, monkeypatch):
+    seen = {}
+
+    def fake_train(user_id, progress_callback, **kwargs):
+        seen.update(kwargs)
+        progress_callback({"epoch": 1, "epochs": 1})
+        return UserParams()
+
+    monkeypatch.setattr(train_mod, "train_user_model", fake_train)
+    monkeypatch.setattr(train_mod, "PARAMS_UPLOADED_HOOKS", [])
+    monkeypatch.setenv("EXPO_PUBLIC_SUPABASE_URL", CREDS["supabase_url"])
+    monkeypatch.setenv("EXPO_PUBLIC_SUPABASE_KEY", CREDS["supabase_key"])
+
+    job = queue.submit("u1", {"phase_epochs": {"1": 5}})
+    assert _run_job(queue.db_path, job["job_id"], "u1", queue.get(job["job_id"])["kwargs"]) == DONE
+    assert seen["supabase_url"] == CREDS["supabase_url"]
+    assert seen["supabase_key"] == CREDS["supabase_key"]
+    assert seen["phase_epochs"] == {1: 5}
+
+    row = queue.get(job["job_id"])
+    assert row["status"] == DONE and "learnedParams" in row["result"]
+    assert row["progress"] == {"epoch": 1, "epochs": 1}
+    assert all("secret-key" not in raw for raw in _raw_kwargs(queue.db_path))
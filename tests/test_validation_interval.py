@@ -0,0 +1,43 @@
+import json
+
+import pytest
+import torch
+
+from ai.models.user.parameters import UserParams
+from ai.training.train import train_user_model
+
+
+def _train(user_db, out, **kwargs):
+    train_user_model("u1", db_path=user_db, checkpoint_dir=str(out), upload_to_supabase=False,
+                     phase_epochs={1: 7, 2: 2, 3: 2}, checkpoint_interval_s=None, **kwargs)
+    return json.loads((out / "u1" / "loss_history.json").read_text())
+
+
+def test_validates_every_interval_and_on_the_last_epoch(user_db, tmp_path):
+    history = _train(user_db, tmp_path, val_interval=3)
+    assert history["phase1"]["val_epochs"] == [3, 6, 7]
+    assert len(history["phase1"]["val"]) == 3
+    assert len(history["phase1"]["train"]) == 7
+    assert history["phase2"]["val_epochs"] == [2]
+
+
+def test_background_validation_matches_inline(user_db, tmp_path, monkeypatch):
+    # the simulation noise comes from the global RNG, which the validation thread draws from concurrently
+    init = UserParams.__init__
+    def noiseless_init(self):
+        init(self)
+        self.sigma = torch.tensor(0.0)
+    monkeypatch.setattr(UserParams, "__init__", noiseless_init)
+    inline = _train(user_db, tmp_path / "inline", val_interval=2)
+    background = _train(user_db, tmp_path / "background", val_interval=2, async_validation=True)
+    for phase in ("phase1", "phase2", "phase3"):
+        assert background[phase]["val_epochs"] == inline[phase]["val_epochs"]
+        assert background[phase]["val"] == pytest.approx(inline[phase]["val"])
+        assert background[phase]["best_val"] == pytest.approx(inline[phase]["best_val"])
+    # the best checkpoint is the snapshot that was validated, not the params at the end of the phase
+    for phase in (1, 2, 3):
+        a = torch.load(tmp_path / "inline" / "u1" / f"phase{phase}_best.pt")
+        b = torch.load(tmp_path / "background" / "u1" / f"phase{phase}_best.pt")
+        assert b["epoch"] == a["epoch"]
+        for name, value in a["params"].items():
+            assert torch.allclose(b["params"][name], value)
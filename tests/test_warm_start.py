@@ -0,0 +1,44 @@
+import json
+
+import pytest
+import torch
+
+import ai.training.train as train_mod
+from ai.training.train import FINE_TUNE_PHASE, load_warm_start, train_user_model
+
+EPOCHS = {1: 2, 2: 2, 3: 2}
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    calls = []
+    monkeypatch.setattr(train_mod, "upload_params_to_supabase", lambda **kw: calls.append(kw))
+    return calls
+
+
+def _train(user_db, ckpt, **kw):
+    return train_user_model("u1", db_path=user_db, checkpoint_dir=str(ckpt), phase_epochs=EPOCHS,
+                            checkpoint_interval_s=None, **kw)
+
+
+def test_fine_tune_resumes_saved_params_and_uploads_its_phase(user_db, tmp_path, uploads):
+    first = _train(user_db, tmp_path)
+    assert [c["training_phase"] for c in uploads] == [3]
+
+    warm, source = load_warm_start("u1", tmp_path / "u1", None, None)
+    assert source.endswith("final_params.pt")
+    for name, value in first.state_dict().items():
+        assert torch.equal(warm.state_dict()[name], value)
+
+    _train(user_db, tmp_path, fine_tune=True, fine_tune_epochs=2)
+    # days_since_start=0 would start at phase 1; the fine-tune run trains (and reports) phase 3 only
+    assert uploads[-1]["training_phase"] == FINE_TUNE_PHASE
+    history = json.loads((tmp_path / "u1" / "loss_history.json").read_text())
+    assert list(history) == [f"finetune_phase{FINE_TUNE_PHASE}"]
+
+
+def test_fine_tune_without_saved_params_runs_full_training(user_db, tmp_path, uploads):
+    _train(user_db, tmp_path, fine_tune=True, days_since_start=5)
+    history = json.loads((tmp_path / "u1" / "loss_history.json").read_text())
+    assert list(history) == ["phase2", "phase3"]
+    assert uploads[-1]["training_phase"] == 3